@@ -0,0 +1,254 @@
+"""Offline end-to-end benchmark suite
+
+Usage: python benchmarks/bench_suite.py [--concurrency C] [--requests N] [--queries Q]
+                                        [--vector-backend chroma|flat] [--output FILE]
+                                        [--chat-latency-ms MS] [--token-latency-ms MS]
+                                        [--embedding-latency-ms MS] [--answer-tokens N] [--dim D]
+
+Starts benchmarks/fake_openai.py in-process, points the backend at it and, in a
+scratch working directory, measures:
+
+  ingest      add_security_knowledge_base over src/data/knowledge_base, then an
+              incremental re-run with nothing changed
+  retrieval   query_documents latency, cold (query embedding requested) and warm
+  topic_gate  check_topic_access latency
+  chat        login, /api/chat, /api/quiz/<id> and /api/quiz round trips from
+              C concurrent clients against the Flask app on a local port
+
+No OpenAI key or network access is needed. Results are printed as JSON and
+written to --output if given.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ROOT_DIR, "src", "backend")
+KNOWLEDGE_BASE_DIR = os.path.join(ROOT_DIR, "src", "data", "knowledge_base")
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+import fake_openai  # noqa: E402
+
+# Rank-1 questions, so a fresh user is never refused
+QUERIES = [
+    "What is phishing and how do I spot a fake email?",
+    "How do I create a strong password?",
+    "What should I do if I clicked a suspicious link?",
+    "How does malware like ransomware get onto a computer?",
+    "What is social engineering?",
+    "Give me some security basics for working from home",
+    "How can I recognise a scam phone call?",
+    "What are the fundamentals of protecting my accounts?",
+]
+
+
+def percentiles(samples):
+    """Summarize latencies in seconds as milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1e3, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1e3, 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def unique_queries(n):
+    """Distinct queries, so neither the embedding nor the response cache hides the work"""
+    return [f"{QUERIES[i % len(QUERIES)]} (question {i})" for i in range(n)]
+
+
+def bench_ingest(retriever_class):
+    retriever = retriever_class(db_directory="./data/chroma_db")
+    seconds, _ = timed(retriever.add_security_knowledge_base, KNOWLEDGE_BASE_DIR, incremental=True)
+    chunks = retriever.collection.count()
+    resync_seconds, _ = timed(retriever.add_security_knowledge_base, KNOWLEDGE_BASE_DIR, incremental=True)
+    return retriever, {
+        "documents": len([name for name in os.listdir(KNOWLEDGE_BASE_DIR) if name.endswith((".txt", ".md"))]),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 1) if seconds else None,
+        "unchanged_resync_seconds": round(resync_seconds, 3),
+    }
+
+
+def bench_retrieval(retriever, n_queries):
+    queries = unique_queries(n_queries)
+    cold = [timed(retriever.query_documents, query)[0] for query in queries]
+    warm = [timed(retriever.query_documents, query)[0] for query in queries]
+    return {"cold": percentiles(cold), "warm": percentiles(warm)}
+
+
+def bench_topic_gate(chatbot, iterations=2000):
+    queries = unique_queries(len(QUERIES))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in queries:
+            chatbot.check_topic_access(query, 1)
+    return {"mean_us": round((time.perf_counter() - start) / (iterations * len(queries)) * 1e6, 3)}
+
+
+class Client:
+    """One user with its own session cookie"""
+
+    def __init__(self, base_url, user_id):
+        self.base_url = base_url
+        self.user_id = user_id
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def call(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = Request(self.base_url + path, data=data, method=method,
+                          headers={"Content-Type": "application/json"})
+        with self.opener.open(request, timeout=120) as response:
+            return response.status, json.loads(response.read() or b"null")
+
+
+def bench_chat(app, concurrency, n_requests):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-flask", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/api"
+
+    clients = [Client(base_url, f"bench-user-{i}") for i in range(concurrency)]
+    for client in clients:
+        client.call("POST", "/login", {"user_id": client.user_id})
+
+    queries = unique_queries(n_requests)
+    stages = {"chat": [], "quiz_fetch": [], "quiz_answer": [], "round_trip": []}
+    errors = []
+    lock = threading.Lock()
+
+    def round_trip(i):
+        client = clients[i % concurrency]
+        try:
+            start = time.perf_counter()
+            chat_seconds, (_, chat) = timed(client.call, "POST", "/chat", {"query": queries[i]})
+            fetch_seconds, (status, quiz) = timed(client.call, "GET", f"/quiz/{chat['quiz_id']}?wait=30")
+            if status != 200:
+                raise RuntimeError(f"quiz not ready: {status}")
+            answer_seconds, _ = timed(client.call, "POST", "/quiz", {"quiz_id": chat["quiz_id"], "answer": "b)"})
+            total = time.perf_counter() - start
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            stages["chat"].append(chat_seconds)
+            stages["quiz_fetch"].append(fetch_seconds)
+            stages["quiz_answer"].append(answer_seconds)
+            stages["round_trip"].append(total)
+
+    # Each client runs its requests one after another, like a user in a chat window
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(round_trip, range(n_requests)))
+    wall = time.perf_counter() - start
+    server.shutdown()
+
+    report = {stage: percentiles(samples) for stage, samples in stages.items()}
+    report.update({
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": len(errors),
+        "wall_seconds": round(wall, 3),
+        "round_trips_per_second": round(len(stages["round_trip"]) / wall, 2) if wall else None,
+    })
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def run(args):
+    server, api_base = fake_openai.start(**fake_openai.latency_options(args))
+
+    # Everything the backend writes goes to a scratch directory; environment
+    # variables must be set before the backend modules read their config
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    os.chdir(workdir)
+    os.environ.update({
+        "OPENAI_API_BASE": api_base,
+        "OPENAI_API_KEY": "sk-offline-benchmark",
+        "VECTOR_BACKEND": args.vector_backend,
+        "USER_DB_PATH": os.path.join(workdir, "data", "users.sqlite3"),
+        "EMBEDDING_PROVIDER": "openai",
+    })
+
+    import openai
+    openai.api_base = api_base
+
+    from retriever import DocumentRetriever
+    from chatbot import SecurityChatbot
+
+    report = {
+        "settings": {
+            "vector_backend": args.vector_backend,
+            "chat_latency_ms": args.chat_latency_ms,
+            "token_latency_ms": args.token_latency_ms,
+            "embedding_latency_ms": args.embedding_latency_ms,
+            "answer_tokens": args.answer_tokens,
+            "dim": args.dim,
+        }
+    }
+
+    retriever, report["ingest"] = bench_ingest(DocumentRetriever)
+    report["retrieval"] = bench_retrieval(retriever, args.queries)
+    report["topic_gate"] = bench_topic_gate(SecurityChatbot(retriever))
+
+    # Imported last: app.py opens the index that bench_ingest just built
+    import app as flask_app
+    openai.api_key = "sk-offline-benchmark"
+    report["chat"] = bench_chat(flask_app.app, args.concurrency, args.requests)
+
+    report["fake_openai"] = dict(server.fake.counters)
+    server.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--vector-backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--output")
+    fake_openai.add_latency_arguments(parser)
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
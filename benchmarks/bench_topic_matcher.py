@@ -0,0 +1,90 @@
+"""Micro-benchmark: compiled TopicMatcher vs. the per-keyword substring scan
+
+Usage: python benchmarks/bench_topic_matcher.py [--topics N] [--keywords K] [--iterations I]
+
+Runs both classifiers over a set of sample queries against config.TOPICS and
+against a synthetic table of N topics with K keywords each, and prints the
+mean time per query in microseconds as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "backend"))
+
+from config import TOPICS  # noqa: E402
+from topics import TopicMatcher  # noqa: E402
+
+QUERIES = [
+    "what is phishing",
+    "How do I make a strong password for my bank login?",
+    "Explain how a VPN and a firewall protect my home network",
+    "What should we do after a data breach is detected?",
+    "Describe defense in depth in a zero trust architecture",
+    "Is it safe to click a suspicious link in a fake email from my boss?",
+    "How do penetration testing teams report findings under PCI and HIPAA?",
+    "tell me a joke",
+]
+
+
+def linear_scan(topics, query):
+    """The original classifier: every keyword of every topic is tested with `in`"""
+    query_lower = query.lower()
+    detected_topics = []
+    for topic, details in topics.items():
+        if any(keyword in query_lower for keyword in details["keywords"]):
+            detected_topics.append(topic)
+    required_rank = max((topics[topic]["rank"] for topic in detected_topics), default=1)
+    return detected_topics, required_rank
+
+
+def synthetic_topics(n_topics, n_keywords):
+    """Build a topic table of the requested size on top of config.TOPICS"""
+    topics = dict(TOPICS)
+    for t in range(n_topics):
+        topics[f"synthetic_topic_{t}"] = {
+            "rank": t % 5 + 1,
+            "keywords": [f"synthetic term {t} {k}" for k in range(n_keywords)],
+        }
+    return topics
+
+
+def time_per_query(classify, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in QUERIES:
+            classify(query)
+    return (time.perf_counter() - start) / (iterations * len(QUERIES)) * 1e6
+
+
+def run(n_topics, n_keywords, iterations):
+    results = {}
+    for name, topics in (("config", TOPICS), ("synthetic", synthetic_topics(n_topics, n_keywords))):
+        start = time.perf_counter()
+        matcher = TopicMatcher(topics)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        results[name] = {
+            "topics": len(topics),
+            "keywords": sum(len(details["keywords"]) for details in topics.values()),
+            "compile_ms": round(build_ms, 3),
+            "linear_scan_us": round(time_per_query(lambda q: linear_scan(topics, q), iterations), 3),
+            "compiled_us": round(time_per_query(matcher.match, iterations), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--keywords", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.topics, args.keywords, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark: memory-mapped FlatVectorStore vs. a persistent Chroma collection
+
+Usage: python benchmarks/bench_vector_index.py [--chunks N] [--dim D] [--queries Q]
+                                               [--k K] [--dtype float32|float16]
+                                               [--backends chroma,flat]
+
+Writes N random unit vectors of dimension D (1536 matches ada-002) to both
+backends in a temporary directory, then reports as JSON: build time, cold
+open time (open plus first query), query latency p50/p99 in milliseconds,
+and for Chroma its recall@K against the exact results of the flat index.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "backend"))
+
+from vector_store import FlatVectorStore  # noqa: E402
+
+BATCH_SIZE = 64
+
+
+def percentile(samples, q):
+    return round(float(np.percentile(samples, q)) * 1e3, 3)
+
+
+def build(backend, directory, ids, documents, vectors, metadatas, dtype):
+    start = time.perf_counter()
+    collection = open_backend(backend, directory, dtype)
+    # Same batch size as ingestion, so the flat store's rewrite-per-write cost shows up
+    for i in range(0, len(ids), BATCH_SIZE):
+        collection.upsert(
+            ids=ids[i:i + BATCH_SIZE],
+            documents=documents[i:i + BATCH_SIZE],
+            embeddings=vectors[i:i + BATCH_SIZE].tolist(),
+            metadatas=metadatas[i:i + BATCH_SIZE]
+        )
+    return time.perf_counter() - start
+
+
+def open_backend(backend, directory, dtype):
+    if backend == "flat":
+        return FlatVectorStore(directory, dtype=dtype)
+
+    import chromadb
+    client = chromadb.PersistentClient(path=directory)
+    return client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+
+
+def run_backend(backend, directory, data, queries, k, dtype):
+    ids, documents, vectors, metadatas = data
+    build_seconds = build(backend, directory, ids, documents, vectors, metadatas, dtype)
+
+    start = time.perf_counter()
+    collection = open_backend(backend, directory, dtype)
+    first = collection.query(query_embeddings=[queries[0].tolist()], n_results=k)
+    cold_open_seconds = time.perf_counter() - start
+
+    latencies = []
+    results = [first["ids"][0]]
+    for query in queries[1:]:
+        start = time.perf_counter()
+        hits = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - start)
+        results.append(hits["ids"][0])
+
+    return {
+        "build_s": round(build_seconds, 3),
+        "cold_open_ms": round(cold_open_seconds * 1e3, 3),
+        "query_p50_ms": percentile(latencies, 50),
+        "query_p99_ms": percentile(latencies, 99),
+    }, results
+
+
+def run(n_chunks, dim, n_queries, k, dtype, backends):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n_chunks, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk_{i}" for i in range(n_chunks)]
+    documents = [f"chunk text {i} " * 50 for i in range(n_chunks)]
+    metadatas = [{"source": f"doc_{i % 3}.txt", "chunk": i} for i in range(n_chunks)]
+    # Queries near stored chunks, like real questions near their answers
+    queries = vectors[rng.integers(0, n_chunks, n_queries + 1)] \
+        + 0.5 * rng.standard_normal((n_queries + 1, dim), dtype=np.float32) / np.sqrt(dim)
+
+    report = {"chunks": n_chunks, "dim": dim, "queries": n_queries, "k": k, "dtype": dtype}
+    ranked = {}
+    root = tempfile.mkdtemp(prefix="bench_vector_index_")
+    try:
+        for backend in backends:
+            report[backend], ranked[backend] = run_backend(
+                backend, os.path.join(root, backend), (ids, documents, vectors, metadatas), queries, k, dtype
+            )
+            report[backend]["disk_mb"] = round(sum(
+                os.path.getsize(os.path.join(path, name))
+                for path, _, names in os.walk(os.path.join(root, backend)) for name in names
+            ) / 1e6, 2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if "chroma" in ranked and "flat" in ranked:
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(ranked["chroma"], ranked["flat"])]
+        report["chroma"]["recall_at_k"] = round(float(np.mean(overlap)), 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--backends", default="chroma,flat")
+    args = parser.parse_args()
+
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    print(json.dumps(run(args.chunks, args.dim, args.queries, args.k, args.dtype, backends), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""OpenAI-compatible stand-in server for offline benchmarks
+
+Usage: python benchmarks/fake_openai.py [--port P] [--chat-latency-ms MS] [--token-latency-ms MS]
+                                        [--embedding-latency-ms MS] [--answer-tokens N] [--dim D]
+
+Implements the two endpoints the backend calls through the openai 0.28 client:
+
+  POST /v1/embeddings        deterministic feature-hashed bag-of-words vectors,
+                             so similar texts get similar embeddings
+  POST /v1/chat/completions  canned answers (a multiple-choice question for quiz
+                             prompts), streamed as server-sent events with
+                             "stream": true
+
+Chat latency is modelled as time to first token plus a delay per token.
+GET /stats returns request counters. Point the backend at the server with
+OPENAI_API_BASE=http://127.0.0.1:<port>/v1.
+"""
+import argparse
+import json
+import math
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+ANSWER_WORDS = (
+    "Use strong unique passwords, enable multi-factor authentication, keep software updated, "
+    "be careful with links and attachments in unexpected emails, and report anything suspicious "
+    "to your security team."
+).split()
+
+QUIZ = (
+    "Question: Which practice best protects an account from password reuse attacks?\n"
+    "Options:\na) Writing passwords down\nb) Using a unique password per site\n"
+    "c) Changing passwords every day\nd) Sharing passwords with IT\nAnswer: b)"
+)
+
+
+def fake_embedding(text, dim):
+    """Hash every word (and word pair) into one of ``dim`` signed buckets, then L2-normalize"""
+    vector = [0.0] * dim
+    words = WORD_PATTERN.findall(text.lower())
+    for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode('utf-8'))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAI:
+    """Behaviour and counters shared by all request handlers"""
+
+    def __init__(self, chat_latency=0.4, token_latency=0.015, embedding_latency=0.05, answer_tokens=120,
+                 dim=1536):
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.embedding_latency = embedding_latency
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        self.counters = {"embeddings": 0, "embedded_texts": 0, "chat": 0, "chat_stream": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def answer_for(self, messages):
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system").lower()
+        if "quiz" in system:
+            return QUIZ.split(" ")
+        if "summary" in system:
+            return "The user asked about account and email security basics.".split(" ")
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(self.answer_tokens)]
+        return words
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with fake._lock:
+                    self._send_json(200, dict(fake.counters))
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.endswith("/embeddings"):
+                self._embeddings(request)
+            elif self.path.endswith("/chat/completions"):
+                self._chat(request)
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def _embeddings(self, request):
+            texts = request["input"]
+            if isinstance(texts, str):
+                texts = [texts]
+            fake.count("embeddings")
+            fake.count("embedded_texts", len(texts))
+            time.sleep(fake.embedding_latency)
+            self._send_json(200, {
+                "object": "list",
+                "model": request.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text, fake.dim)}
+                         for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": sum(map(count_tokens, texts)),
+                          "total_tokens": sum(map(count_tokens, texts))},
+            })
+
+        def _chat(self, request):
+            messages = request.get("messages", [])
+            words = fake.answer_for(messages)
+            prompt_tokens = sum(count_tokens(m.get("content", "")) for m in messages)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+            if not request.get("stream"):
+                fake.count("chat")
+                time.sleep(fake.chat_latency + fake.token_latency * len(words))
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": " ".join(words)}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                              "total_tokens": prompt_tokens + len(words)},
+                })
+                return
+
+            fake.count("chat_stream")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(fake.chat_latency)
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model"),
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": word if i == 0 else " " + word}}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(fake.token_latency)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start(host="127.0.0.1", port=0, **options):
+    """Start the server in a background thread; returns (server, base URL for OPENAI_API_BASE)"""
+    fake = FakeOpenAI(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+def add_latency_arguments(parser):
+    parser.add_argument("--chat-latency-ms", type=float, default=400, help="time to first token")
+    parser.add_argument("--token-latency-ms", type=float, default=15, help="delay per generated token")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="delay per embeddings request")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+
+
+def latency_options(args):
+    return {
+        "chat_latency": args.chat_latency_ms / 1e3,
+        "token_latency": args.token_latency_ms / 1e3,
+        "embedding_latency": args.embedding_latency_ms / 1e3,
+        "answer_tokens": args.answer_tokens,
+        "dim": args.dim,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start(args.host, args.port, **latency_options(args))
+    print(f"Fake OpenAI API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -206,18 +206,24 @@ def main():
             
             retriever_instance = DocumentRetriever(db_directory=DB_DIRECTORY)
             
-            if retriever_instance.collection.count() == 0:
-                setup_logger.info(f"Knowledge base (ChromaDB collection '{retriever_instance.collection.name}' in '{os.path.abspath(DB_DIRECTORY)}') is empty.")
-                setup_logger.info(f"Populating with documents from: {os.path.abspath(KNOWLEDGE_BASE_DIR)}...")
-                
-                if retriever_instance.add_security_knowledge_base(knowledge_dir=KNOWLEDGE_BASE_DIR):
-                    setup_logger.info("Knowledge base populated successfully.")
-                else:
-                    setup_logger.warning(f"Knowledge base population from '{os.path.abspath(KNOWLEDGE_BASE_DIR)}' did not add documents.")
-                    setup_logger.warning("Ensure the directory exists, is accessible, and contains .txt or .md files.")
+            setup_logger.info(f"Knowledge base (ChromaDB collection '{retriever_instance.collection.name}' in '{os.path.abspath(DB_DIRECTORY)}') contains {retriever_instance.collection.count()} documents.")
+            setup_logger.info(f"Syncing with documents from: {os.path.abspath(KNOWLEDGE_BASE_DIR)} (only changed chunks are embedded)...")
+
+            if retriever_instance.add_security_knowledge_base(knowledge_dir=KNOWLEDGE_BASE_DIR, incremental=True):
+                setup_logger.info(f"Knowledge base synced successfully ({retriever_instance.collection.count()} documents).")
             else:
-                setup_logger.info(f"Knowledge base (ChromaDB collection '{retriever_instance.collection.name}') already contains {retriever_instance.collection.count()} documents.")
-                setup_logger.info("Skipping population to avoid duplicates.")
+                setup_logger.warning(f"Knowledge base sync from '{os.path.abspath(KNOWLEDGE_BASE_DIR)}' did not add documents.")
+                setup_logger.warning("Ensure the directory exists, is accessible, and contains .txt or .md files.")
+
+            # --- Step 9: Write follow-up quizzes for new and changed chunks ---
+            from backend.config import QUIZ_BANK
+            if QUIZ_BANK:
+                setup_logger.info("Step 9: Syncing the quiz bank (only new and changed chunks get questions written)...")
+                from backend.quiz_bank import build_quiz_bank
+                written, removed, failed = build_quiz_bank(retriever_instance)
+                setup_logger.info(f"Quiz bank synced: questions written for {written} chunks, {removed} chunks removed.")
+                if failed:
+                    setup_logger.warning(f"Questions for {failed} chunks could not be written; re-run setup to retry them.")
 
         except ValueError as e: 
             setup_logger.error(f"Error during DocumentRetriever initialization or use: {e}")
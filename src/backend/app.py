@@ -1,11 +1,17 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context, g
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv
 import json
-from models import User
-from chatbot import SecurityChatbot
-from retriever import DocumentRetriever
+from user_store import UserStore
+from services import Services, ServicesUnavailable
+from llm_scheduler import LLMUnavailable, RETRY_AFTER_SECONDS
+from quiz_jobs import QuizJobs
+from quiz_bank import public_quiz, format_quiz, check_answer, correct_option, parse_generated_quiz
+from metrics import REGISTRY, CONTENT_TYPE, REQUEST_SECONDS
+from config import (QUIZ_WORKERS, QUIZ_TTL, QUIZ_MAX_WAIT, USER_DB_PATH, USER_CACHE_TTL, HISTORY_BATCH_SIZE,
+                    HISTORY_FLUSH_INTERVAL, WARMUP_ON_START)
 
 # Load environment variables
 load_dotenv(dotenv_path="config/.env", override=True)
@@ -18,20 +24,83 @@ CORS(app,
      methods=["GET", "POST", "OPTIONS"],
      allow_headers=["Content-Type"])
 
-# Initialize retriever and chatbot
-retriever = DocumentRetriever()
-chatbot = SecurityChatbot(retriever)
+# Users are kept in SQLite so every worker process sees the same data
+users = UserStore(USER_DB_PATH, cache_ttl=USER_CACHE_TTL, history_batch_size=HISTORY_BATCH_SIZE,
+                  flush_interval=HISTORY_FLUSH_INTERVAL)
 
-# In-memory user storage for prototype
-# In production, use a proper database
-users = {}
+# The retriever and chatbot are built on first use, or by the warmup thread
+services = Services(on_summary=users.save_summary)
+if WARMUP_ON_START:
+    services.start_warmup()
+
+
+def generate_quiz(answer):
+    return services.chatbot.generate_followup_question(answer)
+
+
+# Follow-up quizzes are generated off the chat critical path; jobs are recorded
+# in the user database so any worker process can answer the poll
+quiz_jobs = QuizJobs(generate_quiz, max_workers=QUIZ_WORKERS, ttl_seconds=QUIZ_TTL, store=users)
+
+
+def generated_quiz(quiz_id, user_id, wait=0):
+    """Return (status, quiz) of a quiz job, the quiz parsed into a stored quiz's shape
+
+    A generated quiz without a usable answer counts as failed.
+    """
+    status, text = quiz_jobs.result(quiz_id, user_id, wait=wait)
+    if status != "ready":
+        return status, None
+    quiz = parse_generated_quiz(quiz_id, text)
+    return ("ready", quiz) if quiz is not None else ("failed", None)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    # Labelled by route pattern, so /api/quiz/<quiz_id> is one series
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                            route=route, method=request.method, status=response.status_code)
+    return response
+
+
+@app.errorhandler(ServicesUnavailable)
+def services_unavailable(e):
+    return jsonify({"error": "Service not ready", "detail": str(e)}), 503
+
+
+@app.errorhandler(LLMUnavailable)
+def llm_unavailable(e):
+    return (jsonify({"error": "The assistant is busy, please try again shortly", "detail": str(e)}), 503,
+            {"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the index is loaded and chat requests will not pay the startup cost"""
+    services.start_warmup()
+    status = services.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 
 def get_current_user():
-    user_id = session.get('user_id')
-    if not user_id or user_id not in users:
-        return None
-    return users[user_id]
+    return users.get(session.get('user_id'))
 
 
 @app.route('/api/login', methods=['POST'])
@@ -43,13 +112,12 @@ def login():
         return jsonify({"error": "User ID is required"}), 400
     
     # Create user if doesn't exist
-    if user_id not in users:
-        users[user_id] = User(user_id)
+    user = users.get_or_create(user_id)
     
     session['user_id'] = user_id
     return jsonify({
         "message": "Login successful",
-        "user": users[user_id].to_dict()
+        "user": user.to_dict()
     })
 
 @app.route('/api/chat', methods=['POST'])
@@ -61,46 +129,177 @@ def chat():
     if not user:
         return jsonify({"error": "Not logged in"}), 401
 
+    chatbot = services.chatbot
     if not chatbot.check_topic_access(query, user.rank):
         return jsonify({"answer": "This topic is restricted based on your current rank.", "restricted": True})
 
-    answer = chatbot.generate_response(query, user.rank)
+    answer, hit_ids = chatbot.generate_response(query, user.rank, user)
+    users.record_interaction(user.user_id, query, answer)
+    chatbot.update_memory(user)
 
-    # Generate follow-up quiz
-    followup = chatbot.generate_followup_question(answer)
-
-    return jsonify({
+    response = {
         "answer": answer,
-        "followup_question": followup,
+        # Kept for older clients; the quiz is now fetched by quiz_id
+        "followup_question": None,
         "user": user.to_dict(),
         "restricted": False
-    })
+    }
+
+    # Take the follow-up quiz from the quiz bank if the retrieved chunks have one;
+    # otherwise generate it in the background and fetch it from /api/quiz/<quiz_id>
+    stored = chatbot.pick_quiz(hit_ids, user.rank)
+    if stored is not None:
+        users.record_served_quiz(user.user_id, stored["id"])
+        response["quiz_id"] = stored["id"]
+        response["quiz"] = public_quiz(stored)
+    else:
+        response["quiz_id"] = quiz_jobs.submit(user.user_id, answer)
+
+    return jsonify(response)
+
+@app.route('/api/quiz/<quiz_id>', methods=['GET'])
+def get_quiz(quiz_id):
+    """Return a follow-up quiz, long-polling up to ?wait= seconds until it is ready"""
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "Not logged in"}), 401
+
+    # Stored quizzes are only shown to users they were served to
+    stored = services.chatbot.get_stored_quiz(quiz_id)
+    if stored is not None and users.was_served_quiz(user.user_id, quiz_id):
+        return jsonify({"quiz_id": quiz_id, "status": "ready", "quiz": public_quiz(stored),
+                        "followup_question": format_quiz(stored)})
+
+    wait = min(max(request.args.get("wait", 0, type=float), 0), QUIZ_MAX_WAIT)
+    status, generated = generated_quiz(quiz_id, user.user_id, wait=wait)
+
+    if status == "missing":
+        return jsonify({"error": "Quiz not found"}), 404
+    if status == "failed":
+        return jsonify({"quiz_id": quiz_id, "status": status, "error": "Quiz generation failed"}), 500
+    if status == "pending":
+        return jsonify({"quiz_id": quiz_id, "status": status}), 202
+
+    # Like stored quizzes, generated ones are sent without their answer line
+    return jsonify({"quiz_id": quiz_id, "status": status, "quiz": public_quiz(generated),
+                    "followup_question": format_quiz(generated)})
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /api/chat using server-sent events
+
+    Emits "token" events with pieces of the answer as the model produces them,
+    then a "quiz" event with the follow-up ``quiz`` (or, if a generated one is
+    not ready within QUIZ_MAX_WAIT, its ``quiz_id`` and ``status`` to poll),
+    then "done". Failures after the headers are sent end the stream with an
+    "error" event.
+    """
+    data = request.get_json()
+    query = data.get("query")
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "Not logged in"}), 401
+
+    chatbot = services.chatbot
+
+    def answer_events():
+        if not chatbot.check_topic_access(query, user.rank):
+            yield sse_event("restricted", {"answer": "This topic is restricted based on your current rank.", "restricted": True})
+            return
+
+        parts = []
+        stream = chatbot.stream_response(query, user.rank, user)
+        hit_ids = next(stream)
+        for delta in stream:
+            parts.append(delta)
+            yield sse_event("token", {"text": delta})
+
+        answer = "".join(parts)
+        users.record_interaction(user.user_id, query, answer)
+        chatbot.update_memory(user)
+
+        stored = chatbot.pick_quiz(hit_ids, user.rank)
+        if stored is not None:
+            users.record_served_quiz(user.user_id, stored["id"])
+            yield sse_event("quiz", {"quiz": public_quiz(stored)})
+        else:
+            quiz_id = quiz_jobs.submit(user.user_id, answer)
+            status, generated = generated_quiz(quiz_id, user.user_id, wait=QUIZ_MAX_WAIT)
+            if generated is not None:
+                yield sse_event("quiz", {"quiz": public_quiz(generated)})
+            else:
+                yield sse_event("quiz", {"quiz_id": quiz_id, "status": status})
+        yield sse_event("done", {"user": user.to_dict(), "restricted": False})
+
+    def events():
+        # Headers are already sent, so failures are reported in the stream
+        try:
+            yield from answer_events()
+        except LLMUnavailable as e:
+            yield sse_event("error", {"error": "The assistant is busy, please try again shortly", "detail": str(e)})
+        except Exception:
+            app.logger.exception("Error streaming a chat answer")
+            yield sse_event("error", {"error": "Sorry, there was an error processing your request. Please try again."})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/api/quiz', methods=['POST'])
 def quiz():
     data = request.get_json()
     user_answer = data.get("answer", "").strip().lower()
-    correct_answer = data.get("correct_answer", "").strip().lower()
+    quiz_id = data.get("quiz_id")
     user = get_current_user()
 
     if not user:
         return jsonify({"error": "Not logged in"}), 401
 
-    if user_answer == correct_answer:
+    if not quiz_id:
+        return jsonify({"error": "quiz_id is required"}), 400
+
+    # Answers are checked on the server, against the quiz bank or the quiz job;
+    # the client never gets the answer up front
+    question = services.chatbot.get_stored_quiz(quiz_id)
+    if question is None:
+        question = generated_quiz(quiz_id, user.user_id)[1]
+    if question is None:
+        return jsonify({"error": "Quiz not found"}), 404
+    # The feedback gives the answer away, so each served quiz is scored once
+    claim = users.claim_quiz_answer(user.user_id, quiz_id)
+    if claim == "missing":
+        return jsonify({"error": "Quiz not found"}), 404
+    if claim == "answered":
+        return jsonify({"error": "Quiz already answered"}), 409
+    correct = check_answer(question, user_answer)
+    feedback = {"correct_answer": correct_option(question), "explanation": question["explanation"]}
+
+    if correct:
         xp = 50
-        user.add_xp(xp)
+        user = users.add_xp(user.user_id, xp)
         return jsonify({
             "correct": True,
             "xp_gained": xp,
-            "user": user.to_dict()
+            "user": user.to_dict(),
+            **feedback
         })
     else:
         penalty = 10
-        user.add_xp(-penalty)
+        user = users.add_xp(user.user_id, -penalty)
         return jsonify({
             "correct": False,
             "xp_gained": -penalty,
-            "user": user.to_dict()
+            "user": user.to_dict(),
+            **feedback
         })
 
 if __name__ == '__main__':
@@ -0,0 +1,325 @@
+"""Async ASGI server exposing the same API as app.py
+
+Run from src/backend with:  uvicorn asgi:app --port 8000
+
+LLM and embedding calls use the async OpenAI client methods over one shared
+aiohttp connection pool, so a single process can keep hundreds of chats in
+flight while they wait on the network.
+"""
+import asyncio
+import os
+import time
+
+import aiohttp
+import openai
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Match, Route
+
+from user_store import UserStore
+from services import Services, ServicesUnavailable
+from llm_scheduler import LLMUnavailable, RETRY_AFTER_SECONDS
+from quiz_jobs import AsyncQuizJobs
+from quiz_bank import public_quiz, format_quiz, check_answer, correct_option, parse_generated_quiz
+from metrics import REGISTRY, CONTENT_TYPE, REQUEST_SECONDS
+from config import (QUIZ_TTL, QUIZ_MAX_WAIT, ASYNC_POOL_SIZE, USER_DB_PATH, USER_CACHE_TTL, HISTORY_BATCH_SIZE,
+                    HISTORY_FLUSH_INTERVAL, WARMUP_ON_START)
+
+# Load environment variables
+load_dotenv(dotenv_path="config/.env", override=True)
+
+# Users are kept in SQLite so every worker process sees the same data
+users = UserStore(USER_DB_PATH, cache_ttl=USER_CACHE_TTL, history_batch_size=HISTORY_BATCH_SIZE,
+                  flush_interval=HISTORY_FLUSH_INTERVAL)
+
+# The retriever and chatbot are built on first use, or by the warmup thread
+services = Services(on_summary=users.save_summary)
+
+
+async def generate_quiz(answer):
+    return await services.chatbot.agenerate_followup_question(answer)
+
+
+quiz_jobs = AsyncQuizJobs(generate_quiz, ttl_seconds=QUIZ_TTL, store=users)
+
+
+async def generated_quiz(quiz_id, user_id, wait=0):
+    """Async variant of app.generated_quiz"""
+    status, text = await quiz_jobs.result(quiz_id, user_id, wait=wait)
+    if status != "ready":
+        return status, None
+    quiz = parse_generated_quiz(quiz_id, text)
+    return ("ready", quiz) if quiz is not None else ("failed", None)
+
+# Shared aiohttp session used by every async OpenAI request
+http_pool = None
+
+
+class PooledSessionMiddleware:
+    """Bind the shared aiohttp session for OpenAI calls made while handling a request
+
+    openai reads its session from a context variable, which has to be set in
+    the task that serves the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if http_pool is not None:
+            openai.aiosession.set(http_pool)
+        await self.app(scope, receive, send)
+
+
+class RequestTimingMiddleware:
+    """Observe the latency of every HTTP request, labelled by route pattern and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope):
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    route=self._route(scope), method=scope["method"], status=status)
+
+
+async def startup():
+    global http_pool
+    http_pool = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE))
+    if WARMUP_ON_START:
+        services.start_warmup()
+
+
+async def shutdown():
+    if http_pool is not None:
+        await http_pool.close()
+    users.close()
+
+
+async def get_chatbot():
+    # Building the chatbot opens the index, so the first use runs off the event loop
+    if services.loaded:
+        return services.chatbot
+    return await asyncio.to_thread(getattr, services, "chatbot")
+
+
+async def get_current_user(request):
+    # Usually answered from the cache; a database read runs off the event loop
+    return await asyncio.to_thread(users.get, request.session.get('user_id'))
+
+
+async def login(request):
+    data = await request.json()
+    user_id = data.get('user_id')
+
+    if not user_id:
+        return JSONResponse({"error": "User ID is required"}, status_code=400)
+
+    # Create user if doesn't exist
+    user = await asyncio.to_thread(users.get_or_create, user_id)
+
+    request.session['user_id'] = user_id
+    return JSONResponse({
+        "message": "Login successful",
+        "user": user.to_dict()
+    })
+
+
+async def chat(request):
+    data = await request.json()
+    query = data.get("query")
+    user = await get_current_user(request)
+
+    if not user:
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+
+    chatbot = await get_chatbot()
+    if not chatbot.check_topic_access(query, user.rank):
+        return JSONResponse({"answer": "This topic is restricted based on your current rank.", "restricted": True})
+
+    answer, hit_ids = await chatbot.agenerate_response(query, user.rank, user)
+    users.record_interaction(user.user_id, query, answer)
+    chatbot.update_memory(user)
+
+    response = {
+        "answer": answer,
+        # Kept for older clients; the quiz is now fetched by quiz_id
+        "followup_question": None,
+        "user": user.to_dict(),
+        "restricted": False
+    }
+
+    # Take the follow-up quiz from the quiz bank if the retrieved chunks have one;
+    # otherwise generate it in the background and fetch it from /api/quiz/<quiz_id>
+    stored = chatbot.pick_quiz(hit_ids, user.rank)
+    if stored is not None:
+        await asyncio.to_thread(users.record_served_quiz, user.user_id, stored["id"])
+        response["quiz_id"] = stored["id"]
+        response["quiz"] = public_quiz(stored)
+    else:
+        response["quiz_id"] = await quiz_jobs.submit(user.user_id, answer)
+
+    return JSONResponse(response)
+
+
+async def get_quiz(request):
+    """Return a follow-up quiz, long-polling up to ?wait= seconds until it is ready"""
+    quiz_id = request.path_params["quiz_id"]
+    user = await get_current_user(request)
+
+    if not user:
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+
+    # Stored quizzes are only shown to users they were served to
+    stored = (await get_chatbot()).get_stored_quiz(quiz_id)
+    if stored is not None and await asyncio.to_thread(users.was_served_quiz, user.user_id, quiz_id):
+        return JSONResponse({"quiz_id": quiz_id, "status": "ready", "quiz": public_quiz(stored),
+                             "followup_question": format_quiz(stored)})
+
+    try:
+        wait = min(max(float(request.query_params.get("wait", 0)), 0), QUIZ_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    status, generated = await generated_quiz(quiz_id, user.user_id, wait=wait)
+
+    if status == "missing":
+        return JSONResponse({"error": "Quiz not found"}, status_code=404)
+    if status == "failed":
+        return JSONResponse({"quiz_id": quiz_id, "status": status, "error": "Quiz generation failed"}, status_code=500)
+    if status == "pending":
+        return JSONResponse({"quiz_id": quiz_id, "status": status}, status_code=202)
+
+    # Like stored quizzes, generated ones are sent without their answer line
+    return JSONResponse({"quiz_id": quiz_id, "status": status, "quiz": public_quiz(generated),
+                         "followup_question": format_quiz(generated)})
+
+
+async def quiz(request):
+    data = await request.json()
+    user_answer = data.get("answer", "").strip().lower()
+    quiz_id = data.get("quiz_id")
+    user = await get_current_user(request)
+
+    if not user:
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+
+    if not quiz_id:
+        return JSONResponse({"error": "quiz_id is required"}, status_code=400)
+
+    # Answers are checked on the server, against the quiz bank or the quiz job;
+    # the client never gets the answer up front
+    question = (await get_chatbot()).get_stored_quiz(quiz_id)
+    if question is None:
+        question = (await generated_quiz(quiz_id, user.user_id))[1]
+    if question is None:
+        return JSONResponse({"error": "Quiz not found"}, status_code=404)
+    # The feedback gives the answer away, so each served quiz is scored once
+    claim = await asyncio.to_thread(users.claim_quiz_answer, user.user_id, quiz_id)
+    if claim == "missing":
+        return JSONResponse({"error": "Quiz not found"}, status_code=404)
+    if claim == "answered":
+        return JSONResponse({"error": "Quiz already answered"}, status_code=409)
+    correct = check_answer(question, user_answer)
+    feedback = {"correct_answer": correct_option(question), "explanation": question["explanation"]}
+
+    if correct:
+        xp = 50
+        user = await asyncio.to_thread(users.add_xp, user.user_id, xp)
+        return JSONResponse({
+            "correct": True,
+            "xp_gained": xp,
+            "user": user.to_dict(),
+            **feedback
+        })
+    else:
+        penalty = 10
+        user = await asyncio.to_thread(users.add_xp, user.user_id, -penalty)
+        return JSONResponse({
+            "correct": False,
+            "xp_gained": -penalty,
+            "user": user.to_dict(),
+            **feedback
+        })
+
+
+async def metrics(request):
+    return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def healthz(request):
+    """Liveness: the process is up and serving requests"""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    """Readiness: the index is loaded and chat requests will not pay the startup cost"""
+    services.start_warmup()
+    status = services.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+async def services_unavailable(request, exc):
+    return JSONResponse({"error": "Service not ready", "detail": str(exc)}, status_code=503)
+
+
+async def llm_unavailable(request, exc):
+    return JSONResponse({"error": "The assistant is busy, please try again shortly", "detail": str(exc)},
+                        status_code=503, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+routes = [
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/quiz/{quiz_id}', get_quiz, methods=['GET']),
+    Route('/api/quiz', quiz, methods=['POST']),
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/healthz', healthz, methods=['GET']),
+    Route('/readyz', readyz, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestTimingMiddleware),
+        Middleware(CORSMiddleware,
+                   allow_credentials=True,
+                   allow_origins=["http://localhost:3000"],
+                   allow_methods=["GET", "POST", "OPTIONS"],
+                   allow_headers=["Content-Type"]),
+        Middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "dev-secret-key")),
+        Middleware(PooledSessionMiddleware),
+    ],
+    exception_handlers={ServicesUnavailable: services_unavailable, LLMUnavailable: llm_unavailable},
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
+
+if __name__ == '__main__':
+    uvicorn.run(app, port=8000)
@@ -0,0 +1,153 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+
+# Plain word tokens
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Control identifiers as used in NIST SP 800-53, e.g. "AC-2", "SC-7", "AC-2(3)" or "AC-2 (3)"
+CONTROL_ID_PATTERN = re.compile(r"\b([a-z]{2})-(\d{1,2})(?:\s?\((\d{1,2})\))?", re.IGNORECASE)
+
+
+def control_ids(text):
+    """Return the normalized control identifiers in a text ("ac-2", "ac-2(3)", ...)"""
+    ids = []
+    for family, number, enhancement in CONTROL_ID_PATTERN.findall(text):
+        base = f"{family.lower()}-{int(number)}"
+        ids.append(base)
+        if enhancement:
+            ids.append(f"{base}({int(enhancement)})")
+    return ids
+
+
+def tokenize(text):
+    """Split text into word tokens plus whole control-identifier tokens"""
+    return WORD_PATTERN.findall(text.lower()) + control_ids(text)
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring
+
+    Built alongside the vector collection at ingestion time and persisted as
+    JSON at ``path``. Lookups only touch the postings of the query terms.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {chunk_id: term frequency}
+        self.lengths = {}  # chunk_id -> number of tokens
+        self.sources = {}  # chunk_id -> source path
+        self.terms = {}  # chunk_id -> distinct terms, so removal only touches its postings
+        self._total_length = 0
+        self._lock = threading.Lock()
+        # mtime of the file as last loaded or saved, to notice rewrites by other processes
+        self.mtime = 0
+
+    @classmethod
+    def load(cls, path):
+        """Load an index from disk, or return an empty one if it doesn't exist"""
+        index = cls(path)
+        index.mtime = index._file_mtime()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return index
+        index.postings = data["postings"]
+        index.lengths = data["lengths"]
+        index.sources = data["sources"]
+        index.terms = data["terms"]
+        index._total_length = sum(index.lengths.values())
+        return index
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def is_stale(self):
+        """True if another process rewrote the file since it was loaded or saved"""
+        return self._file_mtime() != self.mtime
+
+    def save(self):
+        """Atomically write the index to disk"""
+        with self._lock:
+            data = {"postings": self.postings, "lengths": self.lengths, "sources": self.sources,
+                    "terms": self.terms}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.mtime = self._file_mtime()
+
+    def add(self, chunk_ids, texts, sources):
+        """Index (or re-index) chunks"""
+        with self._lock:
+            for chunk_id, text, source in zip(chunk_ids, texts, sources):
+                self._remove(chunk_id)
+                tokens = tokenize(text)
+                for token in tokens:
+                    postings = self.postings.setdefault(token, {})
+                    postings[chunk_id] = postings.get(chunk_id, 0) + 1
+                self.lengths[chunk_id] = len(tokens)
+                self.sources[chunk_id] = source
+                self.terms[chunk_id] = sorted(set(tokens))
+                self._total_length += len(tokens)
+
+    def remove(self, chunk_ids):
+        """Remove chunks from the index"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+
+    def remove_source(self, source):
+        """Remove every chunk that came from a source path"""
+        with self._lock:
+            for chunk_id in [chunk_id for chunk_id, s in self.sources.items() if s == source]:
+                self._remove(chunk_id)
+
+    def _remove(self, chunk_id):
+        """Remove one chunk; caller holds the lock"""
+        if chunk_id not in self.lengths:
+            return
+        self._total_length -= self.lengths.pop(chunk_id)
+        self.sources.pop(chunk_id, None)
+        for term in self.terms.pop(chunk_id, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def has_terms(self, terms):
+        """Return True if every term occurs somewhere in the index"""
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    def search(self, query, n_results=10):
+        """Return up to n_results (chunk_id, score) pairs, best first"""
+        with self._lock:
+            n_docs = len(self.lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
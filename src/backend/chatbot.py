@@ -2,94 +2,122 @@ import os
 import openai # CHANGED: No longer from openai import OpenAI
 from dotenv import load_dotenv
 import json
+import time
+
+try:
+    from .config import (RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_TTL,
+                         RESPONSE_CACHE_SIZE, CONTEXT_CANDIDATES, MEMORY_RECENT_TURNS, MEMORY_SUMMARY_TOKENS,
+                         SUMMARY_MODEL, REQUEST_COALESCING, LLM_REQUEST_TIMEOUT, QUIZ_BANK)
+    from .llm_scheduler import get_llm_scheduler
+    from .quiz_bank import QuizBank, quiz_bank_path
+    from .embedding_cache import normalize_text
+    from .singleflight import SingleFlight, AsyncSingleFlight
+    from .response_cache import SemanticResponseCache
+    from .topics import get_topic_matcher
+    from .memory import ConversationMemory
+    from .metrics import STAGE_SECONDS, record_usage, record_response_usage
+except ImportError:
+    from config import (RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_TTL,
+                        RESPONSE_CACHE_SIZE, CONTEXT_CANDIDATES, MEMORY_RECENT_TURNS, MEMORY_SUMMARY_TOKENS,
+                        SUMMARY_MODEL, REQUEST_COALESCING, LLM_REQUEST_TIMEOUT, QUIZ_BANK)
+    from llm_scheduler import get_llm_scheduler
+    from quiz_bank import QuizBank, quiz_bank_path
+    from embedding_cache import normalize_text
+    from singleflight import SingleFlight, AsyncSingleFlight
+    from response_cache import SemanticResponseCache
+    from topics import get_topic_matcher
+    from memory import ConversationMemory
+    from metrics import STAGE_SECONDS, record_usage, record_response_usage
 
 load_dotenv(dotenv_path="config/.env", override=True)
 
 class SecurityChatbot:
-    def __init__(self, retriever):
-        """Initialize the security chatbot with a document retriever"""
+    def __init__(self, retriever, on_summary=None):
+        """Initialize the security chatbot with a document retriever
+
+        ``on_summary(user_id, summary, summarized)`` is called whenever a
+        user's conversation summary is updated, so it can be persisted.
+        """
         self.retriever = retriever
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         # CHANGED: Set the API key on the module level
         openai.api_key = self.openai_api_key
 
-        # Topic keywords for basic classification
-        # In production, use a more sophisticated topic classification system
-        self.topic_keywords = {
-            "phishing": ["phishing", "scam", "fake email", "suspicious link"],
-            "passwords": ["password", "credentials", "authentication", "login"],
-            "encryption": ["encryption", "encrypt", "cipher", "cryptography"],
-            "network": ["network", "wifi", "router", "firewall", "vpn"],
-            "incident_response": ["incident", "breach", "attack", "response", "compromise"],
-            "penetration_testing": ["pentest", "penetration", "ethical hacking", "vulnerability scan"],
-            "malware": ["malware", "virus", "trojan", "ransomware"],
-            "social engineering": ["social engineering", "impersonation", "baiting", "pretexting"],
-            "data protection": ["data protection", "gdpr", "data loss", "privacy policy"],
-            "email security": ["email security", "spoofing", "dmarc", "spam"],
-            "device security": ["device security", "mobile protection", "laptop safety"],
-            "secure browsing": ["https", "browser safety", "secure website", "ssl"],
-            "authentication": ["authentication", "2fa", "mfa", "identity verification"],
-            "security policies": ["security policies", "acceptable use", "access control"],
-            "security audits": ["audit", "security audit", "compliance check"],
-            "risk assessment": ["risk assessment", "risk analysis", "vulnerability scoring"],
-            "compliance": ["compliance", "regulations", "laws", "ISO 27001"],
-            "advanced threats": ["apt", "zero-day", "stealth attack"],
-            "security architecture": ["architecture", "security design", "defense in depth"],
-            "zero trust": ["zero trust", "never trust", "verify always"]
-        }
+        # Answers to near-duplicate questions are served from this cache
+        self.response_cache = SemanticResponseCache(
+            similarity_threshold=RESPONSE_CACHE_SIMILARITY,
+            ttl_seconds=RESPONSE_CACHE_TTL,
+            max_entries=RESPONSE_CACHE_SIZE
+        ) if RESPONSE_CACHE_ENABLED else None
 
+        # Compiled once from config.TOPICS and shared by every request
+        self.topic_matcher = get_topic_matcher()
 
-        # Map topics to minimum required ranks
-        self.topic_ranks = {
-            "phishing": 1,
-            "passwords": 1,
-            "basic security": 1,
-            "malware": 1,
-            "social engineering": 1,
-            "data protection": 2,
-            "email security": 2,
-            "device security": 2,
-            "secure browsing": 2,
-            "network": 3,
-            "encryption": 3,
-            "authentication": 3,
-            "security policies": 3,
-            "incident_response": 4,
-            "security audits": 4,
-            "risk assessment": 4,
-            "compliance": 4,
-            "penetration_testing": 5,
-            "advanced threats": 5,
-            "security architecture": 5,
-            "zero trust": 5
-        }
+        # Earlier turns of the conversation, replayed within a fixed token budget
+        self.memory = ConversationMemory(
+            self.summarize_conversation, on_summary
+        ) if MEMORY_RECENT_TURNS > 0 else None
 
-    def check_topic_access(self, query, user_rank):
-        """Check if user has access to the topic based on their rank"""
-        query_lower = query.lower()
+        # All LLM calls are queued, rate limited and retried by one scheduler
+        self.llm = get_llm_scheduler()
 
-        # Identify the topic from the query
-        detected_topics = []
-        for topic, keywords in self.topic_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                detected_topics.append(topic)
+        # Follow-up quizzes written at ingestion time, looked up by chunk
+        self.quiz_bank = QuizBank.load(quiz_bank_path(retriever.db_directory)) if QUIZ_BANK else None
 
-        # If no specific topic is detected, default to basic security (rank 1)
-        if not detected_topics:
-            return True
+        # Identical requests arriving together share one retrieval and LLM call
+        self.coalescing = REQUEST_COALESCING
+        self.inflight_answers = SingleFlight("answer")
+        self.inflight_streams = SingleFlight("answer_stream")
+        self.inflight_quizzes = SingleFlight("quiz")
+        self.ainflight_answers = AsyncSingleFlight("answer")
+        self.ainflight_quizzes = AsyncSingleFlight("quiz")
 
-        # Check if user rank is sufficient for all detected topics
-        for topic in detected_topics:
-            required_rank = self.topic_ranks.get(topic, 1)  # Default to rank 1 if not specified
-            if user_rank < required_rank:
-                return False
+    def after_fork(self):
+        """Reset per-process state in a forked worker
 
-        return True
+        Threads, locks and in-flight calls of the parent don't carry over, so
+        the scheduler, the memory and the in-flight call tables start afresh.
+        """
+        self.llm.after_fork()
+        if self.memory is not None:
+            self.memory.after_fork()
+        self.inflight_answers = SingleFlight("answer")
+        self.inflight_streams = SingleFlight("answer_stream")
+        self.inflight_quizzes = SingleFlight("quiz")
+        self.ainflight_answers = AsyncSingleFlight("answer")
+        self.ainflight_quizzes = AsyncSingleFlight("quiz")
 
-    def generate_response(self, query, user_rank):
-        """Generate a response to the user's query based on their rank"""
-        # Retrieve relevant documents
-        retrieved_context = self.retriever.query_documents(query)
+    def _reserve_tokens(self, messages, max_tokens):
+        """Tokens to reserve for a chat completion: the prompt plus the longest possible reply"""
+        token_counter = self.retriever.context_assembler.token_counter
+        return sum(token_counter.count(m["content"]) for m in messages) + max_tokens
+
+    def check_topic_access(self, query, user_rank):
+        """Check if user has access to the topic based on their rank"""
+        # Queries with no specific topic default to basic security (rank 1)
+        with STAGE_SECONDS.time(stage="topic_gate"):
+            _, required_rank = self.topic_matcher.match(query)
+        return user_rank >= required_rank
+
+    def _prepare_response(self, query, user_rank, hits, query_embedding, user=None):
+        """Build the prompt for a query from its retrieved chunks and the user's conversation
+
+        Returns (messages, cache_key, cached_answer); cached_answer is set when a
+        near-duplicate question has already been answered.
+        """
+        # Only the chunks that made it into the token budget matter for the answer
+        retrieved_context, context_ids = self.retriever.build_context(hits, user_rank)
+        history = self.memory.messages(user) if self.memory is not None and user is not None else []
+
+        # Reuse the answer to a near-duplicate question if one is cached; answers
+        # that depend on earlier turns of a conversation are never shared
+        cache_key = None
+        if self.response_cache is not None and not history:
+            cache_key = (query_embedding, user_rank, context_ids, query)
+            self.response_cache.check_version(self.retriever.index_version())
+            cached_answer = self.response_cache.get(*cache_key)
+            if cached_answer is not None:
+                return None, cache_key, cached_answer
 
         # Create prompt with different complexity based on user rank
         system_messages = {
@@ -117,22 +145,188 @@ class SecurityChatbot:
         if retrieved_context:
             system_message += "\n\nUse the following information to inform your answer if relevant:\n" + retrieved_context
 
+        messages = [
+            {"role": "system", "content": system_message},
+            *history,
+            {"role": "user", "content": query}
+        ]
+        return messages, cache_key, None
+
+    def _retrieve_and_prepare(self, query, user_rank, user=None):
+        """Retrieve relevant documents and build the prompt for a query
+
+        Returns the result of _prepare_response and the IDs of the retrieved
+        chunks, best first.
+        """
+        hits = self.retriever.retrieve(query, CONTEXT_CANDIDATES, user_rank=user_rank)
+        # None when retrieval didn't need the embedding (exact lexical lookups)
+        query_embedding = self.retriever.cached_query_embedding(query)
+        return self._prepare_response(query, user_rank, hits, query_embedding, user), [hit["id"] for hit in hits]
+
+    def _coalescing_key(self, query, user_rank, user):
+        """Key under which identical concurrent requests share an answer, or None
+
+        Answers that build on the user's earlier turns are never shared.
+        """
+        if not self.coalescing:
+            return None
+        if self.memory is not None and user is not None and (user.history or user.summary):
+            return None
+        return normalize_text(query), user_rank
+
+    def generate_response(self, query, user_rank, user=None):
+        """Generate a response to the user's query based on their rank and, if given, their conversation
+
+        Returns (answer, IDs of the retrieved chunks); the IDs are what
+        pick_quiz takes.
+        """
+        key = self._coalescing_key(query, user_rank, user)
+        if key is None:
+            return self._generate_response(query, user_rank, user)
+        return self.inflight_answers.do(key, self._generate_response, query, user_rank, user)
+
+    def _generate_response(self, query, user_rank, user=None):
+        (messages, cache_key, cached_answer), hit_ids = self._retrieve_and_prepare(query, user_rank, user)
+        if cached_answer is not None:
+            return cached_answer, hit_ids
+
         # Call the LLM API
         # CHANGED: The API call syntax is different for openai<1.0.0
-        response = openai.ChatCompletion.create(
-            model="gpt-4o", # or "gpt-3.5-turbo"
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": query}
-            ],
+        with STAGE_SECONDS.time(stage="answer"):
+            response = self.llm.call(
+                "answer", openai.ChatCompletion.create, tokens=self._reserve_tokens(messages, 1000),
+                model="gpt-4o", # or "gpt-3.5-turbo"
+                messages=messages,
+                max_tokens=1000,
+                temperature=0.7,
+                request_timeout=LLM_REQUEST_TIMEOUT
+            )
+        record_response_usage("answer", response)
+
+        answer = response.choices[0].message.content
+        if cache_key is not None:
+            self.response_cache.put(*cache_key, answer)
+
+        return answer, hit_ids
+
+    def stream_response(self, query, user_rank, user=None):
+        """Generate a response like generate_response, yielding text as the model produces it
+
+        The first item is the list of retrieved chunk IDs; the rest are
+        pieces of the answer.
+        """
+        key = self._coalescing_key(query, user_rank, user)
+        if key is None:
+            return self._stream_response(query, user_rank, user)
+        return self.inflight_streams.stream(key, self._stream_response, query, user_rank, user)
+
+    def _stream_response(self, query, user_rank, user=None):
+        (messages, cache_key, cached_answer), hit_ids = self._retrieve_and_prepare(query, user_rank, user)
+        yield hit_ids
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        response = self.llm.stream(
+            "answer", openai.ChatCompletion.create, tokens=self._reserve_tokens(messages, 1000),
+            model="gpt-4o",
+            messages=messages,
             max_tokens=1000,
-            temperature=0.7
+            temperature=0.7,
+            stream=True,
+            request_timeout=LLM_REQUEST_TIMEOUT
         )
 
+        # Only the waits for the model are timed, not the time the consumer
+        # takes between chunks (e.g. writing to a slow client)
+        parts = []
+        upstream_seconds = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = next(response, None)
+                upstream_seconds += time.perf_counter() - start
+                if chunk is None:
+                    break
+                delta = chunk.choices[0].delta.get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            STAGE_SECONDS.observe(upstream_seconds, stage="answer")
+
+        # Streamed completions carry no usage block, so the tokens are counted here
+        token_counter = self.retriever.context_assembler.token_counter
+        record_usage("answer", sum(token_counter.count(m["content"]) for m in messages),
+                     token_counter.count("".join(parts)))
+
+        if cache_key is not None:
+            self.response_cache.put(*cache_key, "".join(parts))
+
+    async def agenerate_response(self, query, user_rank, user=None):
+        """Async variant of generate_response for the ASGI server"""
+        key = self._coalescing_key(query, user_rank, user)
+        if key is None:
+            return await self._agenerate_response(query, user_rank, user)
+        return await self.ainflight_answers.do(key, self._agenerate_response, query, user_rank, user)
+
+    async def _agenerate_response(self, query, user_rank, user=None):
+        hits = await self.retriever.aretrieve(query, CONTEXT_CANDIDATES, user_rank=user_rank)
+        query_embedding = self.retriever.cached_query_embedding(query)
+        messages, cache_key, cached_answer = self._prepare_response(query, user_rank, hits, query_embedding, user)
+        hit_ids = [hit["id"] for hit in hits]
+        if cached_answer is not None:
+            return cached_answer, hit_ids
+
+        with STAGE_SECONDS.time(stage="answer"):
+            response = await self.llm.acall(
+                "answer", openai.ChatCompletion.acreate, tokens=self._reserve_tokens(messages, 1000),
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=1000,
+                temperature=0.7,
+                request_timeout=LLM_REQUEST_TIMEOUT
+            )
+        record_response_usage("answer", response)
+
+        answer = response.choices[0].message.content
+        if cache_key is not None:
+            self.response_cache.put(*cache_key, answer)
+
+        return answer, hit_ids
+
+    def update_memory(self, user):
+        """Fold the user's older turns into their conversation summary once enough have built up"""
+        if self.memory is not None and user is not None:
+            self.memory.update(user)
+
+    def summarize_conversation(self, summary, turns):
+        """Return the running summary extended with (query, response) turns"""
+        transcript = "\n\n".join(f"User: {query}\nAssistant: {response}" for query, response in turns)
+        messages = [
+            {"role": "system", "content": (
+                "You maintain a running summary of a conversation between a user and a security "
+                "advisor chatbot. Update the summary with the new turns. Keep what the user told "
+                "about themselves, the topics and advice covered, and open questions. Be concise."
+            )},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ]
+        with STAGE_SECONDS.time(stage="summary"):
+            response = self.llm.call(
+                "summary", openai.ChatCompletion.create,
+                tokens=self._reserve_tokens(messages, MEMORY_SUMMARY_TOKENS),
+                model=SUMMARY_MODEL,
+                messages=messages,
+                max_tokens=MEMORY_SUMMARY_TOKENS,
+                temperature=0.3,
+                request_timeout=LLM_REQUEST_TIMEOUT
+            )
+        record_response_usage("summary", response)
         return response.choices[0].message.content
 
-    def generate_followup_question(self, answer):
-        """Generate a quiz question from the given answer"""
+    @staticmethod
+    def _followup_messages(answer):
+        """Build the quiz generation prompt for an answer"""
         followup_prompt = (
             "Based on the following information, generate one multiple-choice question "
             "with four options and indicate the correct answer.\n\n"
@@ -140,15 +334,72 @@ class SecurityChatbot:
             "Format the response like this:\n"
             "Question: ...\nOptions:\na) ...\nb) ...\nc) ...\nd) ...\nAnswer: ..."
         )
+        return [
+            {"role": "system", "content": "You are a quiz generator for cybersecurity topics."},
+            {"role": "user", "content": followup_prompt}
+        ]
+
+    def _stored_quizzes(self):
+        """The quiz bank, reloaded if setup.py rewrote it, or None if it is disabled or empty"""
+        if self.quiz_bank is None:
+            return None
+        self.quiz_bank.refresh()
+        return self.quiz_bank if len(self.quiz_bank) else None
 
+    def pick_quiz(self, chunk_ids, user_rank):
+        """Pick a stored quiz for the chunks retrieved for an answer, or None if none has one
+
+        ``chunk_ids`` are the IDs returned with the answer, so no second
+        search is needed.
+        """
+        quiz_bank = self._stored_quizzes()
+        if quiz_bank is None:
+            return None
+        with STAGE_SECONDS.time(stage="quiz_pick"):
+            return quiz_bank.pick(chunk_ids, user_rank)
+
+    def get_stored_quiz(self, quiz_id):
+        """Return a quiz from the bank by ID, or None"""
+        quiz_bank = self._stored_quizzes()
+        return quiz_bank.get(quiz_id) if quiz_bank is not None else None
+
+    def generate_followup_question(self, answer):
+        """Generate a quiz question from the given answer"""
+        if not self.coalescing:
+            return self._generate_followup_question(answer)
+        return self.inflight_quizzes.do(answer, self._generate_followup_question, answer)
+
+    def _generate_followup_question(self, answer):
         # CHANGED: The API call syntax is different here as well
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a quiz generator for cybersecurity topics."},
-                {"role": "user", "content": followup_prompt}
-            ],
-            max_tokens=300,
-            temperature=0.5
-        )
-        return response.choices[0].message.content
\ No newline at end of file
+        messages = self._followup_messages(answer)
+        with STAGE_SECONDS.time(stage="followup_quiz"):
+            response = self.llm.call(
+                "quiz", openai.ChatCompletion.create, tokens=self._reserve_tokens(messages, 300),
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=300,
+                temperature=0.5,
+                request_timeout=LLM_REQUEST_TIMEOUT
+            )
+        record_response_usage("quiz", response)
+        return response.choices[0].message.content
+
+    async def agenerate_followup_question(self, answer):
+        """Async variant of generate_followup_question for the ASGI server"""
+        if not self.coalescing:
+            return await self._agenerate_followup_question(answer)
+        return await self.ainflight_quizzes.do(answer, self._agenerate_followup_question, answer)
+
+    async def _agenerate_followup_question(self, answer):
+        messages = self._followup_messages(answer)
+        with STAGE_SECONDS.time(stage="followup_quiz"):
+            response = await self.llm.acall(
+                "quiz", openai.ChatCompletion.acreate, tokens=self._reserve_tokens(messages, 300),
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=300,
+                temperature=0.5,
+                request_timeout=LLM_REQUEST_TIMEOUT
+            )
+        record_response_usage("quiz", response)
+        return response.choices[0].message.content
@@ -16,12 +16,166 @@ def validate_config():
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 
+# Async (ASGI) server configuration
+# Maximum number of pooled connections shared by all async OpenAI requests
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "200"))
+
+# Startup configuration
+# The retriever and chatbot are built lazily. With WARMUP_ON_START the server
+# loads them (and the vector index) in the background as soon as it starts;
+# otherwise on the first request or /readyz probe
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "True").lower() == "true"
+
+# Pre-fork server configuration (gunicorn.conf.py)
+# Workers are forked after the index is loaded and share it; each runs
+# WEB_THREADS request threads (ignored by the async uvicorn worker)
+WEB_BIND = os.getenv("WEB_BIND", "127.0.0.1:8000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+
 # Database configuration
 DB_DIRECTORY = os.getenv("DB_DIRECTORY", "./data/chroma_db")
 
+# Vector index configuration
+# "chroma" uses a persistent Chroma collection; "flat" uses a memory-mapped
+# embedding matrix searched exactly, stored as FLAT_INDEX_DTYPE ("float32" or "float16";
+# float16 halves the file size but is slower to score, as NumPy upcasts it per query)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+
+# User store configuration
+# SQLite database shared by all worker processes. Cached users are re-read after
+# USER_CACHE_TTL seconds; interactions are written in batches of
+# HISTORY_BATCH_SIZE or every HISTORY_FLUSH_INTERVAL seconds.
+USER_DB_PATH = os.getenv("USER_DB_PATH", "./data/users.sqlite3")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "2"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "50"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1"))
+
+# Interaction history kept in memory per user; older turns are dropped, or
+# appended to <USER_HISTORY_SPILL_DIR>/<user_id>.jsonl when that is set (users
+# in the SQLite user store never spill, the database has their full history)
+USER_HISTORY_SIZE = int(os.getenv("USER_HISTORY_SIZE", "20"))
+USER_HISTORY_SPILL_DIR = os.getenv("USER_HISTORY_SPILL_DIR", "")
+
+# Conversation memory configuration
+# The last MEMORY_RECENT_TURNS turns are replayed verbatim; older ones are folded
+# into a running summary (SUMMARY_MODEL) once MEMORY_FOLD_TURNS have
+# accumulated. Memory never uses more than MEMORY_TOKEN_BUDGET prompt tokens.
+# Set MEMORY_RECENT_TURNS to 0 to disable conversation memory.
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))
+MEMORY_FOLD_TURNS = int(os.getenv("MEMORY_FOLD_TURNS", "2"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
 # Knowledge base configuration
 KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "./data/knowledge_base")
 
+# Ingestion configuration
+# Chunks are embedded and written to the collection in batches of this size,
+# with at most EMBEDDING_MAX_WORKERS embedding requests in flight at once.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+
+# Embedding provider configuration
+# "openai" uses the OpenAI API; "local" encodes on the CPU with sentence-transformers.
+# With the local provider, raise EMBEDDING_BATCH_SIZE so each write feeds the
+# encoder full batches.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "256"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", str(os.cpu_count() or 1)))
+
+# Hybrid retrieval configuration
+# Dense and BM25 hits (HYBRID_CANDIDATES of each) are fused by reciprocal rank with constant RRF_K
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "True").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Context assembly configuration
+# Up to CONTEXT_CANDIDATES chunks are retrieved per query; overlapping ones are
+# merged, near-duplicates (at least CONTEXT_DEDUP_SIMILARITY of their word
+# shingles already in the context) dropped, and the rest added until the
+# rank's token budget is used up
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+CONTEXT_TOKEN_BUDGETS = {
+    1: int(os.getenv("CONTEXT_TOKEN_BUDGET_1", "600")),
+    2: int(os.getenv("CONTEXT_TOKEN_BUDGET_2", "800")),
+    3: int(os.getenv("CONTEXT_TOKEN_BUDGET_3", "1000")),
+    4: int(os.getenv("CONTEXT_TOKEN_BUDGET_4", "1200")),
+    5: int(os.getenv("CONTEXT_TOKEN_BUDGET_5", "1500"))
+}
+
+# Outbound LLM scheduler
+# Every OpenAI call (chat and embeddings) waits in one priority queue for one of
+# LLM_MAX_CONCURRENCY slots and for room in the requests/tokens per minute
+# limits (0 = unlimited; the limits apply per process, so divide your account
+# limits by the number of workers). At most LLM_MAX_QUEUE calls wait; a call
+# that cannot start or retry within its LLM_DEADLINES seconds fails instead
+# of hanging.
+# Rate limits and transient errors are retried up to LLM_MAX_RETRIES times
+# with exponential backoff (LLM_BACKOFF_BASE doubling up to LLM_BACKOFF_MAX
+# seconds, with jitter), and each attempt times out after LLM_REQUEST_TIMEOUT
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+LLM_DEADLINES = {
+    "answer": float(os.getenv("LLM_DEADLINE_ANSWER", "60")),
+    "embedding": float(os.getenv("LLM_DEADLINE_EMBEDDING", "30")),
+    "quiz": float(os.getenv("LLM_DEADLINE_QUIZ", "120")),
+    "summary": float(os.getenv("LLM_DEADLINE_SUMMARY", "300"))
+}
+
+# Request coalescing
+# Identical chats (same normalized query and rank, no earlier turns) that
+# arrive while one is being answered wait for that answer instead of
+# repeating retrieval and the LLM calls; likewise for follow-up quizzes
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "True").lower() == "true"
+
+# Query embedding cache configuration
+# In-memory LRU size, and whether/how large the SQLite tier in DB_DIRECTORY is
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "True").lower() == "true"
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "50000"))
+
+# Response cache configuration
+# Answers are reused for queries at the same rank that retrieve the same chunks
+# and whose embeddings are at least this similar
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.97"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+# Follow-up quiz configuration
+# Quizzes are generated by a background pool and kept for QUIZ_TTL seconds
+QUIZ_WORKERS = int(os.getenv("QUIZ_WORKERS", "4"))
+QUIZ_TTL = int(os.getenv("QUIZ_TTL", "600"))
+QUIZ_MAX_WAIT = int(os.getenv("QUIZ_MAX_WAIT", "30"))
+
+# Quiz bank configuration
+# setup.py writes multiple-choice questions for every chunk and rank
+# (QUIZ_BANK_MODEL, QUIZ_BANK_WORKERS chunks at a time) into a quiz bank next to
+# the index. With QUIZ_BANK enabled, chats pick their follow-up quiz from it for
+# the retrieved chunks without an LLM call; only chats whose chunks have no
+# stored questions fall back to generating one from the answer
+QUIZ_BANK = os.getenv("QUIZ_BANK", "True").lower() == "true"
+QUIZ_BANK_MODEL = os.getenv("QUIZ_BANK_MODEL", "gpt-4o")
+QUIZ_BANK_WORKERS = int(os.getenv("QUIZ_BANK_WORKERS", "4"))
+
+# PDF extraction configuration
+# Number of worker processes converting PDFs in parallel (1 disables the pool)
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Pages with less cleaned text than this are re-extracted with the fallback extractor
+PDF_MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", "20"))
+
 # Rank configuration
 RANKS = {
     1: {"name": "Security Novice", "threshold": 0},
@@ -51,23 +205,25 @@ TOPICS = {
     },
     "social_engineering": {
         "rank": 1,
-        "keywords": ["social engineering", "manipulation", "pretexting", "baiting"]
+        "keywords": ["social engineering", "manipulation", "pretexting", "baiting", "impersonation"]
     },
     "data_protection": {
         "rank": 2,
-        "keywords": ["data protection", "data privacy", "data security", "pii"]
+        "keywords": ["data protection", "data privacy", "data security", "pii", "data loss", "privacy policy"]
     },
     "email_security": {
         "rank": 2,
-        "keywords": ["email security", "secure email", "email protection"]
+        "keywords": ["email security", "secure email", "email protection", "spoofing", "dmarc", "spam"]
     },
     "device_security": {
         "rank": 2,
-        "keywords": ["device security", "mobile security", "endpoint security"]
+        "keywords": ["device security", "mobile security", "endpoint security", "mobile protection",
+                     "laptop safety"]
     },
     "secure_browsing": {
         "rank": 2,
-        "keywords": ["secure browsing", "safe browsing", "browser security"]
+        "keywords": ["secure browsing", "safe browsing", "browser security", "browser safety", "https",
+                     "secure website", "ssl"]
     },
     "network_security": {
         "rank": 3,
@@ -79,11 +235,12 @@ TOPICS = {
     },
     "authentication": {
         "rank": 3,
-        "keywords": ["authentication", "mfa", "2fa", "two-factor", "multi-factor"]
+        "keywords": ["authentication", "mfa", "2fa", "two-factor", "multi-factor", "identity verification"]
     },
     "security_policies": {
         "rank": 3,
-        "keywords": ["security policy", "security policies", "policy", "compliance"]
+        "keywords": ["security policy", "security policies", "policy", "compliance", "acceptable use",
+                     "access control"]
     },
     "incident_response": {
         "rank": 4,
@@ -91,31 +248,33 @@ TOPICS = {
     },
     "security_audits": {
         "rank": 4,
-        "keywords": ["audit", "security audit", "assessment", "evaluation"]
+        "keywords": ["audit", "security audit", "assessment", "evaluation", "compliance check"]
     },
     "risk_assessment": {
         "rank": 4,
-        "keywords": ["risk", "risk assessment", "vulnerability assessment"]
+        "keywords": ["risk", "risk assessment", "vulnerability assessment", "risk analysis",
+                     "vulnerability scoring"]
     },
     "compliance": {
         "rank": 4,
-        "keywords": ["compliance", "gdpr", "hipaa", "pci", "regulatory"]
+        "keywords": ["compliance", "gdpr", "hipaa", "pci", "regulatory", "regulations", "laws", "iso 27001"]
     },
     "penetration_testing": {
         "rank": 5,
-        "keywords": ["penetration testing", "pentest", "ethical hacking"]
+        "keywords": ["penetration testing", "pentest", "ethical hacking", "penetration", "vulnerability scan"]
     },
     "advanced_threats": {
         "rank": 5,
-        "keywords": ["advanced threat", "apt", "sophisticated attack", "zero day"]
+        "keywords": ["advanced threat", "apt", "sophisticated attack", "zero day", "stealth attack"]
     },
     "security_architecture": {
         "rank": 5,
-        "keywords": ["security architecture", "defense in depth", "secure design"]
+        "keywords": ["security architecture", "defense in depth", "secure design", "architecture",
+                     "security design"]
     },
     "zero_trust": {
         "rank": 5,
-        "keywords": ["zero trust", "zero trust architecture", "trust but verify"]
+        "keywords": ["zero trust", "zero trust architecture", "trust but verify", "never trust", "verify always"]
     }
 }
 
@@ -0,0 +1,158 @@
+import re
+
+try:
+    from .config import CONTEXT_TOKEN_BUDGETS, CONTEXT_DEDUP_SIMILARITY, DEFAULT_MODEL
+except ImportError:
+    from config import CONTEXT_TOKEN_BUDGETS, CONTEXT_DEDUP_SIMILARITY, DEFAULT_MODEL
+
+# Longest overlap searched for between neighbouring chunks (the splitter uses 200)
+MAX_OVERLAP_CHARS = 400
+# Shorter suffix/prefix matches are treated as coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Words per shingle when comparing passages for near-duplicates
+SHINGLE_SIZE = 3
+# A passage is cut to fit the remaining budget only if at least this many tokens are left
+MIN_PARTIAL_TOKENS = 50
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class TokenCounter:
+    """Counts prompt tokens with tiktoken, or estimates ~4 characters per token without it"""
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        try:
+            import tiktoken
+        except ImportError:
+            self._encoding = None
+        else:
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # tiktoken downloads its BPE files on first use, which fails offline
+                self._encoding = None
+
+    def count(self, text):
+        if self._encoding is None:
+            return (len(text) + 3) // 4
+        return len(self._encoding.encode(text))
+
+    def truncate(self, text, max_tokens):
+        """Return the longest prefix of text with at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is None:
+            return text[:max_tokens * 4]
+        tokens = self._encoding.encode(text)
+        return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+
+
+def merge_overlap(first, second):
+    """Join two consecutive chunks, dropping the text the splitter repeated between them"""
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if second.startswith(first[-size:]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _coverage(shingles, seen):
+    """Share of a passage's shingles that already occur in the context"""
+    if not shingles:
+        return 1.0
+    return len(shingles & seen) / len(shingles)
+
+
+class ContextAssembler:
+    """Builds the retrieved-context block of a prompt within a token budget
+
+    Hits from the same source whose chunk positions are consecutive are merged
+    into one passage with the splitter overlap removed. Passages whose word
+    shingles mostly occur in better-ranked passages already are dropped as
+    near-duplicates. The rest are added in
+    relevance order until the user's rank budget is spent; the last passage is
+    cut short if a useful amount of budget remains.
+    """
+
+    def __init__(self, budgets=None, dedup_similarity=CONTEXT_DEDUP_SIMILARITY, token_counter=None):
+        self.budgets = budgets or CONTEXT_TOKEN_BUDGETS
+        self.dedup_similarity = dedup_similarity
+        self.token_counter = token_counter or TokenCounter()
+
+    def budget(self, user_rank):
+        if user_rank in self.budgets:
+            return self.budgets[user_rank]
+        return self.budgets[min(self.budgets)]
+
+    @staticmethod
+    def format_passage(source, text):
+        return f"SOURCE: {source}\nCONTENT: {text}\n"
+
+    def _passages(self, hits):
+        """Merge consecutive hits per source into passages, best-ranked first"""
+        by_source = {}
+        for relevance, hit in enumerate(hits):
+            by_source.setdefault(hit["metadata"]["source"], []).append((relevance, hit))
+
+        passages = []
+        for source, source_hits in by_source.items():
+            source_hits.sort(key=lambda item: item[1]["metadata"].get("chunk", 0))
+            current = None
+            for relevance, hit in source_hits:
+                position = hit["metadata"].get("chunk")
+                consecutive = current is not None and position is not None and current["end"] is not None \
+                    and position == current["end"] + 1
+                if consecutive:
+                    current["text"] = merge_overlap(current["text"], hit["document"])
+                    current["ids"].append(hit["id"])
+                    current["relevance"] = min(current["relevance"], relevance)
+                    current["end"] = position
+                    continue
+                if current is not None:
+                    passages.append(current)
+                current = {"relevance": relevance, "source": source, "text": hit["document"],
+                           "ids": [hit["id"]], "end": position}
+            passages.append(current)
+
+        passages.sort(key=lambda passage: passage["relevance"])
+        return passages
+
+    def assemble(self, hits, user_rank=1):
+        """Return (context text, IDs of the chunks it contains) for ranked hits"""
+        budget = self.budget(user_rank)
+        kept = []
+        seen = set()
+        used_ids = []
+        spent = 0
+
+        for passage in self._passages(hits):
+            shingles = _shingles(passage["text"])
+            if _coverage(shingles, seen) >= self.dedup_similarity:
+                continue
+
+            block = self.format_passage(passage["source"], passage["text"])
+            tokens = self.token_counter.count(block)
+            if spent + tokens > budget:
+                remaining = budget - spent - self.token_counter.count(self.format_passage(passage["source"], ""))
+                if remaining >= MIN_PARTIAL_TOKENS:
+                    text = self.token_counter.truncate(passage["text"], remaining)
+                    kept.append(self.format_passage(passage["source"], text))
+                    used_ids.extend(passage["ids"])
+                break
+
+            kept.append(block)
+            seen.update(shingles)
+            used_ids.extend(passage["ids"])
+            spent += tokens
+
+        return "\n".join(kept), used_ids
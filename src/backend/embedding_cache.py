@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# Seconds a lookup or write waits for a lock on the shared SQLite file before
+# it is treated as a miss (or skipped), so the query path never stalls on it
+DB_TIMEOUT = 1.0
+
+# last_used updates of disk hits are written together once this many are
+# pending, or with the next insert
+TOUCH_BATCH = 64
+
+# When the disk tier is full it is trimmed to this share of max_db_entries,
+# so eviction runs once per many inserts rather than on every one
+EVICT_TO = 0.9
+
+
+def normalize_text(text):
+    """Normalize text for cache lookups: case-folded with collapsed whitespace"""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """Cache in front of an embedding function
+
+    Lookups go to an in-memory LRU first and then, if ``db_path`` is given, to a
+    SQLite table that survives restarts. Entries are keyed by the normalized
+    text and the model name. Both tiers are bounded and evict the least
+    recently used entries. The instance is itself callable with the same
+    signature as a Chroma embedding function.
+
+    The SQLite file is shared by all worker processes. It runs in WAL mode,
+    recency updates are batched, and the row count is tracked instead of
+    counted per insert; a locked or failing database only costs cache hits.
+    """
+
+    def __init__(self, embedding_function, model_name, max_entries=1024, db_path=None, max_db_entries=50000):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db_path = db_path
+        self._db = None
+        # Guards the connection, the row count and the pending touches
+        self._db_lock = threading.Lock()
+        self._db_count = 0
+        self._touched = {}  # key -> last_used not yet written
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._connect()
+
+    def _connect(self):
+        """Open the SQLite tier; caller holds _db_lock or is __init__"""
+        try:
+            self._db = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._db_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.OperationalError as e:
+            print(f"Embedding cache database unavailable, using the memory tier only: {e}")
+            if self._db is not None:
+                self._db.close()
+            self._db = None
+
+    def close(self):
+        """Close the SQLite tier; lookups use the memory tier only until ``reopen``"""
+        with self._db_lock:
+            if self._db is not None:
+                self._write_touches()
+                self._db.close()
+                self._db = None
+
+    def reopen(self):
+        """Reconnect the SQLite tier, e.g. in a forked worker (connections must not cross a fork)"""
+        with self._db_lock:
+            if self.db_path:
+                self._connect()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def __call__(self, input):
+        """Return embeddings for a list of texts, embedding only cache misses"""
+        results, missing = self._lookup(input)
+        if missing:
+            self._lookup_disk(results, missing)
+        if missing:
+            texts = [input[positions[0]] for positions in missing.values()]
+            self._store_disk(self._fill(results, missing, self.embedding_function(texts)))
+        return results
+
+    async def acall(self, input, async_embedding_function):
+        """Async variant of __call__ that embeds misses with ``async_embedding_function``
+
+        Only the memory tier is consulted on the event loop; the disk tier is
+        read and written in worker threads.
+        """
+        results, missing = self._lookup(input)
+        if missing:
+            if self._db is not None:
+                await asyncio.to_thread(self._lookup_disk, results, missing)
+            else:
+                self._lookup_disk(results, missing)
+        if missing:
+            texts = [input[positions[0]] for positions in missing.values()]
+            stored = self._fill(results, missing, await async_embedding_function(texts))
+            if self._db is not None:
+                await asyncio.to_thread(self._store_disk, stored)
+        return results
+
+    def peek(self, text):
+        """Return the in-memory embedding for a text, or None; never computes or counts"""
+        with self._lock:
+            return self._memory.get(self._key(text))
+
+    def _lookup(self, input):
+        """Return (results with memory hits filled in, {key: positions} of misses)"""
+        keys = [self._key(text) for text in input]
+        results = [None] * len(input)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    results[i] = self._memory[key]
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        return results, missing
+
+    def _lookup_disk(self, results, missing):
+        """Fill in disk hits and remove them from ``missing``; counts what is still missing"""
+        rows = []
+        with self._db_lock:
+            if self._db is not None:
+                keys = list(missing)
+                try:
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})", keys
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    rows = []
+                now = time.time()
+                for key, _ in rows:
+                    self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._write_touches()
+
+        with self._lock:
+            for key, blob in rows:
+                vector = array('f', blob).tolist()
+                self._remember(key, vector)
+                for i in missing.pop(key):
+                    results[i] = vector
+                self.hits += 1
+                self.disk_hits += 1
+            self.misses += len(missing)
+
+    def _fill(self, results, missing, embeddings):
+        """Store freshly computed embeddings in memory and place them in the results
+
+        Returns the (key, vector) pairs for the disk tier.
+        """
+        stored = []
+        with self._lock:
+            for (key, positions), vector in zip(missing.items(), embeddings):
+                vector = list(vector)
+                self._remember(key, vector)
+                stored.append((key, vector))
+                for i in positions:
+                    results[i] = vector
+        return stored
+
+    def _store_disk(self, stored):
+        """Write new vectors and pending touches to the disk tier, evicting when it is full"""
+        with self._db_lock:
+            if self._db is None:
+                return
+            now = time.time()
+            try:
+                for key, vector in stored:
+                    self._db_count += self._db.execute(
+                        "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                        (key, array('f', vector).tobytes(), now)
+                    ).rowcount
+                self._write_touches(commit=False)
+                if self._db_count > self.max_db_entries:
+                    # Other workers insert too; count once before trimming
+                    self._db_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                    if self._db_count > self.max_db_entries:
+                        excess = self._db_count - int(self.max_db_entries * EVICT_TO)
+                        self._db.execute(
+                            "DELETE FROM embeddings WHERE key IN "
+                            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                            (excess,)
+                        )
+                        self._db_count -= excess
+                self._db.commit()
+            except sqlite3.OperationalError:
+                # Locked by another worker for too long; the vectors stay in memory
+                self._db.rollback()
+
+    def _write_touches(self, commit=True):
+        """Write the pending last_used updates; caller holds _db_lock"""
+        if not self._touched or self._db is None:
+            return
+        touched, self._touched = self._touched, {}
+        try:
+            self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                 [(last_used, key) for key, last_used in touched.items()])
+            if commit:
+                self._db.commit()
+        except sqlite3.OperationalError:
+            if commit:
+                self._db.rollback()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and current sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
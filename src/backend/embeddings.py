@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import openai
+
+try:
+    from .config import (EMBEDDING_PROVIDER, OPENAI_EMBEDDING_MODEL, LOCAL_EMBEDDING_MODEL,
+                         LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_THREADS, LLM_REQUEST_TIMEOUT)
+    from .llm_scheduler import get_llm_scheduler
+except ImportError:
+    from config import (EMBEDDING_PROVIDER, OPENAI_EMBEDDING_MODEL, LOCAL_EMBEDDING_MODEL,
+                        LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_THREADS, LLM_REQUEST_TIMEOUT)
+    from llm_scheduler import get_llm_scheduler
+
+
+class OpenAIEmbeddings:
+    """Embeddings from the OpenAI API (one request per call, through the LLM scheduler)"""
+
+    name = "openai"
+    # Several requests can be in flight during ingestion
+    max_concurrency = None
+
+    def __init__(self, model_name=OPENAI_EMBEDDING_MODEL, api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.scheduler = get_llm_scheduler()
+
+    @staticmethod
+    def _estimate_tokens(input):
+        return sum((len(text) + 3) // 4 for text in input)
+
+    def __call__(self, input):
+        response = self.scheduler.call(
+            "embedding", openai.Embedding.create, tokens=self._estimate_tokens(input),
+            model=self.model_name, input=input, api_key=self.api_key, request_timeout=LLM_REQUEST_TIMEOUT
+        )
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+
+    async def aembed(self, input):
+        response = await self.scheduler.acall(
+            "embedding", openai.Embedding.acreate, tokens=self._estimate_tokens(input),
+            model=self.model_name, input=input, api_key=self.api_key, request_timeout=LLM_REQUEST_TIMEOUT
+        )
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+
+
+class LocalEmbeddings:
+    """Embeddings computed on the CPU with sentence-transformers
+
+    Texts are encoded in NumPy batches of ``batch_size`` using ``threads``
+    intra-op threads, with no network round trip.
+    """
+
+    name = "local"
+    # The model already uses every configured thread; run one batch at a time
+    max_concurrency = 1
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+                 threads=LOCAL_EMBEDDING_THREADS):
+        # Imported here so the OpenAI provider does not need torch installed
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def __call__(self, input):
+        vectors = self.model.encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    async def aembed(self, input):
+        return await asyncio.to_thread(self, input)
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": OpenAIEmbeddings,
+    "local": LocalEmbeddings,
+}
+
+
+def get_embedding_function(provider=None):
+    """Create the embedding function for a provider name (EMBEDDING_PROVIDER by default)"""
+    provider = (provider or EMBEDDING_PROVIDER).lower()
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{provider}'. "
+                         f"Choose one of: {', '.join(EMBEDDING_PROVIDERS)}")
+    return EMBEDDING_PROVIDERS[provider]()
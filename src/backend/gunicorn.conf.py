@@ -0,0 +1,58 @@
+"""Pre-fork multi-process serving with gunicorn
+
+Run from src/backend with either app:
+
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+The app is imported once in the master (preload_app), which loads the vector
+index, the BM25 index and the topic matcher before forking WEB_WORKERS
+workers. The workers inherit that memory copy-on-write instead of each
+loading their own copy, and serve requests in parallel on separate cores.
+
+With VECTOR_BACKEND=flat the embeddings are memory-mapped, so all workers
+share one copy through the page cache, and every worker remaps the files
+(and reloads the BM25 index) when setup.py rewrites them. A Chroma
+collection is loaded in the master too, but picks up a re-ingested
+knowledge base only after a full restart of gunicorn (a HUP re-forks the
+workers from the same preloaded master and is not enough); until then
+/readyz fails with state "stale".
+
+Background quiz jobs are recorded in the user database, so a poll for a
+quiz may land on a different worker than the chat that started it.
+"""
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import WEB_BIND, WEB_WORKERS, WEB_THREADS  # noqa: E402
+
+bind = WEB_BIND
+workers = WEB_WORKERS
+threads = WEB_THREADS
+preload_app = True
+
+
+def _app_module(server):
+    """The preloaded module named on the command line (app or asgi)"""
+    return sys.modules[server.cfg.wsgi_app.split(":")[0]]
+
+
+def when_ready(server):
+    # Runs in the master before the first worker is forked
+    module = _app_module(server)
+    if not module.services.wait_ready():
+        server.log.warning("Index not loaded before forking workers: %s", module.services.status().get("error"))
+    module.services.before_fork()
+    module.users.before_fork()
+    # Keep the garbage collector from writing to (and so copying) the
+    # preloaded objects' pages in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    module = _app_module(server)
+    module.users.after_fork()
+    module.services.after_fork()
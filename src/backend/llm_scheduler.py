@@ -0,0 +1,351 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+try:
+    from .config import (LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_QUEUE,
+                         LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_DEADLINES)
+    from .metrics import REGISTRY, LLM_QUEUE_SECONDS, LLM_RETRIES, LLM_SHED
+except ImportError:
+    from config import (LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_QUEUE,
+                        LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_DEADLINES)
+    from metrics import REGISTRY, LLM_QUEUE_SECONDS, LLM_RETRIES, LLM_SHED
+
+# Lower runs first: chat answers and the query embeddings they need, then
+# follow-up quizzes, then background conversation summaries and quiz bank builds
+PRIORITIES = {"answer": 0, "embedding": 0, "quiz": 1, "summary": 2, "quiz_bank": 2}
+
+# Seconds clients are told to wait (Retry-After) when a call is shed
+RETRY_AFTER_SECONDS = 5
+
+
+def openai_retryable_errors():
+    """OpenAI errors worth retrying: rate limits, timeouts and transient server errors"""
+    # Imported here so the servers can handle LLMUnavailable without loading openai at startup
+    import openai
+
+    return (
+        openai.error.RateLimitError,
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+        openai.error.TryAgain,
+        openai.error.APIError,
+    )
+
+
+class LLMUnavailable(Exception):
+    """An LLM call was shed because the queue was full, missed its deadline, or kept failing"""
+
+
+class TokenBucket:
+    """Allows ``per_minute`` units per minute, refilled continuously; 0 means unlimited
+
+    The level may go negative when a call turns out to use more than was
+    reserved for it, which delays the following calls accordingly.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until ``amount`` units are available"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # A single call larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ("kind", "priority", "seq", "tokens", "deadline", "enqueued", "state", "wake")
+
+    def __init__(self, kind, seq, tokens, deadline, wake):
+        self.kind = kind
+        self.priority = PRIORITIES.get(kind, max(PRIORITIES.values()))
+        self.seq = seq
+        self.tokens = tokens
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.state = "waiting"  # then "granted", "expired" or "evicted"
+        self.wake = wake
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """Admission control for outbound OpenAI calls
+
+    Every attempt waits in one priority queue for a free slot (at most
+    ``max_concurrency`` calls in flight) and for room in the requests- and
+    tokens-per-minute buckets. The queue holds at most ``max_queue`` calls;
+    when it is full a new call displaces a queued call of lower priority or
+    is refused. A call that cannot start or retry before its deadline (per
+    kind, see LLM_DEADLINES) fails with LLMUnavailable instead of waiting
+    forever.
+    Retryable errors are retried with exponential backoff and full jitter,
+    honouring Retry-After, without holding a slot while sleeping.
+
+    Threads use ``call``/``stream``; coroutines use ``acall``. Both share the
+    same queue and limits.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_queue=LLM_MAX_QUEUE, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, deadlines=LLM_DEADLINES,
+                 retryable=None):
+        self.retryable = retryable if retryable is not None else openai_retryable_errors()
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadlines = deadlines
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._heap = []
+        self._queued = 0
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _deadline(self, kind):
+        seconds = self.deadlines.get(kind)
+        return time.monotonic() + seconds if seconds else None
+
+    # Queue
+
+    def _enqueue(self, kind, tokens, deadline, wake):
+        with self._lock:
+            waiter = _Waiter(kind, next(self._seq), tokens, deadline, wake)
+            if self._queued >= self.max_queue:
+                queued = [w for w in self._heap if w.state == "waiting"]
+                worst = max(queued, key=lambda w: (w.priority, -w.seq), default=None)
+                if worst is None or worst.priority <= waiter.priority:
+                    LLM_SHED.inc(call=kind, reason="queue_full")
+                    raise LLMUnavailable("Too many LLM requests queued")
+                worst.state = "evicted"
+                self._queued -= 1
+                LLM_SHED.inc(call=worst.kind, reason="queue_full")
+                worst.wake()
+            heapq.heappush(self._heap, waiter)
+            self._queued += 1
+            self._dispatch()
+            return waiter
+
+    def _dispatch(self):
+        """Grant slots to queued calls in priority order; caller holds the lock"""
+        while self._heap:
+            waiter = self._heap[0]
+            if waiter.state != "waiting":
+                heapq.heappop(self._heap)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                return
+            now = time.monotonic()
+            delay = max(self._requests.delay(1, now), self._tokens.delay(waiter.tokens, now))
+            if delay > 0:
+                self._wake_after(delay)
+                return
+            heapq.heappop(self._heap)
+            self._queued -= 1
+            self._requests.take(1)
+            self._tokens.take(waiter.tokens)
+            self._in_flight += 1
+            waiter.state = "granted"
+            LLM_QUEUE_SECONDS.observe(now - waiter.enqueued, call=waiter.kind)
+            waiter.wake()
+
+    def _wake_after(self, delay):
+        """Dispatch again once the buckets have refilled; caller holds the lock"""
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _give_up(self, waiter):
+        """Leave the queue after a timeout or cancellation; returns True if the slot was granted meanwhile"""
+        with self._lock:
+            if waiter.state == "granted":
+                return True
+            if waiter.state == "waiting":
+                waiter.state = "expired"
+                self._queued -= 1
+                LLM_SHED.inc(call=waiter.kind, reason="deadline")
+            return False
+
+    def _release(self, waiter, used_tokens=None):
+        with self._lock:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                # Settle the reservation against the actual usage
+                self._tokens.take(used_tokens - waiter.tokens)
+            self._dispatch()
+
+    def _acquire(self, kind, tokens, deadline):
+        event = threading.Event()
+        waiter = self._enqueue(kind, tokens, deadline, event.set)
+        timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        if not event.wait(timeout) and not self._give_up(waiter):
+            raise LLMUnavailable(f"LLM {kind} request timed out waiting in the queue")
+        if waiter.state == "evicted":
+            raise LLMUnavailable("Too many LLM requests queued")
+        return waiter
+
+    async def _aacquire(self, kind, tokens, deadline):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(kind, tokens, deadline, wake)
+        timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            if not self._give_up(waiter):
+                raise LLMUnavailable(f"LLM {kind} request timed out waiting in the queue")
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self._release(waiter)
+            raise
+        if waiter.state == "evicted":
+            raise LLMUnavailable("Too many LLM requests queued")
+        return waiter
+
+    # Retries
+
+    def _backoff(self, kind, attempt, error, deadline):
+        """Seconds to wait before the next attempt; raises LLMUnavailable when out of attempts or time"""
+        if attempt >= self.max_retries:
+            raise LLMUnavailable(f"LLM {kind} request failed after {attempt + 1} attempts: {error}") from error
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        headers = getattr(error, "headers", None) or {}
+        try:
+            delay = max(delay, float(headers.get("retry-after", 0)))
+        except (TypeError, ValueError):
+            pass
+        if deadline is not None and time.monotonic() + delay > deadline:
+            raise LLMUnavailable(f"LLM {kind} request ran out of time retrying: {error}") from error
+        LLM_RETRIES.inc(call=kind)
+        return delay
+
+    @staticmethod
+    def _used_tokens(response):
+        usage = response.get("usage") if hasattr(response, "get") else None
+        return usage.get("total_tokens") if usage else None
+
+    def call(self, kind, fn, *args, tokens=0, **kwargs):
+        """Run fn(*args, **kwargs) as an LLM call of ``kind`` reserving ``tokens`` tokens"""
+        deadline = self._deadline(kind)
+        for attempt in itertools.count():
+            waiter = self._acquire(kind, tokens, deadline)
+            used_tokens = None
+            try:
+                response = fn(*args, **kwargs)
+                used_tokens = self._used_tokens(response)
+                return response
+            except self.retryable as e:
+                delay = self._backoff(kind, attempt, e, deadline)
+            finally:
+                self._release(waiter, used_tokens)
+            time.sleep(delay)
+
+    async def acall(self, kind, fn, *args, tokens=0, **kwargs):
+        """Async variant of ``call``; fn is a coroutine function"""
+        deadline = self._deadline(kind)
+        for attempt in itertools.count():
+            waiter = await self._aacquire(kind, tokens, deadline)
+            used_tokens = None
+            try:
+                response = await fn(*args, **kwargs)
+                used_tokens = self._used_tokens(response)
+                return response
+            except self.retryable as e:
+                delay = self._backoff(kind, attempt, e, deadline)
+            finally:
+                self._release(waiter, used_tokens)
+            await asyncio.sleep(delay)
+
+    def stream(self, kind, fn, *args, tokens=0, **kwargs):
+        """Iterate a streamed call, holding its slot until the stream ends
+
+        Only failures before the first item are retried.
+        """
+        deadline = self._deadline(kind)
+        for attempt in itertools.count():
+            waiter = self._acquire(kind, tokens, deadline)
+            started = False
+            try:
+                for item in fn(*args, **kwargs):
+                    started = True
+                    yield item
+                return
+            except self.retryable as e:
+                if started:
+                    raise
+                delay = self._backoff(kind, attempt, e, deadline)
+            finally:
+                self._release(waiter)
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queued, "in_flight": self._in_flight}
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker
+
+        The parent's timer thread and the calls it had queued or in flight
+        don't exist in the child, and its lock may have been held at the fork.
+        """
+        self._heap = []
+        self._queued = 0
+        self._in_flight = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_llm_scheduler():
+    """Return the process-wide scheduler, created on first use"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler()
+            REGISTRY.register_collector(_collect_scheduler)
+        return _default_scheduler
+
+
+def _collect_scheduler():
+    stats = _default_scheduler.stats()
+    return [
+        ("securebot_llm_queued", "gauge", "LLM calls waiting for a slot", [({}, stats["queued"])]),
+        ("securebot_llm_in_flight", "gauge", "LLM calls in progress", [({}, stats["in_flight"])]),
+    ]
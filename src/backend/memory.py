@@ -0,0 +1,112 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .config import MEMORY_RECENT_TURNS, MEMORY_FOLD_TURNS, MEMORY_TOKEN_BUDGET
+    from .context import TokenCounter
+except ImportError:
+    from config import MEMORY_RECENT_TURNS, MEMORY_FOLD_TURNS, MEMORY_TOKEN_BUDGET
+    from context import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    """Rolling conversation memory: recent turns verbatim plus a running summary
+
+    Each user carries a ``summary`` of their first ``summarized`` turns. The
+    turns after that are replayed verbatim. Once at least ``fold_turns`` turns
+    have fallen out of the last ``recent_turns``, ``update`` folds them into
+    the summary with one background LLM call (``summarize(summary, turns)``),
+    so the prompt stays the same size however long the session runs. The
+    memory never takes more than ``token_budget`` tokens of a prompt: the
+    oldest verbatim turns are dropped first, then the summary is cut.
+    """
+
+    def __init__(self, summarize, on_summary=None, recent_turns=MEMORY_RECENT_TURNS,
+                 fold_turns=MEMORY_FOLD_TURNS, token_budget=MEMORY_TOKEN_BUDGET, token_counter=None,
+                 max_workers=2):
+        self.summarize = summarize
+        # Called with (user_id, summary, summarized) so the summary can be persisted
+        self.on_summary = on_summary
+        self.recent_turns = recent_turns
+        self.fold_turns = fold_turns
+        self.token_budget = token_budget
+        self.token_counter = token_counter or TokenCounter()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memory")
+        self._folding = set()
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Replace the executor and lock inherited by a forked worker
+
+        The parent's summary threads don't exist in the child; folds they had
+        in progress are dropped and redone by a later ``update``.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="memory")
+        self._folding = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unsummarized(user):
+        """Return (index of the first turn in user.history, the turns not covered by the summary)"""
+        first = user.interactions - len(user.history)
+        return first, list(user.history)[max(user.summarized - first, 0):]
+
+    def messages(self, user):
+        """Return the chat messages that replay the conversation so far"""
+        _, turns = self._unsummarized(user)
+        budget = self.token_budget
+
+        summary = user.summary
+        if summary:
+            # The summary may use at most half of the budget
+            summary = self.token_counter.truncate(summary, budget // 2)
+            budget -= self.token_counter.count(summary)
+
+        kept = []
+        for query, response in reversed(turns):
+            cost = self.token_counter.count(query) + self.token_counter.count(response)
+            if cost > budget:
+                break
+            kept.append((query, response))
+            budget -= cost
+
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": "Summary of the earlier conversation:\n" + summary})
+        for query, response in reversed(kept):
+            messages.append({"role": "user", "content": query})
+            messages.append({"role": "assistant", "content": response})
+        return messages
+
+    def update(self, user):
+        """Fold turns that left the recent window into the summary, in the background"""
+        first, turns = self._unsummarized(user)
+        foldable = turns[:max(len(turns) - self.recent_turns, 0)]
+        if len(foldable) < self.fold_turns:
+            return
+
+        with self._lock:
+            if user.user_id in self._folding:
+                return
+            self._folding.add(user.user_id)
+
+        # Turns that dropped out of user.history before being folded are skipped
+        summarized = max(user.summarized, first) + len(foldable)
+        self._executor.submit(self._fold, user, user.summary, foldable, summarized)
+
+    def _fold(self, user, summary, turns, summarized):
+        try:
+            summary = self.summarize(summary, turns)
+            if summarized > user.summarized:
+                user.summary, user.summarized = summary, summarized
+                if self.on_summary is not None:
+                    self.on_summary(user.user_id, summary, summarized)
+        except Exception:
+            logger.exception("Error updating the conversation summary of %s", user.user_id)
+        finally:
+            with self._lock:
+                self._folding.discard(user.user_id)
@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache hits to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text exposition format
+
+    Besides metrics owned by the registry, collectors are callables returning
+    ``(name, type, help, [(labels dict, value), ...])`` families, read at
+    scrape time (used for counters kept by the caches themselves).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, type, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Content type of the text format served on /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "securebot_stage_seconds", "Time spent in each stage of answering a chat request", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "securebot_http_request_seconds", "HTTP request latency by route and status", ["route", "method", "status"]
+)
+COALESCED = REGISTRY.counter(
+    "securebot_coalesced_requests_total", "Calls that shared an identical in-flight call instead of running", ["call"]
+)
+LLM_QUEUE_SECONDS = REGISTRY.histogram(
+    "securebot_llm_queue_seconds", "Time LLM calls waited for a slot in the outbound scheduler", ["call"]
+)
+LLM_RETRIES = REGISTRY.counter(
+    "securebot_llm_retries_total", "LLM calls retried after a rate limit or transient error", ["call"]
+)
+LLM_SHED = REGISTRY.counter(
+    "securebot_llm_shed_total", "LLM calls refused because the queue was full or their deadline passed",
+    ["call", "reason"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "securebot_llm_tokens_total", "Tokens sent to and received from the LLM", ["call", "kind"]
+)
+
+
+def record_usage(call, prompt_tokens, completion_tokens):
+    """Count the prompt and completion tokens of one LLM call"""
+    LLM_TOKENS.inc(prompt_tokens, call=call, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, call=call, kind="completion")
+
+
+def record_response_usage(call, response):
+    """Count tokens from the ``usage`` block of a (non-streamed) chat completion"""
+    usage = response.get("usage") if hasattr(response, "get") else None
+    if usage:
+        record_usage(call, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+
+_caches = {}
+
+
+def register_cache(name, cache):
+    """Expose a cache's stats() hit/miss counters as securebot_cache_{hits,misses}_total{cache=name}"""
+    if cache is not None:
+        _caches[name] = cache
+
+
+def _collect_caches():
+    stats = {name: cache.stats() for name, cache in _caches.items()}
+    return [
+        ("securebot_cache_hits_total", "counter", "Cache hits",
+         [({"cache": name}, s["hits"]) for name, s in stats.items()]),
+        ("securebot_cache_misses_total", "counter", "Cache misses",
+         [({"cache": name}, s["misses"]) for name, s in stats.items()]),
+    ]
+
+
+REGISTRY.register_collector(_collect_caches)
@@ -1,4 +1,19 @@
+import json
+import os
+from collections import deque
+from urllib.parse import quote
+
+try:
+    from .config import TOPICS, USER_HISTORY_SIZE, USER_HISTORY_SPILL_DIR
+except ImportError:
+    from config import TOPICS, USER_HISTORY_SIZE, USER_HISTORY_SPILL_DIR
+
+
 class User:
+    # Users live for the whole process; slots keep each one small
+    __slots__ = ("user_id", "xp", "rank", "rank_name", "interactions", "history", "spill_path", "summary",
+                 "summarized")
+
     # Define ranks and their XP thresholds
     RANKS = {
         1: {"name": "Security Novice", "threshold": 0},
@@ -8,21 +23,25 @@ class User:
         5: {"name": "Security Master", "threshold": 1000}
     }
     
-    # Define topic access by rank
+    # Define topic access by rank (derived from config.TOPICS)
     TOPIC_ACCESS = {
-        1: ["phishing", "passwords", "basic security", "malware", "social engineering"],
-        2: ["data protection", "email security", "device security", "secure browsing"],
-        3: ["network security", "encryption", "authentication", "security policies"],
-        4: ["incident response", "security audits", "risk assessment", "compliance"],
-        5: ["penetration testing", "advanced threats", "security architecture", "zero trust"]
+        rank: [topic.replace("_", " ") for topic, details in TOPICS.items() if details["rank"] == rank]
+        for rank in range(1, 6)
     }
     
-    def __init__(self, user_id):
+    def __init__(self, user_id, history_size=USER_HISTORY_SIZE, spill_dir=USER_HISTORY_SPILL_DIR):
         self.user_id = user_id
         self.xp = 0
         self.rank = 1
+        self.rank_name = "Security Novice"
         self.interactions = 0
-        self.history = []  # Store previous interactions
+        # Most recent interactions as (query, response) tuples, oldest first
+        self.history = deque(maxlen=history_size)
+        # Older interactions are appended to this JSON-lines file, if set
+        self.spill_path = os.path.join(spill_dir, quote(user_id, safe="") + ".jsonl") if spill_dir else None
+        # Running summary of the first ``summarized`` interactions (see memory.py)
+        self.summary = ""
+        self.summarized = 0
     
     def add_xp(self, points):
         """Add experience points and update rank if necessary"""
@@ -71,9 +90,29 @@ class User:
         return any(t in topic.lower() for t in allowed_topics)
     
     def add_interaction(self, query, response):
-        """Record user interaction"""
+        """Record user interaction, keeping only the most recent ones in memory"""
         self.interactions += 1
-        self.history.append({"query": query, "response": response})
+        if self.spill_path and len(self.history) == self.history.maxlen:
+            self._spill(self.history[0])
+        self.history.append((query, response))
+
+    def _spill(self, interaction):
+        """Append an interaction that is about to leave the in-memory history to the spill file"""
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"query": interaction[0], "response": interaction[1]}) + "\n")
+
+    def load_history(self, interactions):
+        """Replace the in-memory history with (query, response) pairs, oldest first"""
+        self.history.clear()
+        self.history.extend(interactions)
+
+    def recent_history(self, limit=None):
+        """Return up to ``limit`` recent interactions as dicts, oldest first"""
+        interactions = list(self.history)
+        if limit is not None:
+            interactions = interactions[-limit:] if limit > 0 else []
+        return [{"query": query, "response": response} for query, response in interactions]
     
     def to_dict(self):
         """Return user data as dictionary"""
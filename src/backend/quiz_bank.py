@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from .config import QUIZ_BANK_MODEL, QUIZ_BANK_WORKERS, LLM_REQUEST_TIMEOUT, RANKS
+    from .llm_scheduler import get_llm_scheduler
+    from .metrics import record_response_usage
+except ImportError:
+    from config import QUIZ_BANK_MODEL, QUIZ_BANK_WORKERS, LLM_REQUEST_TIMEOUT, RANKS
+    from llm_scheduler import get_llm_scheduler
+    from metrics import record_response_usage
+
+QUIZ_BANK_FILENAME = "quiz_bank.json"
+
+OPTION_LETTERS = "abcd"
+
+# An option line of a generated quiz, e.g. "b) 80", and the letter its answer line starts with
+OPTION_LINE = re.compile(r"([a-d])\)\s*(.*)", re.IGNORECASE)
+ANSWER_LETTER = re.compile(r"([a-d])(?:[).:]|\s|$)", re.IGNORECASE)
+
+# The bank is written to disk after this many newly generated chunks, so an
+# interrupted build keeps its progress
+SAVE_EVERY = 20
+
+
+def quiz_bank_path(db_directory):
+    """Location of the quiz bank for an index; chunk IDs don't depend on the vector backend, so it is shared"""
+    return os.path.join(db_directory, QUIZ_BANK_FILENAME)
+
+
+def public_quiz(quiz):
+    """The part of a stored quiz that is sent to the client (everything but the answer)"""
+    return {
+        "quiz_id": quiz["id"],
+        "question": quiz["question"],
+        "options": [f"{letter}) {option}" for letter, option in zip(OPTION_LETTERS, quiz["options"])],
+        "rank": quiz["rank"],
+    }
+
+
+def format_quiz(quiz):
+    """Render a stored quiz like a generated one, without the answer line"""
+    return "Question: {}\nOptions:\n{}".format(quiz["question"], "\n".join(public_quiz(quiz)["options"]))
+
+
+def parse_generated_quiz(quiz_id, text):
+    """Turn a generated quiz ("Question: ... Options: a) ... Answer: ...") into a stored quiz's shape
+
+    This lets generated quizzes be served and scored like stored ones.
+    Returns None if the text has no answer naming one of its options.
+    """
+    question, options, answer = [], [], None
+    for line in (text or "").splitlines():
+        line = line.strip()
+        option = OPTION_LINE.match(line)
+        if line.lower().startswith("answer:"):
+            answer = ANSWER_LETTER.match(line[len("answer:"):].strip())
+        elif option:
+            options.append(option.group(2))
+        elif line and not line.lower().startswith("options:") and not options:
+            question.append(line[len("question:"):].strip() if line.lower().startswith("question:") else line)
+    index = OPTION_LETTERS.find(answer.group(1).lower()) if answer else -1
+    if not question or not 0 <= index < len(options):
+        return None
+    return {"id": quiz_id, "rank": None, "question": "\n".join(question), "options": options[:len(OPTION_LETTERS)],
+            "answer": index, "explanation": ""}
+
+
+def check_answer(quiz, answer):
+    """True if ``answer`` ("b", "b)" or "b) <option text>") picks the correct option"""
+    answer = answer.strip().lower()
+    return answer[:1] == OPTION_LETTERS[quiz["answer"]] and answer[1:2] in ("", ")")
+
+
+def correct_option(quiz):
+    return public_quiz(quiz)["options"][quiz["answer"]]
+
+
+class QuizBank:
+    """Multiple-choice questions written per chunk and rank at ingestion time
+
+    For every chunk, ``build_quiz_bank`` asks the LLM for one question per
+    rank from the chunk's ``min_rank`` up to the highest rank. The bank is
+    kept in memory and persisted as JSON at ``path``; serving a quiz is a
+    dictionary lookup on the IDs of the retrieved chunks. Like the BM25 index,
+    the file is reloaded when another process (a re-run of setup.py) rewrites
+    it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.quizzes = {}  # quiz_id -> {"id", "chunk_id", "source", "rank", "question", "options", "answer", "explanation"}
+        self.chunks = {}  # chunk_id -> {"rank": min_rank the questions were written for, "quizzes": [quiz_id, ...]}
+        self._lock = threading.Lock()
+        # mtime of the file as last loaded or saved, to notice rewrites by other processes
+        self.mtime = 0
+
+    @classmethod
+    def load(cls, path):
+        """Load a bank from disk, or return an empty one if it doesn't exist"""
+        bank = cls(path)
+        bank._load()
+        return bank
+
+    def _load(self):
+        mtime = self._file_mtime()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {"quizzes": {}, "chunks": {}}
+        with self._lock:
+            self.quizzes = data["quizzes"]
+            self.chunks = data["chunks"]
+            self.mtime = mtime
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self):
+        """Reload the bank if another process rewrote the file since it was loaded or saved"""
+        if self._file_mtime() != self.mtime:
+            self._load()
+
+    def save(self):
+        """Atomically write the bank to disk"""
+        with self._lock:
+            data = {"quizzes": self.quizzes, "chunks": self.chunks}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.mtime = self._file_mtime()
+
+    def __len__(self):
+        return len(self.quizzes)
+
+    def get(self, quiz_id):
+        """Return a stored quiz by ID, or None"""
+        return self.quizzes.get(quiz_id)
+
+    def chunk_rank(self, chunk_id):
+        """The min_rank a chunk's questions were written for, or None if it has none yet"""
+        entry = self.chunks.get(chunk_id)
+        return entry["rank"] if entry is not None else None
+
+    def pick(self, chunk_ids, user_rank):
+        """Pick a quiz for a user from the best-ranked chunk that has one
+
+        Chunk IDs are in retrieval order. Of that chunk's questions the one
+        written for the highest rank the user has reached is returned.
+        """
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self.chunks.get(chunk_id)
+                if entry is None:
+                    continue
+                eligible = [self.quizzes[quiz_id] for quiz_id in entry["quizzes"]
+                            if self.quizzes[quiz_id]["rank"] <= user_rank]
+                if eligible:
+                    return max(eligible, key=lambda quiz: quiz["rank"])
+        return None
+
+    def add(self, chunk_id, source, min_rank, questions):
+        """Store the questions written for a chunk, replacing any earlier ones"""
+        with self._lock:
+            self._remove(chunk_id)
+            quiz_ids = []
+            for question in questions:
+                quiz_id = hashlib.sha256(
+                    f"{chunk_id}\n{question['rank']}\n{question['question']}".encode('utf-8')
+                ).hexdigest()[:16]
+                self.quizzes[quiz_id] = {"id": quiz_id, "chunk_id": chunk_id, "source": source, **question}
+                quiz_ids.append(quiz_id)
+            self.chunks[chunk_id] = {"rank": min_rank, "quizzes": quiz_ids}
+
+    def remove(self, chunk_ids):
+        """Drop the questions of chunks that left the index"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+
+    def _remove(self, chunk_id):
+        """Remove one chunk's questions; caller holds the lock"""
+        entry = self.chunks.pop(chunk_id, None)
+        if entry is not None:
+            for quiz_id in entry["quizzes"]:
+                self.quizzes.pop(quiz_id, None)
+
+
+def _quiz_messages(text, min_rank):
+    """Build the prompt asking for one question per rank from min_rank up"""
+    levels = "\n".join(
+        f"- rank {rank} ({details['name']})" for rank, details in RANKS.items() if rank >= min_rank
+    )
+    prompt = (
+        "Write multiple-choice quiz questions about the following excerpt from a security knowledge base, "
+        "one for each of these learner levels, from beginner (rank 1) to expert (rank 5):\n"
+        f"{levels}\n\n"
+        "Each question must be answerable from the excerpt, have exactly four options and one correct answer.\n\n"
+        f"Excerpt:\n{text}\n\n"
+        'Respond with JSON: {"questions": [{"rank": 1, "question": "...", "options": ["...", "...", "...", "..."], '
+        '"answer": <index of the correct option, 0-3>, "explanation": "..."}]}. '
+        'If the excerpt has nothing worth quizzing on (e.g. a table of contents), respond with {"questions": []}.'
+    )
+    return [
+        {"role": "system", "content": "You are a quiz generator for cybersecurity topics."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _valid_questions(content, min_rank):
+    """Keep the well-formed questions of an LLM response, at most one per rank"""
+    questions = {}
+    for item in json.loads(content).get("questions", []):
+        try:
+            rank, answer = int(item["rank"]), int(item["answer"])
+            options = [str(option).strip() for option in item["options"]]
+            question = str(item["question"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if min_rank <= rank <= max(RANKS) and len(options) == 4 and 0 <= answer < 4 and question:
+            questions.setdefault(rank, {
+                "rank": rank, "question": question, "options": options, "answer": answer,
+                "explanation": str(item.get("explanation", "")).strip()
+            })
+    return [questions[rank] for rank in sorted(questions)]
+
+
+def write_chunk_quizzes(text, min_rank, model=QUIZ_BANK_MODEL):
+    """Ask the LLM for a chunk's questions; returns them as dicts with rank, question, options, answer, explanation"""
+    # Only building the bank calls the API; serving never does
+    import openai
+
+    messages = _quiz_messages(text, min_rank)
+    response = get_llm_scheduler().call(
+        "quiz_bank", openai.ChatCompletion.create, tokens=(len(text) + 3) // 4 + 1500,
+        model=model,
+        messages=messages,
+        max_tokens=1500,
+        temperature=0.5,
+        response_format={"type": "json_object"},
+        request_timeout=LLM_REQUEST_TIMEOUT
+    )
+    record_response_usage("quiz_bank", response)
+    return _valid_questions(response.choices[0].message.content, min_rank)
+
+
+def build_quiz_bank(retriever, max_workers=QUIZ_BANK_WORKERS):
+    """Bring the quiz bank next to a retriever's index in line with its chunks
+
+    Chunks that are new, or whose min_rank changed, get their questions
+    written; the questions of chunks no longer in the index are dropped.
+    Chunks whose questions could not be generated are retried on the next
+    run. Returns (chunks written, chunks removed, chunks failed).
+    """
+    bank = QuizBank.load(quiz_bank_path(retriever.db_directory))
+    stored = retriever.collection.get(include=["documents", "metadatas"])
+    chunks = {
+        chunk_id: (text, metadata)
+        for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+    }
+
+    removed = [chunk_id for chunk_id in bank.chunks if chunk_id not in chunks]
+    bank.remove(removed)
+    pending = [chunk_id for chunk_id, (_, metadata) in chunks.items()
+               if bank.chunk_rank(chunk_id) != metadata.get("min_rank", 1)]
+    print(f"Quiz bank: {len(pending)} chunks to write, {len(removed)} removed, "
+          f"{len(chunks) - len(pending)} unchanged")
+
+    def write(chunk_id):
+        text, metadata = chunks[chunk_id]
+        return write_chunk_quizzes(text, metadata.get("min_rank", 1))
+
+    written = failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(write, chunk_id): chunk_id for chunk_id in pending}
+        for future in as_completed(futures):
+            chunk_id = futures[future]
+            text, metadata = chunks[chunk_id]
+            try:
+                questions = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Could not write quiz questions for {chunk_id}: {type(e).__name__}: {e}")
+                continue
+            bank.add(chunk_id, metadata["source"], metadata.get("min_rank", 1), questions)
+            written += 1
+            if written % SAVE_EVERY == 0:
+                bank.save()
+
+    bank.save()
+    print(f"Quiz bank: {len(bank)} questions for {len(bank.chunks)} chunks")
+    return written, len(removed), failed
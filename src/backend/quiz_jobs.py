@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reads of the shared store while waiting for another worker's job
+POLL_INTERVAL = 0.1
+
+
+class QuizJobs:
+    """Runs follow-up quiz generation in the background
+
+    ``submit`` starts generating a quiz and returns its ID immediately, so the
+    chat response does not wait for the second LLM call. ``result`` returns the
+    quiz once it is ready, optionally waiting for it. Jobs are kept for
+    ``ttl_seconds`` and the oldest are dropped beyond ``max_jobs``.
+
+    With a ``store`` (the UserStore) every job is also recorded in the shared
+    database, so a poll that reaches another worker process than the chat
+    did still finds it.
+    """
+
+    def __init__(self, generate, max_workers=4, ttl_seconds=600, max_jobs=1000, store=None):
+        self.generate = generate
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz")
+        self._jobs = {}  # quiz_id -> (owner, future, created_at)
+        self._lock = threading.Lock()
+
+    def submit(self, owner, *args):
+        """Start generating a quiz for ``owner`` and return its ID"""
+        quiz_id = uuid.uuid4().hex
+        if self.store is not None:
+            self.store.add_quiz_job(quiz_id, owner, time.time() - self.ttl_seconds)
+        future = self._executor.submit(self._run, quiz_id, *args)
+        with self._lock:
+            self._prune()
+            self._jobs[quiz_id] = (owner, future, time.time())
+        return quiz_id
+
+    def _run(self, quiz_id, *args):
+        try:
+            quiz = self.generate(*args)
+        except Exception:
+            logger.exception("Error generating quiz")
+            if self.store is not None:
+                self.store.finish_quiz_job(quiz_id, "failed")
+            raise
+        if self.store is not None:
+            self.store.finish_quiz_job(quiz_id, "ready", quiz)
+        return quiz
+
+    def result(self, quiz_id, owner, wait=0):
+        """Return (status, quiz) for a job, waiting up to ``wait`` seconds
+
+        status is "ready", "pending", "failed" or "missing"; the latter also
+        covers jobs that belong to a different owner.
+        """
+        with self._lock:
+            job = self._jobs.get(quiz_id)
+        if job is None and self.store is not None:
+            return self._stored_result(quiz_id, owner, wait)
+        if job is None or job[0] != owner:
+            return "missing", None
+
+        future = job[1]
+        try:
+            return "ready", future.result(timeout=wait)
+        except TimeoutError:
+            return "pending", None
+        except Exception:
+            return "failed", None
+
+    def _stored_result(self, quiz_id, owner, wait):
+        """Result of a job started by another worker, polling the store for up to ``wait`` seconds"""
+        deadline = time.monotonic() + wait
+        while True:
+            row = self.store.get_quiz_job(quiz_id, owner)
+            if row is None:
+                return "missing", None
+            status, quiz = row
+            if status != "pending" or time.monotonic() >= deadline:
+                return status, quiz
+            time.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    def _prune(self):
+        """Drop expired jobs and the oldest ones beyond max_jobs; caller holds the lock"""
+        cutoff = time.time() - self.ttl_seconds
+        for quiz_id in [quiz_id for quiz_id, job in self._jobs.items() if job[2] < cutoff]:
+            del self._jobs[quiz_id]
+        while len(self._jobs) >= self.max_jobs:
+            del self._jobs[next(iter(self._jobs))]
+
+
+class AsyncQuizJobs:
+    """asyncio counterpart of QuizJobs for the ASGI server
+
+    ``generate`` is a coroutine function; each quiz runs as a task on the
+    event loop instead of occupying a thread. Store access runs in worker
+    threads.
+    """
+
+    def __init__(self, generate, ttl_seconds=600, max_jobs=1000, store=None):
+        self.generate = generate
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.store = store
+        self._jobs = {}  # quiz_id -> (owner, task, created_at)
+        # Strong references to running tasks; the event loop only keeps weak ones,
+        # and a pruned job must still run to completion
+        self._tasks = set()
+
+    async def submit(self, owner, *args):
+        """Start generating a quiz for ``owner`` and return its ID"""
+        self._prune()
+        quiz_id = uuid.uuid4().hex
+        if self.store is not None:
+            await asyncio.to_thread(self.store.add_quiz_job, quiz_id, owner, time.time() - self.ttl_seconds)
+        task = asyncio.ensure_future(self._run(quiz_id, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        self._jobs[quiz_id] = (owner, task, time.time())
+        return quiz_id
+
+    def _task_done(self, task):
+        """Drop a finished task and report its error, so it is never left unretrieved"""
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.exception("Error generating quiz", exc_info=task.exception())
+
+    async def _run(self, quiz_id, *args):
+        try:
+            quiz = await self.generate(*args)
+        except Exception:
+            if self.store is not None:
+                await asyncio.to_thread(self.store.finish_quiz_job, quiz_id, "failed")
+            raise
+        if self.store is not None:
+            await asyncio.to_thread(self.store.finish_quiz_job, quiz_id, "ready", quiz)
+        return quiz
+
+    async def result(self, quiz_id, owner, wait=0):
+        """Return (status, quiz) for a job, waiting up to ``wait`` seconds"""
+        job = self._jobs.get(quiz_id)
+        if job is None and self.store is not None:
+            return await self._stored_result(quiz_id, owner, wait)
+        if job is None or job[0] != owner:
+            return "missing", None
+
+        task = job[1]
+        if not task.done() and wait > 0:
+            await asyncio.wait({task}, timeout=wait)
+        if not task.done():
+            return "pending", None
+        if task.cancelled() or task.exception() is not None:
+            return "failed", None
+        return "ready", task.result()
+
+    async def _stored_result(self, quiz_id, owner, wait):
+        """Async variant of QuizJobs._stored_result"""
+        deadline = time.monotonic() + wait
+        while True:
+            row = await asyncio.to_thread(self.store.get_quiz_job, quiz_id, owner)
+            if row is None:
+                return "missing", None
+            status, quiz = row
+            if status != "pending" or time.monotonic() >= deadline:
+                return status, quiz
+            await asyncio.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    def _prune(self):
+        """Drop expired jobs and the oldest ones beyond max_jobs"""
+        cutoff = time.time() - self.ttl_seconds
+        for quiz_id in [quiz_id for quiz_id, job in self._jobs.items() if job[2] < cutoff]:
+            del self._jobs[quiz_id]
+        while len(self._jobs) >= self.max_jobs:
+            del self._jobs[next(iter(self._jobs))]
@@ -0,0 +1,121 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize(vector):
+    if vector is None:
+        return None
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _normalize_query(query):
+    return " ".join(query.lower().split()) if query else None
+
+
+class SemanticResponseCache:
+    """Cache of generated answers for near-duplicate questions
+
+    An answer is reused only for a query at the same user rank that retrieved
+    exactly the same chunks and whose embedding has a cosine similarity of at
+    least ``similarity_threshold`` with the cached query. Queries answered
+    without an embedding (exact lexical lookups) only match the same
+    normalized query text. Entries expire after
+    ``ttl_seconds``, the least recently used entries are evicted beyond
+    ``max_entries``, and the whole cache is dropped when the knowledge base
+    version changes.
+    """
+
+    def __init__(self, similarity_threshold=0.97, ttl_seconds=3600, max_entries=512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # entry id -> (bucket, unit embedding, query, answer, created_at)
+        self._buckets = {}  # (rank, chunk ids) -> set of entry ids
+        self._next_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bucket(rank, chunk_ids):
+        return rank, tuple(chunk_ids)
+
+    def check_version(self, version):
+        """Invalidate the cache if the knowledge base version changed"""
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._buckets.clear()
+                self._version = version
+
+    def get(self, embedding, rank, chunk_ids, query=None):
+        """Return a cached answer for a similar query, or None"""
+        bucket = self._bucket(rank, chunk_ids)
+        vector = _normalize(embedding)
+        text = _normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                _, cached_vector, cached_text, _, created_at = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                if text is not None and text == cached_text:
+                    score = 1.0
+                elif vector is not None and cached_vector is not None:
+                    score = sum(a * b for a, b in zip(vector, cached_vector))
+                else:
+                    continue
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def put(self, embedding, rank, chunk_ids, query, answer):
+        """Store an answer for a query"""
+        bucket = self._bucket(rank, chunk_ids)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, _normalize(embedding), _normalize_query(query), answer, time.time())
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _remove(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets[bucket]
+        ids.discard(entry_id)
+        if not ids:
+            del self._buckets[bucket]
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached answers"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
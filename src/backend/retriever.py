@@ -1,93 +1,567 @@
 import os
-import chromadb
-from chromadb.utils import embedding_functions
+import asyncio
 import json
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import openai
 
+try:
+    from .config import (EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS, EMBEDDING_CACHE_SIZE,
+                         EMBEDDING_CACHE_PERSIST, EMBEDDING_CACHE_DISK_SIZE, HYBRID_SEARCH,
+                         HYBRID_CANDIDATES, RRF_K, VECTOR_BACKEND, FLAT_INDEX_DTYPE, TOPICS,
+                         CONTEXT_CANDIDATES)
+    from .embedding_cache import EmbeddingCache
+    from .embeddings import get_embedding_function
+    from .bm25 import BM25Index, control_ids
+    from .vector_store import FlatVectorStore, CHUNKS_FILENAME
+    from .topics import get_topic_matcher
+    from .context import ContextAssembler
+    from .metrics import STAGE_SECONDS
+except ImportError:
+    from config import (EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS, EMBEDDING_CACHE_SIZE,
+                        EMBEDDING_CACHE_PERSIST, EMBEDDING_CACHE_DISK_SIZE, HYBRID_SEARCH,
+                        HYBRID_CANDIDATES, RRF_K, VECTOR_BACKEND, FLAT_INDEX_DTYPE, TOPICS,
+                        CONTEXT_CANDIDATES)
+    from embedding_cache import EmbeddingCache
+    from embeddings import get_embedding_function
+    from bm25 import BM25Index, control_ids
+    from vector_store import FlatVectorStore, CHUNKS_FILENAME
+    from topics import get_topic_matcher
+    from context import ContextAssembler
+    from metrics import STAGE_SECONDS
+
 # Load environment variables
 load_dotenv(dotenv_path="config/.env", override=True)
 
+COLLECTION_NAME = "security_documents"
+CHECKPOINT_FILENAME = "ingest_checkpoint.json"
+MANIFEST_FILENAME = "kb_manifest.json"
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+LEXICAL_INDEX_FILENAME = "bm25_index.json"
+
+
 class DocumentRetriever:
-    def __init__(self, db_directory="./data/chroma_db"):
-        """Initialize the document retriever with a vector database"""
-        self.db_directory = db_directory
+    def __init__(self, db_directory="./data/chroma_db", embedding_provider=None, vector_backend=None, create=True):
+        """Initialize the document retriever with a vector database
 
-        # Initialize OpenAI client for embeddings
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        ``embedding_provider`` selects the embedding backend ("openai" or
+        "local"); it defaults to EMBEDDING_PROVIDER from the config.
+        ``vector_backend`` selects the vector index ("chroma" or "flat"); it
+        defaults to VECTOR_BACKEND. With ``create=False`` a missing index is
+        an error instead of being created empty.
+        """
+        self.db_directory = db_directory
+        self.vector_backend = (vector_backend or VECTOR_BACKEND).lower()
+        if self.vector_backend not in ("chroma", "flat"):
+            raise ValueError(f"Unknown vector backend '{self.vector_backend}'. Choose one of: chroma, flat")
 
         # Set up embedding function
-        self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.openai_api_key,
-            model_name="text-embedding-ada-002"
+        self.embedding_function = get_embedding_function(embedding_provider)
+        self.embedding_model = self.embedding_function.model_name
+
+        # Vectors from different providers can't share a collection, so every
+        # provider other than OpenAI gets its own collection and state files
+        self.collection_name = COLLECTION_NAME
+        state_prefix = ""
+        if self.embedding_function.name != "openai":
+            model_slug = "".join(c if c.isalnum() else "_" for c in self.embedding_model)
+            self.collection_name = f"{COLLECTION_NAME}_{model_slug}"[:63]
+            state_prefix = f"{self.collection_name}_"
+
+        # The flat index lives in its own directory and keeps its state files
+        # there, so switching backends never reuses the other one's manifest
+        state_directory = db_directory
+        if self.vector_backend == "flat":
+            state_directory = os.path.join(db_directory, f"{self.collection_name}_flat")
+            state_prefix = ""
+        self.checkpoint_path = os.path.join(state_directory, state_prefix + CHECKPOINT_FILENAME)
+        self.manifest_path = os.path.join(state_directory, state_prefix + MANIFEST_FILENAME)
+        self.lexical_index_path = os.path.join(state_directory, state_prefix + LEXICAL_INDEX_FILENAME)
+
+        # Chunks are tagged with topics and a minimum rank; the tags are redone
+        # whenever config.TOPICS changes
+        self.topic_matcher = get_topic_matcher()
+        self.tag_version = hashlib.sha256(json.dumps(TOPICS, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+        # Merges and trims retrieved chunks into a prompt context of bounded size
+        self.context_assembler = ContextAssembler()
+
+        # Query embeddings go through a cache so repeated questions skip the API call
+        self.query_embedding_cache = EmbeddingCache(
+            self.embedding_function,
+            self.embedding_model,
+            max_entries=EMBEDDING_CACHE_SIZE,
+            db_path=os.path.join(db_directory, EMBEDDING_CACHE_FILENAME) if EMBEDDING_CACHE_PERSIST else None,
+            max_db_entries=EMBEDDING_CACHE_DISK_SIZE
         )
 
-        # Create Chroma client and collection
-        self.client = chromadb.PersistentClient(path=db_directory)
+        if self.vector_backend == "flat":
+            if not create and not os.path.exists(os.path.join(state_directory, CHUNKS_FILENAME)):
+                raise RuntimeError(f"No flat vector index in {state_directory}; run setup.py to build it")
+            self.client = None
+            self.collection = FlatVectorStore(
+                state_directory,
+                name=self.collection_name,
+                dtype=FLAT_INDEX_DTYPE
+            )
+            print(f"Opened flat vector index ({self.collection.count()} chunks)")
+        else:
+            self._open_chroma_collection(create)
+        # The knowledge base version the vector index was opened at, see index_is_stale
+        self.opened_version = self.index_version()
+        # Whether the stored chunks carry min_rank tags, checked on first use
+        self._rank_tags = None
+
+        # BM25 index over the same chunks, kept next to chroma.sqlite3
+        self.lexical_index = BM25Index.load(self.lexical_index_path)
+        if not self.lexical_index.exists() and self.collection.count() > 0:
+            self.rebuild_lexical_index()
+
+    def _open_chroma_collection(self, create=True):
+        """Create the Chroma client and open (or, with ``create``, create) the collection"""
+        # Imported here so the flat backend does not load chromadb at all
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=self.db_directory)
 
         # Try to get the collection if it exists, otherwise create it
         try:
             self.collection = self.client.get_collection(
-                name="security_documents",
+                name=self.collection_name,
                 embedding_function=self.embedding_function
             )
         except Exception:
+            if not create:
+                raise RuntimeError(f"No collection '{self.collection_name}' in {self.db_directory}; "
+                                   "run setup.py to build it")
             # Collection not found, create it
             self.collection = self.client.create_collection(
-                name="security_documents",
+                name=self.collection_name,
                 embedding_function=self.embedding_function
             )
             print("Created new document collection")
         else:
             print("Loaded existing document collection")
 
+    def rebuild_lexical_index(self):
+        """Rebuild the BM25 index from the chunks stored in the collection"""
+        stored = self.collection.get(include=["documents", "metadatas"])
+        self.lexical_index = BM25Index(self.lexical_index_path)
+        self.lexical_index.add(
+            stored["ids"],
+            stored["documents"],
+            [metadata["source"] for metadata in stored["metadatas"]]
+        )
+        self.lexical_index.save()
+        print(f"Built lexical index over {len(stored['ids'])} chunks")
+
+    def add_document(self, doc_path, doc_id, batch_size=None, max_workers=None):
+        """Add a document to the vector store after chunking
 
-    def add_document(self, doc_path, doc_id):
-        """Add a document to the vector store after chunking"""
+        Chunks are embedded in batches of ``batch_size`` with at most
+        ``max_workers`` embedding requests in flight, and each batch is
+        written to the collection with a single call. Completed batches are
+        recorded in a checkpoint file so an interrupted run resumes where it
+        stopped instead of starting over.
+        """
         with open(doc_path, 'r', encoding='utf-8') as f:
             content = f.read()
 
-        # Split document into chunks
+        entries = self._chunk_entries(doc_id, self._split_document(content))
+        self._ingest_chunks(doc_path, doc_id, entries, batch_size, max_workers)
+
+        manifest = self._load_json(self.manifest_path)
+        manifest[doc_id] = self._manifest_entry(content, entries, self.tag_version)
+        self._save_manifest(manifest)
+
+        return len(entries)
+
+    def _split_document(self, content):
+        """Split document text into overlapping chunks"""
+        # Only ingestion needs langchain, so serving never imports it
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
-        chunks = text_splitter.split_text(content)
+        return text_splitter.split_text(content)
 
-        # Add chunks to collection
+    @staticmethod
+    def _chunk_entries(doc_id, chunks):
+        """Return (chunk_id, position, text, content_hash) for each chunk
+
+        IDs are derived from the chunk content rather than its position, so an
+        edit in one part of a document leaves the IDs of the other chunks intact.
+        """
+        entries = []
+        seen = {}
         for i, chunk in enumerate(chunks):
-            self.collection.add(
-                documents=[chunk],
-                metadatas=[{"source": doc_path, "chunk": i}],
-                ids=[f"{doc_id}_chunk_{i}"]
+            chunk_hash = hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:16]
+            occurrence = seen.get(chunk_hash, 0)
+            seen[chunk_hash] = occurrence + 1
+            chunk_id = f"{doc_id}_{chunk_hash}" if occurrence == 0 else f"{doc_id}_{chunk_hash}_{occurrence}"
+            entries.append((chunk_id, i, chunk, chunk_hash))
+        return entries
+
+    @staticmethod
+    def _manifest_entry(content, entries, tag_version):
+        """Manifest record for a document: file hash, tag version plus per-chunk hashes and positions"""
+        return {
+            "digest": hashlib.sha256(content.encode('utf-8')).hexdigest(),
+            "tags": tag_version,
+            "chunks": {
+                chunk_id: {"hash": chunk_hash, "chunk": i}
+                for chunk_id, i, _, chunk_hash in entries
+            }
+        }
+
+    def _chunk_metadata(self, source, position, text):
+        """Metadata stored with a chunk: source and position plus topic tags
+
+        Chroma metadata can't hold lists, so every topic gets a boolean
+        ``topic_<name>`` flag. ``min_rank`` is the rank of the topic the chunk
+        mentions most often (the lower rank on a tie), or 1 if it mentions none.
+        """
+        counts = self.topic_matcher.count(text)
+        ranks = self.topic_matcher.topic_ranks
+        metadata = {"source": source, "chunk": position, "min_rank": 1}
+        if counts:
+            dominant = max(counts, key=lambda topic: (counts[topic], -ranks[topic]))
+            metadata["min_rank"] = ranks[dominant]
+        for topic in ranks:
+            metadata[f"topic_{topic}"] = topic in counts
+        return metadata
+
+    def _ingest_chunks(self, doc_path, doc_id, entries, batch_size=None, max_workers=None):
+        """Embed and store chunk entries in batches, resuming from the checkpoint"""
+        batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        max_workers = max_workers or self.embedding_function.max_concurrency or EMBEDDING_MAX_WORKERS
+
+        # Resume from the checkpoint only if the chunk set and batching are unchanged
+        digest = hashlib.sha256("\n".join(entry[0] for entry in entries).encode('utf-8')).hexdigest()
+        checkpoint = self._load_json(self.checkpoint_path)
+        progress = checkpoint.get(doc_id)
+        if not progress or progress.get("digest") != digest or progress.get("batch_size") != batch_size:
+            progress = {"digest": digest, "batch_size": batch_size, "done": []}
+        done = set(progress["done"])
+        if done:
+            print(f"Resuming {doc_id}: {len(done)} batches already ingested")
+            # The lexical index is only saved once the document is complete
+            for start in done:
+                batch = entries[start:start + batch_size]
+                self.lexical_index.add(
+                    [chunk_id for chunk_id, _, _, _ in batch],
+                    [text for _, _, text, _ in batch],
+                    [doc_path] * len(batch)
+                )
+
+        pending = [start for start in range(0, len(entries), batch_size) if start not in done]
+
+        def embed_batch(start):
+            texts = [entry[2] for entry in entries[start:start + batch_size]]
+            return start, self.embedding_function(texts)
+
+        # Embed concurrently, but keep the number of outstanding batches bounded
+        # and perform all collection writes from this thread
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = set()
+            while pending or in_flight:
+                while pending and len(in_flight) < max_workers * 2:
+                    in_flight.add(executor.submit(embed_batch, pending.pop(0)))
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, embeddings = future.result()
+                    batch = entries[start:start + batch_size]
+                    # upsert keeps a batch that was written just before a crash idempotent
+                    self.collection.upsert(
+                        documents=[text for _, _, text, _ in batch],
+                        embeddings=embeddings,
+                        metadatas=[self._chunk_metadata(doc_path, i, text) for _, i, text, _ in batch],
+                        ids=[chunk_id for chunk_id, _, _, _ in batch]
+                    )
+                    self.lexical_index.add(
+                        [chunk_id for chunk_id, _, _, _ in batch],
+                        [text for _, _, text, _ in batch],
+                        [doc_path] * len(batch)
+                    )
+                    progress["done"].append(start)
+                    checkpoint[doc_id] = progress
+                    self._save_json(self.checkpoint_path, checkpoint)
+
+        # Chunks fully ingested, nothing left to resume
+        self.lexical_index.save()
+        if checkpoint.pop(doc_id, None) is not None:
+            self._save_json(self.checkpoint_path, checkpoint)
+
+    def _load_json(self, path):
+        """Load a JSON state file, or an empty dict if none exists"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_json(self, path, data):
+        """Atomically write a JSON state file"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _save_manifest(self, manifest):
+        """Write the manifest; this process's own re-ingestion keeps its index current"""
+        self._save_json(self.manifest_path, manifest)
+        self.opened_version = self.index_version()
+        self._rank_tags = None
+
+    def embed_query(self, query):
+        """Return the (cached) embedding of a query"""
+        with STAGE_SECONDS.time(stage="query_embedding"):
+            return self.query_embedding_cache([query])[0]
+
+    async def aembed_query(self, query):
+        """Async variant of embed_query (uses the shared aiohttp connection pool for OpenAI)"""
+        with STAGE_SECONDS.time(stage="query_embedding"):
+            return (await self.query_embedding_cache.acall([query], self.embedding_function.aembed))[0]
+
+    def cached_query_embedding(self, query):
+        """Return the query embedding if it is already cached, without computing it"""
+        return self.query_embedding_cache.peek(query)
+
+    def retrieval_filters(self, query, user_rank=None):
+        """Return the ``where`` filters for a query, strictest first
+
+        Chunks above the user's rank are always excluded. If the query names
+        topics, the first filter also restricts the search to chunks tagged
+        with one of them; the second is the rank filter alone, used when the
+        topic filter leaves too few chunks. Without a rank, or on an index
+        built before chunks were tagged, nothing is filtered.
+        """
+        if user_rank is None or not self._has_rank_tags():
+            return [None]
+
+        rank_filter = {"min_rank": {"$lte": user_rank}}
+        topics, _ = self.topic_matcher.match(query)
+        if not topics:
+            return [rank_filter]
+
+        topic_clauses = [{f"topic_{topic}": True} for topic in topics]
+        topic_filter = topic_clauses[0] if len(topic_clauses) == 1 else {"$or": topic_clauses}
+        return [{"$and": [rank_filter, topic_filter]}, rank_filter]
+
+    def _has_rank_tags(self):
+        """True unless the index was built before chunks were tagged with min_rank
+
+        A rank filter would match nothing on such an index, so retrieval is
+        left unfiltered (with a warning) until setup.py retags it.
+        """
+        if self._rank_tags is None:
+            sample = self.collection.get(limit=1, include=["metadatas"])
+            self._rank_tags = not sample["ids"] or "min_rank" in sample["metadatas"][0]
+            if not self._rank_tags:
+                print("The index has no rank tags, so retrieval is not filtered by rank; run setup.py to add them")
+        return self._rank_tags
+
+    def retrieve(self, query, n_results=3, query_embedding=None, user_rank=None):
+        """Return the top matching chunks for a query as dicts with id, document and metadata
+
+        Dense hits are fused with BM25 hits by reciprocal rank. Queries for
+        control identifiers that all occur in the lexical index (e.g. "AC-2(3)")
+        are answered from the lexical index alone, without embedding the query.
+        With ``user_rank`` the search is prefiltered by rank and detected
+        topics (see ``retrieval_filters``).
+        """
+        with STAGE_SECONDS.time(stage="retrieval"):
+            self._refresh_lexical_index()
+            filters = self.retrieval_filters(query, user_rank)
+
+            if not HYBRID_SEARCH:
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
+                return self._search_filtered(query_embedding, n_results, filters)
+
+            lexical = self.lexical_index.search(query, max(n_results, HYBRID_CANDIDATES))
+            if self._is_exact_lookup(query, lexical):
+                return self._fetch([chunk_id for chunk_id, _ in lexical], filters[-1])[:n_results]
+
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            dense = self._search_filtered(query_embedding, max(n_results, HYBRID_CANDIDATES), filters)
+            return self._fuse(dense, lexical, n_results, filters[-1])
+
+    async def aretrieve(self, query, n_results=3, query_embedding=None, user_rank=None):
+        """Async variant of retrieve; index access runs in worker threads"""
+        with STAGE_SECONDS.time(stage="retrieval"):
+            await asyncio.to_thread(self._refresh_lexical_index)
+            filters = self.retrieval_filters(query, user_rank)
+
+            if not HYBRID_SEARCH:
+                if query_embedding is None:
+                    query_embedding = await self.aembed_query(query)
+                return await asyncio.to_thread(self._search_filtered, query_embedding, n_results, filters)
+
+            lexical = await asyncio.to_thread(self.lexical_index.search, query, max(n_results, HYBRID_CANDIDATES))
+            if self._is_exact_lookup(query, lexical):
+                hits = await asyncio.to_thread(self._fetch, [chunk_id for chunk_id, _ in lexical], filters[-1])
+                return hits[:n_results]
+
+            if query_embedding is None:
+                query_embedding = await self.aembed_query(query)
+            dense = await asyncio.to_thread(
+                self._search_filtered, query_embedding, max(n_results, HYBRID_CANDIDATES), filters
             )
+            return await asyncio.to_thread(self._fuse, dense, lexical, n_results, filters[-1])
 
-        return len(chunks)
+    def _refresh_lexical_index(self):
+        """Reload the BM25 index if another process (setup.py, another worker) rewrote it
 
-    def query_documents(self, query, n_results=3):
-        """Retrieve relevant document chunks for a query"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
+        The flat vector store remaps its files the same way; together they let
+        long-running workers pick up a re-ingested knowledge base.
+        """
+        if self.lexical_index.is_stale():
+            self.lexical_index = BM25Index.load(self.lexical_index_path)
+            self._rank_tags = None
+            if self.index_is_stale():
+                # Chroma keeps its vector index in memory and isn't reloaded in place;
+                # /readyz fails until the server is restarted
+                print("The knowledge base was re-ingested; restart the server so the Chroma index picks it up")
+
+    def _is_exact_lookup(self, query, lexical):
+        """True if the query names control identifiers that the lexical index knows"""
+        return bool(lexical) and self.lexical_index.has_terms(control_ids(query))
+
+    def _search(self, query_embedding, n_results, where=None):
+        with STAGE_SECONDS.time(stage="vector_search"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
+            )
+
+        return [
+            {"id": chunk_id, "document": doc, "metadata": metadata}
+            for chunk_id, doc, metadata in zip(results['ids'][0], results['documents'][0], results['metadatas'][0])
+        ]
+
+    def _search_filtered(self, query_embedding, n_results, filters):
+        """Dense search with the strictest filter that still yields n_results hits"""
+        for where in filters:
+            hits = self._search(query_embedding, n_results, where)
+            if len(hits) >= n_results:
+                break
+        return hits
 
-        # Format results for prompt injection
+    def _fetch(self, chunk_ids, where=None):
+        """Load chunks by ID, preserving the given order and dropping those not matching ``where``"""
+        if not chunk_ids:
+            return []
+        stored = self.collection.get(ids=chunk_ids, where=where, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: {"id": chunk_id, "document": doc, "metadata": metadata}
+            for chunk_id, doc, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+    def _fuse(self, dense, lexical, n_results, where=None):
+        """Combine dense hits and (chunk_id, score) lexical hits by reciprocal rank fusion
+
+        Lexical hits are fetched with ``where`` so they obey the same rank
+        filter as the dense search.
+        """
+        scores = {}
+        for rank, hit in enumerate(dense):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, (chunk_id, _) in enumerate(lexical):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        ranked_ids = sorted(scores, key=scores.get, reverse=True)
+        known = {hit["id"]: hit for hit in dense}
+        if where is None:
+            # Unfiltered: only the top n_results can be needed
+            ranked_ids = ranked_ids[:n_results]
+        missing = [chunk_id for chunk_id in ranked_ids if chunk_id not in known]
+        known.update((hit["id"], hit) for hit in self._fetch(missing, where))
+        return [known[chunk_id] for chunk_id in ranked_ids if chunk_id in known][:n_results]
+
+    @staticmethod
+    def format_context(hits):
+        """Format retrieved chunks for prompt injection"""
         retrieved_contexts = []
-        for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-            source = metadata['source']
-            retrieved_contexts.append(f"SOURCE: {source}\nCONTENT: {doc}\n")
+        for hit in hits:
+            source = hit["metadata"]['source']
+            retrieved_contexts.append(f"SOURCE: {source}\nCONTENT: {hit['document']}\n")
 
         return "\n".join(retrieved_contexts)
 
-    def add_security_knowledge_base(self, knowledge_dir="./data/knowledge_base"):
-        """Add all documents from the security knowledge base directory"""
+    def build_context(self, hits, user_rank=1):
+        """Assemble hits into a context within the rank's token budget; returns (context, chunk IDs used)"""
+        with STAGE_SECONDS.time(stage="context"):
+            return self.context_assembler.assemble(hits, user_rank)
+
+    def query_documents(self, query, n_results=CONTEXT_CANDIDATES, user_rank=None):
+        """Retrieve relevant document chunks for a query, prefiltered for the user's rank if given
+
+        The chunks are merged, deduplicated and trimmed to the rank's token
+        budget (rank 1's budget without a rank).
+        """
+        context, _ = self.build_context(self.retrieve(query, n_results, user_rank=user_rank), user_rank or 1)
+        return context
+
+    def warmup(self):
+        """Load the vector index and tokenizer ahead of the first query; returns the number of chunks
+
+        The search uses a stored vector as the query, so no embedding API
+        call is made.
+        """
+        count = self.collection.count()
+        if count:
+            sample = self.collection.get(limit=1, include=["embeddings"])
+            self._search(list(sample["embeddings"][0]), 1)
+        self.context_assembler.token_counter.count("warmup")
+        return count
+
+    def before_fork(self):
+        """Close handles that forked worker processes must not inherit"""
+        self.query_embedding_cache.close()
+
+    def after_fork(self):
+        """Reopen per-process handles in a forked worker"""
+        self.query_embedding_cache.reopen()
+
+    def index_version(self):
+        """Return a token that changes whenever the knowledge base is re-ingested"""
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def index_is_stale(self):
+        """True if another process re-ingested the knowledge base behind an open Chroma collection
+
+        The flat store and the BM25 index are reloaded in place, but Chroma
+        keeps its vector index in memory, so only a restart picks it up.
+        """
+        return self.vector_backend == "chroma" and self.index_version() != self.opened_version
+
+    def add_security_knowledge_base(self, knowledge_dir="./data/knowledge_base", incremental=False):
+        """Add all documents from the security knowledge base directory
+
+        With ``incremental=True`` only the chunks that changed since the last
+        run are embedded; see ``sync_knowledge_base``.
+        """
         if not os.path.exists(knowledge_dir):
             os.makedirs(knowledge_dir)
             print(f"Created directory {knowledge_dir}")
             print("Please add security documents to this directory and run this method again")
             return False
 
+        if incremental:
+            return self.sync_knowledge_base(knowledge_dir)
+
         doc_count = 0
         for filename in os.listdir(knowledge_dir):
             if filename.endswith('.txt') or filename.endswith('.md'):
@@ -100,4 +574,85 @@ class DocumentRetriever:
             print("No documents found in knowledge base directory")
             return False
 
-        return True
\ No newline at end of file
+        return True
+
+    def sync_knowledge_base(self, knowledge_dir="./data/knowledge_base", batch_size=None, max_workers=None):
+        """Bring the collection in line with the knowledge base directory
+
+        A manifest of per-file and per-chunk content hashes is kept next to the
+        database. Unchanged files are skipped, edited files only have their new
+        chunks embedded and their stale chunks deleted, and the chunks of files
+        that were removed from the directory are deleted.
+        """
+        if not os.path.exists(knowledge_dir):
+            print(f"Knowledge base directory {knowledge_dir} does not exist")
+            return False
+
+        manifest = self._load_json(self.manifest_path)
+        present = set()
+
+        for filename in sorted(os.listdir(knowledge_dir)):
+            if not (filename.endswith('.txt') or filename.endswith('.md')):
+                continue
+            present.add(filename)
+            file_path = os.path.join(knowledge_dir, filename)
+
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            previous = manifest.get(filename)
+            if previous and previous["digest"] == hashlib.sha256(content.encode('utf-8')).hexdigest() \
+                    and previous.get("tags") == self.tag_version:
+                print(f"Unchanged {filename}")
+                continue
+
+            if previous is None:
+                # Not tracked yet: drop anything an untracked earlier build stored for this file
+                self.collection.delete(where={"source": file_path})
+                self.lexical_index.remove_source(file_path)
+                old_chunks = {}
+            else:
+                old_chunks = previous["chunks"]
+
+            entries = self._chunk_entries(filename, self._split_document(content))
+            new_ids = {entry[0] for entry in entries}
+
+            stale = [chunk_id for chunk_id in old_chunks if chunk_id not in new_ids]
+            if stale:
+                self.collection.delete(ids=stale)
+                self.lexical_index.remove(stale)
+
+            # Chunks whose text is unchanged keep their embedding; only their position
+            # (or, after a change to config.TOPICS, their tags) may need updating
+            retag = previous is not None and previous.get("tags") != self.tag_version
+            moved = [entry for entry in entries
+                     if entry[0] in old_chunks and (retag or old_chunks[entry[0]]["chunk"] != entry[1])]
+            if moved:
+                self.collection.update(
+                    ids=[chunk_id for chunk_id, _, _, _ in moved],
+                    metadatas=[self._chunk_metadata(file_path, i, text) for _, i, text, _ in moved]
+                )
+
+            fresh = [entry for entry in entries if entry[0] not in old_chunks]
+            self._ingest_chunks(file_path, filename, fresh, batch_size, max_workers)
+
+            manifest[filename] = self._manifest_entry(content, entries, self.tag_version)
+            self._save_manifest(manifest)
+            print(f"Synced {filename}: {len(fresh)} chunks embedded, {len(stale)} removed, "
+                  f"{len(entries) - len(fresh)} unchanged")
+
+        for filename in [name for name in manifest if name not in present]:
+            removed = list(manifest[filename]["chunks"])
+            if removed:
+                self.collection.delete(ids=removed)
+                self.lexical_index.remove(removed)
+                self.lexical_index.save()
+            del manifest[filename]
+            self._save_manifest(manifest)
+            print(f"Removed {filename} with {len(removed)} chunks")
+
+        if not present:
+            print("No documents found in knowledge base directory")
+            return False
+
+        return True
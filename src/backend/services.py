@@ -0,0 +1,149 @@
+import threading
+import time
+
+try:
+    from .config import DB_DIRECTORY
+    from .metrics import register_cache
+except ImportError:
+    from config import DB_DIRECTORY
+    from metrics import register_cache
+
+
+class ServicesUnavailable(Exception):
+    """The retriever and chatbot could not be built (e.g. the knowledge base is missing)"""
+
+
+class Services:
+    """The retriever and chatbot, built on first use instead of at import time
+
+    Importing the server only loads Flask/Starlette and the user store, so the
+    process can answer health checks right away. The retriever and chatbot
+    (and with them chromadb and openai) are built by the first request that
+    needs them, or ahead of time by ``warmup``, which also loads the vector
+    index and tokenizer. The index is opened with ``create=False``: a missing
+    knowledge base is reported by ``status`` rather than replaced by an empty
+    collection, and building is retried on the next use.
+
+    ``state`` is "cold", "loading", "loaded" (built but not warmed up),
+    "warming", "ready" or "failed". ``status`` reports a ready Chroma-backed
+    process as "stale", and not ready, once the knowledge base was
+    re-ingested behind it; it keeps serving the old index until restarted.
+    """
+
+    def __init__(self, on_summary=None, db_directory=DB_DIRECTORY):
+        self.on_summary = on_summary
+        self.db_directory = db_directory
+        self.state = "cold"
+        self.error = None
+        self.chunks = None
+        self.started = time.time()
+        self.ready_seconds = None
+        self._retriever = None
+        self._chatbot = None
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+
+    @property
+    def loaded(self):
+        """True once the chatbot is built, so using it will not block"""
+        return self._chatbot is not None
+
+    @property
+    def retriever(self):
+        if self._retriever is None:
+            self._build()
+        return self._retriever
+
+    @property
+    def chatbot(self):
+        if self._chatbot is None:
+            self._build()
+        return self._chatbot
+
+    def _build(self):
+        with self._lock:
+            if self._chatbot is not None:
+                return
+            self.state = "loading"
+            try:
+                # Deferred: these pull in openai, chromadb and the embedding provider
+                try:
+                    from .retriever import DocumentRetriever
+                    from .chatbot import SecurityChatbot
+                except ImportError:
+                    from retriever import DocumentRetriever
+                    from chatbot import SecurityChatbot
+
+                retriever = DocumentRetriever(db_directory=self.db_directory, create=False)
+                chatbot = SecurityChatbot(retriever, on_summary=self.on_summary)
+            except Exception as e:
+                self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+                raise ServicesUnavailable(self.error) from e
+
+            register_cache("query_embedding", retriever.query_embedding_cache)
+            register_cache("response", chatbot.response_cache)
+            self._retriever, self._chatbot = retriever, chatbot
+            self.state, self.error = "loaded", None
+
+    def warmup(self):
+        """Build everything and load the vector index; returns True if the services are ready"""
+        try:
+            retriever = self.retriever
+            self.state = "warming"
+            self.chunks = retriever.warmup()
+        except ServicesUnavailable:
+            print(f"Warmup failed: {self.error}")
+            return False
+        except Exception as e:
+            self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+            print(f"Warmup failed: {self.error}")
+            return False
+
+        self.state = "ready"
+        self.ready_seconds = round(time.time() - self.started, 3)
+        print(f"Ready in {self.ready_seconds}s ({self.chunks} chunks)")
+        return True
+
+    def start_warmup(self):
+        """Run ``warmup`` in a background thread unless it is running or done"""
+        with self._lock:
+            if self.state == "ready" or (self._warmup_thread is not None and self._warmup_thread.is_alive()):
+                return
+            self._warmup_thread = threading.Thread(target=self.warmup, name="warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def wait_ready(self, timeout=None):
+        """Warm up (or wait for the running warmup) and return True if the services are ready"""
+        self.start_warmup()
+        thread = self._warmup_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.state == "ready"
+
+    def before_fork(self):
+        """Prepare the parent of a pre-fork server; workers inherit the loaded index"""
+        if self._retriever is not None:
+            self._retriever.before_fork()
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker"""
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        if self._retriever is not None:
+            self._retriever.after_fork()
+        if self._chatbot is not None:
+            self._chatbot.after_fork()
+
+    def status(self):
+        """Readiness details for /readyz"""
+        status = {"ready": self.state == "ready", "state": self.state}
+        if status["ready"] and self._retriever.index_is_stale():
+            status.update(ready=False, state="stale",
+                          error="The knowledge base was re-ingested; restart the server so the Chroma index picks it up")
+        if self.chunks is not None:
+            status["chunks"] = self.chunks
+        if self.ready_seconds is not None:
+            status["ready_seconds"] = self.ready_seconds
+        if self.error:
+            status["error"] = self.error
+        return status
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+try:
+    from .metrics import COALESCED
+except ImportError:
+    from metrics import COALESCED
+
+# Marks the end of a broadcast stream
+_DONE = object()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one
+
+    While a call for ``key`` is in flight, further calls with the same key
+    wait for it and get its result (or its exception) instead of running
+    again. Nothing is kept once the call finishes; reusing finished results
+    is the job of the response cache. ``name`` labels the coalesced calls in
+    the metrics.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> Future or _Broadcast
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Return fn(*args), sharing the call with concurrent callers using the same key"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            COALESCED.inc(call=self.name)
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._leave(key, future)
+
+    def stream(self, key, fn, *args):
+        """Iterate fn(*args), sharing one run of the generator between concurrent callers
+
+        The generator runs in its own thread and every caller, including
+        the first, replays its items from the start as they are produced. A
+        caller that stops early does not cut the stream short for the rest.
+        """
+        with self._lock:
+            broadcast = self._calls.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._calls[key] = _Broadcast()
+
+        if leader:
+            threading.Thread(target=self._pump, args=(key, broadcast, fn, args),
+                             name=f"{self.name}-stream", daemon=True).start()
+        else:
+            COALESCED.inc(call=self.name)
+        return broadcast.follow()
+
+    def _pump(self, key, broadcast, fn, args):
+        try:
+            for item in fn(*args):
+                broadcast.publish(item)
+        except BaseException as e:
+            broadcast.finish(e)
+        else:
+            broadcast.finish()
+        finally:
+            self._leave(key, broadcast)
+
+    def _leave(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+
+class _Broadcast:
+    """Items of one generator run, replayed to any number of followers"""
+
+    def __init__(self):
+        self.items = []
+        self.error = None
+        self._changed = threading.Condition()
+
+    def publish(self, item):
+        with self._changed:
+            self.items.append(item)
+            self._changed.notify_all()
+
+    def finish(self, error=None):
+        with self._changed:
+            self.error = error
+            self.items.append(_DONE)
+            self._changed.notify_all()
+
+    def follow(self):
+        position = 0
+        while True:
+            with self._changed:
+                while position == len(self.items):
+                    self._changed.wait()
+                items = self.items[position:]
+            position += len(items)
+            for item in items:
+                if item is _DONE:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield item
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for the ASGI server
+
+    The shared call runs as a task, so a caller that is cancelled (e.g. the
+    client disconnected) does not cancel it for the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}  # key -> Task
+
+    async def do(self, key, fn, *args):
+        """Return await fn(*args), sharing the call with concurrent callers using the same key"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._leave(key, done))
+        else:
+            COALESCED.inc(call=self.name)
+        return await asyncio.shield(task)
+
+    def _leave(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
@@ -0,0 +1,54 @@
+from bm25 import BM25Index, control_ids, tokenize
+
+
+def test_control_ids_are_normalized():
+    assert control_ids("See AC-02 (3) and sc-7") == ["ac-2", "ac-2(3)", "sc-7"]
+    assert "ac-2(3)" in tokenize("Enhancement AC-2(3) applies")
+
+
+def index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25_index.json"))
+    index.add(["a0", "a1", "b0"],
+              ["account management AC-2", "password rotation policy", "firewall rules SC-7 password"],
+              ["a.md", "a.md", "b.md"])
+    return index
+
+
+def test_search_ranks_by_bm25(tmp_path):
+    hits = index(tmp_path).search("password rotation", 10)
+    assert [chunk_id for chunk_id, _ in hits] == ["a1", "b0"]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_index_survives_a_reload(tmp_path):
+    original = index(tmp_path)
+    original.save()
+
+    loaded = BM25Index.load(original.path)
+
+    assert not loaded.is_stale()
+    assert loaded.search("sc-7", 10) == original.search("sc-7", 10)
+    assert loaded.has_terms(["ac-2", "sc-7"]) and not loaded.has_terms(["ac-3"])
+
+
+def test_rewrite_by_another_process_makes_an_index_stale(tmp_path):
+    first = index(tmp_path)
+    first.save()
+    loaded = BM25Index.load(first.path)
+
+    first.add(["c0"], ["new chunk"], ["c.md"])
+    first.save()
+
+    assert loaded.is_stale()
+    assert BM25Index.load(first.path).search("new", 10)[0][0] == "c0"
+
+
+def test_removed_chunks_leave_no_postings(tmp_path):
+    removed = index(tmp_path)
+    removed.remove(["a1"])
+    removed.remove_source("b.md")
+
+    assert set(removed.lengths) == {"a0"}
+    assert removed.search("password", 10) == []
+    assert "password" not in removed.postings and not removed.has_terms(["sc-7"])
+    assert removed._total_length == removed.lengths["a0"]
@@ -0,0 +1,106 @@
+import sys
+import types
+
+import pytest
+
+from context import MIN_OVERLAP_CHARS, ContextAssembler, TokenCounter, merge_overlap
+
+
+def offline_tiktoken(error):
+    """A tiktoken module whose encodings can't be fetched"""
+    module = types.ModuleType("tiktoken")
+
+    def fail(*args, **kwargs):
+        raise error
+
+    module.encoding_for_model = fail
+    module.get_encoding = fail
+    return module
+
+
+@pytest.mark.parametrize("error", [ConnectionError("offline"), KeyError("gpt-x"), OSError("read-only cache")])
+def test_token_counter_falls_back_to_estimate(monkeypatch, error):
+    monkeypatch.setitem(sys.modules, "tiktoken", offline_tiktoken(error))
+    counter = TokenCounter("gpt-x")
+
+    assert counter._encoding is None
+    assert counter.count("x" * 10) == 3
+    assert counter.truncate("abcdefghij", 2) == "abcdefgh"
+    assert counter.truncate("abcdefghij", 0) == ""
+
+
+def estimating_counter(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", offline_tiktoken(ConnectionError()))
+    return TokenCounter()
+
+
+def test_merge_overlap_drops_repeated_text():
+    overlap = "the splitter repeats this sentence. "
+    assert merge_overlap("Intro. " + overlap, overlap + "Rest.") == "Intro. " + overlap + "Rest."
+
+
+def test_merge_overlap_ignores_short_coincidences():
+    first, second = "ends with abc", "abc starts"
+    assert len("abc") < MIN_OVERLAP_CHARS
+    assert merge_overlap(first, second) == first + "\n" + second
+
+
+def hit(chunk_id, source, chunk, text):
+    return {"id": chunk_id, "document": text, "metadata": {"source": source, "chunk": chunk}}
+
+
+def test_consecutive_chunks_are_merged(monkeypatch):
+    overlap = "x" * MIN_OVERLAP_CHARS
+    assembler = ContextAssembler(budgets={1: 1000}, token_counter=estimating_counter(monkeypatch))
+    hits = [
+        hit("a2", "a.md", 2, overlap + " second part of the passage"),
+        hit("b0", "b.md", 0, "another source entirely"),
+        hit("a1", "a.md", 1, "first part of the passage " + overlap),
+    ]
+
+    context, ids = assembler.assemble(hits)
+
+    assert ids == ["a1", "a2", "b0"]
+    assert context.count("SOURCE: a.md") == 1
+    assert "first part of the passage " + overlap + " second part" in context
+
+
+def test_near_duplicates_are_dropped(monkeypatch):
+    text = "multi factor authentication stops most password spraying attacks on accounts"
+    assembler = ContextAssembler(budgets={1: 1000}, token_counter=estimating_counter(monkeypatch))
+
+    _, ids = assembler.assemble([hit("a", "a.md", 0, text), hit("b", "b.md", 5, text + " today")])
+
+    assert ids == ["a"]
+
+
+def test_budget_trims_last_passage(monkeypatch):
+    counter = estimating_counter(monkeypatch)
+    first = "alpha " * 100
+    second = "beta gamma delta " * 100
+    budget = counter.count(ContextAssembler.format_passage("a.md", first)) + 80
+    assembler = ContextAssembler(budgets={1: budget}, token_counter=counter)
+
+    context, ids = assembler.assemble([hit("a", "a.md", 0, first), hit("b", "b.md", 0, second)])
+
+    assert ids == ["a", "b"]
+    assert counter.count(context) <= budget + 1
+    assert second not in context and "beta gamma" in context
+
+
+def test_budget_skips_passage_without_room(monkeypatch):
+    counter = estimating_counter(monkeypatch)
+    first = "alpha " * 100
+    budget = counter.count(ContextAssembler.format_passage("a.md", first)) + 10
+    assembler = ContextAssembler(budgets={1: budget}, token_counter=counter)
+
+    context, ids = assembler.assemble([hit("a", "a.md", 0, first), hit("b", "b.md", 0, "beta " * 100)])
+
+    assert ids == ["a"]
+    assert "beta" not in context
+
+
+def test_unknown_rank_uses_lowest_budget():
+    assembler = ContextAssembler(budgets={1: 100, 3: 300}, token_counter=object())
+    assert assembler.budget(3) == 300
+    assert assembler.budget(7) == 100
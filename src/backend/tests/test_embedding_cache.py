@@ -0,0 +1,117 @@
+import asyncio
+import sqlite3
+import threading
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+
+class FakeEmbedding:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_memory_tier_and_normalized_keys():
+    embed = FakeEmbedding()
+    cache = EmbeddingCache(embed, "model")
+
+    assert cache(["Hello  World", "other"]) == [[12.0, 1.0], [5.0, 1.0]]
+    assert cache(["hello world"]) == [[12.0, 1.0]]
+    assert embed.calls == [["Hello  World", "other"]]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = EmbeddingCache(FakeEmbedding(), "model", db_path=path)
+    first(["persisted"])
+    first.close()
+
+    embed = FakeEmbedding()
+    second = EmbeddingCache(embed, "model", db_path=path)
+    assert second(["persisted"]) == [[9.0, 1.0]]
+    assert embed.calls == []
+    assert second.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_is_trimmed_when_full(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(FakeEmbedding(), "model", max_entries=1, db_path=path, max_db_entries=10)
+    for i in range(25):
+        cache([f"text {i}"])
+
+    count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert count <= 10
+    assert cache._db_count == count
+    # The most recent entries are the ones kept
+    embed = FakeEmbedding()
+    cache.embedding_function = embed
+    cache(["text 24"])
+    assert embed.calls == []
+
+
+class LockedConnection:
+    """A connection to a database another worker keeps locked"""
+
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def rollback(self):
+        pass
+
+
+def test_locked_database_counts_as_a_miss(tmp_path):
+    embed = FakeEmbedding()
+    cache = EmbeddingCache(embed, "model", db_path=str(tmp_path / "cache.sqlite3"))
+    cache._db = LockedConnection()
+
+    assert cache(["text"]) == [[4.0, 1.0]]
+    assert cache(["text"]) == [[4.0, 1.0]]
+    assert embed.calls == [["text"]]
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_hits_touch_last_used_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "TOUCH_BATCH", 2)
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(FakeEmbedding(), "model", max_entries=0, db_path=path)
+    cache(["a", "b"])
+    db = sqlite3.connect(path)
+    before = dict(db.execute("SELECT key, last_used FROM embeddings"))
+
+    cache(["a"])
+    assert dict(db.execute("SELECT key, last_used FROM embeddings")) == before
+    cache(["b"])
+    after = dict(db.execute("SELECT key, last_used FROM embeddings"))
+    assert all(after[key] >= before[key] for key in before) and after != before
+
+
+def test_acall_reads_and_writes_the_disk_tier_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(FakeEmbedding(), "model", db_path=path)(["stored"])
+    cache = EmbeddingCache(FakeEmbedding(), "model", db_path=path)
+    threads = []
+
+    def recording(method):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+        return wrapper
+
+    for name in ("_lookup_disk", "_store_disk"):
+        monkeypatch.setattr(cache, name, recording(getattr(cache, name)))
+    embed = FakeEmbedding()
+
+    async def async_embed(texts):
+        return embed(texts)
+
+    results = asyncio.run(cache.acall(["stored", "new"], async_embed))
+
+    assert results == [[6.0, 1.0], [3.0, 1.0]]
+    assert embed.calls == [["new"]]
+    assert len(threads) == 2 and threading.get_ident() not in threads
+    assert cache.stats()["disk_hits"] == 1
@@ -0,0 +1,143 @@
+import time
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import LLMScheduler, LLMUnavailable, TokenBucket
+
+
+class Transient(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("try again")
+        self.headers = {"retry-after": retry_after} if retry_after is not None else {}
+
+
+def scheduler(**kwargs):
+    options = {"max_concurrency": 2, "requests_per_minute": 0, "tokens_per_minute": 0, "max_queue": 10,
+               "max_retries": 3, "backoff_base": 0.0, "backoff_max": 0.0, "deadlines": {},
+               "retryable": (Transient,)}
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(10 ** 9)
+    assert bucket.delay(10 ** 9, time.monotonic()) == 0.0
+
+
+def test_bucket_refills_continuously():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.delay(1, now) == pytest.approx(1.0)
+    assert bucket.delay(30, now) == pytest.approx(30.0)
+    assert bucket.delay(30, now + 30) == pytest.approx(0.0)
+    assert bucket.delay(1, now + 1000) == 0.0
+    assert bucket.level == 60
+
+
+def test_bucket_waits_for_a_full_bucket_at_most():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.delay(1000, now) == pytest.approx(60.0)
+
+
+def test_bucket_overdraft_delays_later_calls():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(90)
+    assert bucket.delay(1, now) == pytest.approx(31.0)
+
+
+def test_backoff_uses_full_jitter(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    s = scheduler(backoff_base=0.5, backoff_max=3.0)
+
+    delays = [s._backoff("answer", attempt, Transient(), None) for attempt in range(3)]
+
+    assert delays == [0.5, 1.0, 2.0]
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0)]
+    assert s._backoff("answer", 2, Transient(), None) <= 3.0
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: high)
+    s = scheduler(backoff_base=1.0, backoff_max=3.0, max_retries=10)
+    assert s._backoff("answer", 8, Transient(), None) == 3.0
+
+
+def test_backoff_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.random, "uniform", lambda low, high: 0.0)
+    s = scheduler()
+    assert s._backoff("answer", 0, Transient(retry_after="7"), None) == 7.0
+    assert s._backoff("answer", 0, Transient(retry_after="soon"), None) == 0.0
+
+
+def test_backoff_gives_up_after_max_retries():
+    s = scheduler(max_retries=2)
+    with pytest.raises(LLMUnavailable, match="after 3 attempts"):
+        s._backoff("answer", 2, Transient(), None)
+
+
+def test_backoff_gives_up_past_deadline():
+    s = scheduler()
+    with pytest.raises(LLMUnavailable, match="ran out of time"):
+        s._backoff("answer", 0, Transient(retry_after="5"), time.monotonic() + 1)
+
+
+def test_call_retries_transient_errors():
+    s = scheduler()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Transient()
+        return "ok"
+
+    assert s.call("answer", flaky) == "ok"
+    assert len(attempts) == 3
+    assert s.stats() == {"queued": 0, "in_flight": 0}
+
+
+def test_call_does_not_retry_other_errors():
+    s = scheduler()
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        s.call("answer", broken)
+    assert len(attempts) == 1
+    assert s.stats() == {"queued": 0, "in_flight": 0}
+
+
+def test_stream_is_not_retried_once_started():
+    s = scheduler()
+
+    def stream():
+        yield "first"
+        raise Transient()
+
+    received = []
+    with pytest.raises(Transient):
+        for item in s.stream("answer", stream):
+            received.append(item)
+    assert received == ["first"]
+    assert s.stats() == {"queued": 0, "in_flight": 0}
+
+
+def test_after_fork_drops_the_parents_queue_and_lock():
+    s = scheduler()
+    s._lock.acquire()
+    s._queued, s._in_flight = 3, 2
+
+    s.after_fork()
+
+    assert s.stats() == {"queued": 0, "in_flight": 0}
+    assert s.call("answer", lambda: "ok") == "ok"
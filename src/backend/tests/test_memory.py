@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from memory import ConversationMemory
+
+
+def test_after_fork_folds_again():
+    summaries = []
+    memory = ConversationMemory(lambda summary, turns: summaries.append(turns) or "summary",
+                                recent_turns=1, fold_turns=1, token_counter=object())
+    user = SimpleNamespace(user_id="alice", interactions=3, history=[("q1", "a1"), ("q2", "a2"), ("q3", "a3")],
+                           summary="", summarized=0)
+    # A fold that was running in the parent when the worker was forked
+    memory._folding.add("alice")
+    memory._lock.acquire()
+
+    memory.after_fork()
+    memory.update(user)
+    memory._executor.shutdown(wait=True)
+
+    assert summaries == [[("q1", "a1"), ("q2", "a2")]]
+    assert user.summary == "summary" and user.summarized == 2
+
+
+def test_failed_fold_is_logged_and_can_run_again(caplog):
+    def summarize(summary, turns):
+        raise RuntimeError("summary model unavailable")
+
+    memory = ConversationMemory(summarize, recent_turns=1, fold_turns=1, token_counter=object())
+    user = SimpleNamespace(user_id="alice", interactions=2, history=[("q1", "a1"), ("q2", "a2")],
+                           summary="", summarized=0)
+
+    memory.update(user)
+    memory._executor.shutdown(wait=True)
+
+    assert "alice" in caplog.text and "summary model unavailable" in caplog.text
+    assert user.summarized == 0 and "alice" not in memory._folding
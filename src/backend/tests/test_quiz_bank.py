@@ -0,0 +1,82 @@
+import pytest
+
+from quiz_bank import QuizBank, check_answer, correct_option, parse_generated_quiz, public_quiz
+
+QUIZ = {"id": "q1", "rank": 2, "question": "Which port does HTTPS use?", "options": ["21", "80", "443", "8080"],
+        "answer": 2, "explanation": "HTTPS defaults to port 443."}
+
+
+@pytest.mark.parametrize("answer", ["c", "C", " c ", "c)", "c) 443", "C) anything after the letter"])
+def test_check_answer_accepts_the_correct_letter(answer):
+    assert check_answer(QUIZ, answer)
+
+
+@pytest.mark.parametrize("answer", ["", "a", "b) 80", "d", "cc", "c443", "443", ")c"])
+def test_check_answer_rejects_anything_else(answer):
+    assert not check_answer(QUIZ, answer)
+
+
+def test_public_quiz_leaves_out_the_answer():
+    public = public_quiz(QUIZ)
+    assert public == {"quiz_id": "q1", "question": QUIZ["question"],
+                      "options": ["a) 21", "b) 80", "c) 443", "d) 8080"], "rank": 2}
+    assert correct_option(QUIZ) == "c) 443"
+
+
+GENERATED = ("Question: Which practice best protects an account from password reuse attacks?\n"
+             "Options:\na) Reusing one strong password\nb) Using a password manager\n"
+             "c) Changing passwords every day\nd) Sharing passwords with IT\nAnswer: {}")
+
+
+@pytest.mark.parametrize("answer", ["b", "B)", "b) Using a password manager", "b. Using a password manager"])
+def test_generated_quiz_is_parsed_like_a_stored_one(answer):
+    quiz = parse_generated_quiz("job-1", GENERATED.format(answer))
+
+    assert quiz["question"] == "Which practice best protects an account from password reuse attacks?"
+    assert public_quiz(quiz)["options"][1] == "b) Using a password manager"
+    assert correct_option(quiz) == "b) Using a password manager"
+    assert check_answer(quiz, "b) using a password manager")
+    assert not check_answer(quiz, "a) reusing one strong password")
+
+
+@pytest.mark.parametrize("answer", ["", "e)", "all of the above"])
+def test_generated_quiz_without_a_usable_answer_is_rejected(answer):
+    assert parse_generated_quiz("job-1", GENERATED.format(answer)) is None
+    assert parse_generated_quiz("job-1", None) is None
+
+
+def question(rank):
+    return {"rank": rank, "question": f"Question for rank {rank}?", "options": ["a", "b", "c", "d"],
+            "answer": 0, "explanation": ""}
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = QuizBank(str(tmp_path / "quiz_bank.json"))
+    bank.add("chunk-a", "a.md", 3, [question(3), question(4), question(5)])
+    bank.add("chunk-b", "b.md", 1, [question(1), question(2)])
+    return bank
+
+
+def test_pick_takes_best_ranked_chunk_with_an_eligible_quiz(bank):
+    assert bank.pick(["chunk-a", "chunk-b"], 4)["chunk_id"] == "chunk-a"
+    assert bank.pick(["chunk-a", "chunk-b"], 4)["rank"] == 4
+    # chunk-a has nothing for rank 2 yet, so the next chunk is used
+    assert bank.pick(["chunk-a", "chunk-b"], 2)["chunk_id"] == "chunk-b"
+    assert bank.pick(["missing", "chunk-b"], 5)["rank"] == 2
+    assert bank.pick(["missing"], 5) is None
+
+
+def test_add_replaces_and_remove_drops_questions(bank, tmp_path):
+    old_ids = set(bank.quizzes)
+    bank.add("chunk-b", "b.md", 2, [question(2)])
+    bank.remove(["chunk-a"])
+
+    assert len(bank) == 1
+    assert bank.chunk_rank("chunk-b") == 2
+    assert bank.chunk_rank("chunk-a") is None
+
+    bank.save()
+    loaded = QuizBank.load(bank.path)
+    assert loaded.quizzes == bank.quizzes
+    assert not set(loaded.quizzes) & (old_ids - set(bank.quizzes))
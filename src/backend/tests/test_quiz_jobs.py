@@ -0,0 +1,34 @@
+import asyncio
+
+from quiz_jobs import AsyncQuizJobs, QuizJobs
+
+
+def failing(*args):
+    raise RuntimeError("quiz model unavailable")
+
+
+def test_failed_job_is_logged(caplog):
+    jobs = QuizJobs(failing, max_workers=1)
+
+    quiz_id = jobs.submit("alice", "answer")
+
+    assert jobs.result(quiz_id, "alice", wait=5) == ("failed", None)
+    assert "quiz model unavailable" in caplog.text
+
+
+def test_failed_async_job_is_logged(caplog):
+    async def afailing(*args):
+        failing()
+
+    async def main():
+        jobs = AsyncQuizJobs(afailing)
+        quiz_id = await jobs.submit("alice", "answer")
+        result = await jobs.result(quiz_id, "alice", wait=5)
+        await asyncio.sleep(0)
+        return jobs, result
+
+    jobs, result = asyncio.run(main())
+
+    assert result == ("failed", None)
+    assert not jobs._tasks
+    assert "Error generating quiz" in caplog.text and "quiz model unavailable" in caplog.text
@@ -0,0 +1,65 @@
+import response_cache
+from response_cache import SemanticResponseCache
+
+CHUNKS = ["a_1", "b_2"]
+
+
+def test_similar_query_reuses_the_answer():
+    cache = SemanticResponseCache(similarity_threshold=0.95)
+    cache.put([1.0, 0.0], 2, CHUNKS, "What is phishing?", "answer")
+
+    assert cache.get([0.99, 0.05], 2, CHUNKS) == "answer"
+    assert cache.get([0.5, 0.5], 2, CHUNKS) is None
+    # Without an embedding only the same normalized text matches
+    assert cache.get(None, 2, CHUNKS, query="what  is PHISHING?") == "answer"
+    assert cache.get(None, 2, CHUNKS, query="what is vishing?") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+
+def test_answers_are_isolated_by_rank_and_chunks():
+    cache = SemanticResponseCache()
+    cache.put([1.0, 0.0], 2, CHUNKS, "query", "answer")
+
+    assert cache.get([1.0, 0.0], 3, CHUNKS) is None
+    assert cache.get([1.0, 0.0], 2, ["a_1"]) is None
+    assert cache.get([1.0, 0.0], 2, list(reversed(CHUNKS))) is None
+    assert cache.get([1.0, 0.0], 2, CHUNKS) == "answer"
+
+
+def test_new_index_version_drops_every_answer():
+    cache = SemanticResponseCache()
+    cache.check_version(1)
+    cache.put([1.0, 0.0], 2, CHUNKS, "query", "answer")
+
+    cache.check_version(1)
+    assert cache.get([1.0, 0.0], 2, CHUNKS) == "answer"
+    cache.check_version(2)
+    assert cache.get([1.0, 0.0], 2, CHUNKS) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_answers_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = SemanticResponseCache(ttl_seconds=60)
+    cache.put([1.0, 0.0], 2, CHUNKS, "query", "answer")
+
+    now[0] += 59
+    assert cache.get([1.0, 0.0], 2, CHUNKS) == "answer"
+    now[0] += 2
+    assert cache.get([1.0, 0.0], 2, CHUNKS) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticResponseCache(max_entries=2)
+    cache.put([1.0, 0.0], 1, ["a"], "a", "answer a")
+    cache.put([1.0, 0.0], 1, ["b"], "b", "answer b")
+    assert cache.get([1.0, 0.0], 1, ["a"]) == "answer a"
+
+    cache.put([1.0, 0.0], 1, ["c"], "c", "answer c")
+
+    assert cache.get([1.0, 0.0], 1, ["b"]) is None
+    assert cache.get([1.0, 0.0], 1, ["a"]) == "answer a"
+    assert cache.get([1.0, 0.0], 1, ["c"]) == "answer c"
+    assert cache.stats()["entries"] == 2
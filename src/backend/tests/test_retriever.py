@@ -0,0 +1,239 @@
+import pytest
+
+import retriever as retriever_module
+from retriever import DocumentRetriever
+
+# The fake embedding has one dimension per word, so similar texts share directions
+VOCAB = ["password", "phishing", "firewall", "malware", "encryption", "audit"]
+
+
+class FakeEmbedding:
+    name = "fake"
+    model_name = "fake-model"
+    max_concurrency = 1
+
+    def __init__(self):
+        self.calls = []
+        self.fail_on = None
+
+    def __call__(self, input):
+        if self.fail_on is not None and any(self.fail_on in text for text in input):
+            raise RuntimeError("embedding request failed")
+        self.calls.append(list(input))
+        return [[text.lower().count(word) + 0.01 for word in VOCAB] for text in input]
+
+    async def aembed(self, input):
+        return self(input)
+
+
+@pytest.fixture
+def embedding(monkeypatch):
+    embedding = FakeEmbedding()
+    monkeypatch.setattr(retriever_module, "get_embedding_function", lambda provider=None: embedding)
+    # Paragraphs are chunks, so tests don't depend on the text splitter
+    monkeypatch.setattr(DocumentRetriever, "_split_document",
+                        lambda self, content: [part for part in content.split("\n\n") if part])
+    return embedding
+
+
+@pytest.fixture
+def retriever(tmp_path, embedding):
+    return DocumentRetriever(db_directory=str(tmp_path / "db"), vector_backend="flat")
+
+
+def embedded(embedding):
+    return [text for call in embedding.calls for text in call]
+
+
+def test_interrupted_ingestion_resumes_from_the_checkpoint(retriever, embedding):
+    texts = [f"chunk {i} about password policy" for i in range(4)] + ["last chunk about malware"]
+    entries = retriever._chunk_entries("doc.md", texts)
+    embedding.fail_on = "last chunk"
+
+    with pytest.raises(RuntimeError):
+        retriever._ingest_chunks("kb/doc.md", "doc.md", entries, batch_size=2, max_workers=1)
+
+    done = retriever._load_json(retriever.checkpoint_path)["doc.md"]["done"]
+    assert 0 in done and 4 not in done
+    assert retriever.collection.count() == 2 * len(done)
+
+    embedding.fail_on = None
+    embedding.calls.clear()
+    retriever._ingest_chunks("kb/doc.md", "doc.md", entries, batch_size=2, max_workers=1)
+
+    assert embedded(embedding) == [text for start in (0, 2, 4) if start not in done for text in texts[start:start + 2]]
+    assert retriever.collection.count() == 5
+    assert set(retriever.lexical_index.lengths) == {entry[0] for entry in entries}
+    assert "doc.md" not in retriever._load_json(retriever.checkpoint_path)
+
+
+def test_checkpoint_is_ignored_when_the_chunks_change(retriever, embedding):
+    entries = retriever._chunk_entries("doc.md", ["first chunk", "second chunk"])
+    retriever._save_json(retriever.checkpoint_path,
+                         {"doc.md": {"digest": "something else", "batch_size": 1, "done": [0]}})
+
+    retriever._ingest_chunks("kb/doc.md", "doc.md", entries, batch_size=1, max_workers=1)
+
+    assert embedded(embedding) == ["first chunk", "second chunk"]
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path):
+    directory = tmp_path / "kb"
+    directory.mkdir()
+    (directory / "a.md").write_text("Use a password manager.\n\nReport phishing emails.", encoding="utf-8")
+    (directory / "b.md").write_text("Keep the firewall on.", encoding="utf-8")
+    return directory
+
+
+def stored_ids(retriever, source=None):
+    return set(retriever.collection.get(where={"source": source} if source else None)["ids"])
+
+
+def test_sync_embeds_only_new_and_changed_chunks(retriever, embedding, knowledge_dir):
+    assert retriever.sync_knowledge_base(str(knowledge_dir))
+    assert sorted(embedded(embedding)) == ["Keep the firewall on.", "Report phishing emails.", "Use a password manager."]
+    first_ids = stored_ids(retriever)
+
+    # Nothing changed: nothing is embedded
+    embedding.calls.clear()
+    retriever.sync_knowledge_base(str(knowledge_dir))
+    assert embedded(embedding) == []
+
+    # One paragraph edited and the other moved: only the edit is embedded
+    (knowledge_dir / "a.md").write_text("Enable encryption at rest.\n\nUse a password manager.", encoding="utf-8")
+    retriever.sync_knowledge_base(str(knowledge_dir))
+    assert embedded(embedding) == ["Enable encryption at rest."]
+    a_ids = stored_ids(retriever, str(knowledge_dir / "a.md"))
+    assert len(a_ids) == 2 and len(a_ids & first_ids) == 1
+    assert set(retriever.lexical_index.lengths) == stored_ids(retriever)
+    moved = retriever.collection.get(where={"chunk": 1})
+    assert moved["documents"] == ["Use a password manager."]
+
+
+def test_sync_removes_deleted_files(retriever, embedding, knowledge_dir):
+    retriever.sync_knowledge_base(str(knowledge_dir))
+    (knowledge_dir / "b.md").unlink()
+
+    retriever.sync_knowledge_base(str(knowledge_dir))
+
+    assert stored_ids(retriever, str(knowledge_dir / "b.md")) == set()
+    assert "b.md" not in retriever._load_json(retriever.manifest_path)
+    assert set(retriever.lexical_index.lengths) == stored_ids(retriever)
+
+
+def test_sync_retags_without_embedding_again(retriever, embedding, knowledge_dir):
+    retriever.sync_knowledge_base(str(knowledge_dir))
+    ids = sorted(stored_ids(retriever))
+    retriever.collection.update(ids=ids, metadatas=[{"source": "stale", "chunk": 0, "min_rank": 5}] * len(ids))
+    embedding.calls.clear()
+
+    retriever.tag_version = "changed topics"
+    retriever.sync_knowledge_base(str(knowledge_dir))
+
+    assert embedded(embedding) == []
+    metadatas = retriever.collection.get(ids=ids)["metadatas"]
+    assert all(metadata["source"] != "stale" and "topic_phishing" in metadata for metadata in metadatas)
+
+
+def test_sync_purges_chunks_of_untracked_builds(retriever, embedding, knowledge_dir):
+    # Stored by an earlier build that kept no manifest, under positional IDs
+    source = str(knowledge_dir / "b.md")
+    retriever.collection.upsert(ids=["b.md_0"], documents=["old firewall text"], embeddings=[[1.0] * len(VOCAB)],
+                                metadatas=[{"source": source, "chunk": 0, "min_rank": 1}])
+    retriever.lexical_index.add(["b.md_0"], ["old firewall text"], [source])
+
+    retriever.sync_knowledge_base(str(knowledge_dir))
+
+    assert "b.md_0" not in stored_ids(retriever)
+    assert "b.md_0" not in retriever.lexical_index.lengths
+    assert len(stored_ids(retriever, source)) == 1
+
+
+def hit(chunk_id):
+    return {"id": chunk_id, "document": chunk_id, "metadata": {"source": "a.md", "chunk": 0, "min_rank": 1}}
+
+
+def store(retriever, chunks):
+    """Store {chunk_id: (text, min_rank)} and index it lexically"""
+    ids = list(chunks)
+    texts = [chunks[chunk_id][0] for chunk_id in ids]
+    retriever.collection.upsert(ids=ids, documents=texts, embeddings=FakeEmbedding()(texts),
+                                metadatas=[{"source": "a.md", "chunk": i, "min_rank": chunks[chunk_id][1]}
+                                           for i, chunk_id in enumerate(ids)])
+    retriever.lexical_index.add(ids, texts, ["a.md"] * len(ids))
+
+
+def test_exact_lookup_needs_every_control_id_in_the_index(retriever):
+    store(retriever, {"ac": ("Account management AC-2", 1)})
+    lexical = retriever.lexical_index.search("AC-2", 10)
+
+    assert retriever._is_exact_lookup("What does AC-2 require?", lexical)
+    assert not retriever._is_exact_lookup("Compare AC-2 and AC-3", lexical)
+    assert not retriever._is_exact_lookup("account management", lexical)
+    assert not retriever._is_exact_lookup("AC-2", [])
+
+
+def test_exact_lookup_skips_the_embedding(retriever, embedding):
+    store(retriever, {"ac": ("Account management AC-2", 1), "fw": ("Firewall rules", 1)})
+
+    hits = retriever.retrieve("AC-2", n_results=2)
+
+    assert [hit["id"] for hit in hits] == ["ac"]
+    assert embedding.calls == []
+
+
+def test_fuse_orders_by_reciprocal_rank(retriever):
+    store(retriever, {"lex": ("lexical only", 1)})
+    dense = [hit("both"), hit("dense")]
+    lexical = [("lex", 3.0), ("both", 2.0)]
+
+    fused = retriever._fuse(dense, lexical, 3)
+
+    # "both" scores in both lists; "lex" leads its list while "dense" is second in its own
+    assert [h["id"] for h in fused] == ["both", "lex", "dense"]
+
+
+def test_fuse_fetches_lexical_hits_with_the_filter(retriever):
+    store(retriever, {"open": ("password basics", 1), "secret": ("password internals", 5)})
+
+    fused = retriever._fuse([], [("secret", 2.0), ("open", 1.0)], 2, {"min_rank": {"$lte": 2}})
+
+    assert [h["id"] for h in fused] == ["open"]
+    assert fused[0]["document"] == "password basics"
+
+
+def test_retrieval_filters_by_rank_then_topic(retriever):
+    assert retriever.retrieval_filters("how do I spot phishing") == [None]
+    assert retriever.retrieval_filters("tell me something", user_rank=2) == [{"min_rank": {"$lte": 2}}]
+    assert retriever.retrieval_filters("how do I spot phishing", user_rank=2) == [
+        {"$and": [{"min_rank": {"$lte": 2}}, {"topic_phishing": True}]},
+        {"min_rank": {"$lte": 2}},
+    ]
+
+
+def test_retrieve_never_returns_chunks_above_the_rank(retriever):
+    store(retriever, {"basic": ("password basics", 1), "advanced": ("password cracking internals", 4)})
+
+    assert [h["id"] for h in retriever.retrieve("password", n_results=2, user_rank=2)] == ["basic"]
+    assert {h["id"] for h in retriever.retrieve("password", n_results=2, user_rank=4)} == {"basic", "advanced"}
+
+
+def test_topic_filter_falls_back_to_the_rank_filter(retriever, embedding, knowledge_dir):
+    retriever.sync_knowledge_base(str(knowledge_dir))
+
+    hits = retriever.retrieve("how do I spot phishing password", n_results=2, user_rank=5)
+
+    # Only one chunk is tagged with phishing, so the rank filter alone fills the results
+    assert len(hits) == 2
+    assert "Report phishing emails." in [h["document"] for h in hits]
+
+
+def test_index_without_rank_tags_is_not_filtered(retriever):
+    # Built before chunks were tagged: no min_rank in the metadata
+    retriever.collection.upsert(ids=["old"], documents=["password basics"], embeddings=FakeEmbedding()(["password"]),
+                                metadatas=[{"source": "a.md", "chunk": 0}])
+    retriever.lexical_index.add(["old"], ["password basics"], ["a.md"])
+
+    assert retriever.retrieval_filters("password", user_rank=1) == [None]
+    assert [h["id"] for h in retriever.retrieve("password", n_results=1, user_rank=1)] == ["old"]
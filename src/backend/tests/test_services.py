@@ -0,0 +1,44 @@
+from services import Services
+
+
+class Recorder:
+    def __init__(self, stale=False):
+        self.stale = stale
+        self.forked = False
+
+    def index_is_stale(self):
+        return self.stale
+
+    def after_fork(self):
+        self.forked = True
+
+
+def ready_services(retriever, chatbot=None):
+    services = Services()
+    services.state, services.chunks = "ready", 10
+    services._retriever, services._chatbot = retriever, chatbot
+    return services
+
+
+def test_status_is_ready_while_the_index_is_current():
+    assert ready_services(Recorder()).status() == {"ready": True, "state": "ready", "chunks": 10}
+
+
+def test_status_fails_once_the_chroma_index_is_stale():
+    status = ready_services(Recorder(stale=True)).status()
+
+    assert status["ready"] is False
+    assert status["state"] == "stale"
+    assert "restart" in status["error"]
+
+
+def test_after_fork_resets_the_retriever_and_chatbot():
+    retriever, chatbot = Recorder(), Recorder()
+    services = ready_services(retriever, chatbot)
+    services._lock.acquire()
+
+    services.after_fork()
+
+    assert retriever.forked and chatbot.forked
+    assert services._lock.acquire(blocking=False)
+
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import singleflight
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+class Joins:
+    """Stands in for the COALESCED counter, so tests can wait for followers to join"""
+
+    def __init__(self):
+        self.count = 0
+
+    def inc(self, **labels):
+        self.count += 1
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.count < count:
+            assert time.monotonic() < deadline, "followers did not join"
+            time.sleep(0.001)
+
+
+@pytest.fixture
+def joins(monkeypatch):
+    joins = Joins()
+    monkeypatch.setattr(singleflight, "COALESCED", joins)
+    return joins
+
+
+def test_concurrent_callers_share_one_call(joins):
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(flight.do, "key", slow, 21) for _ in range(5)]
+        joins.wait_for(4)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [42] * 5
+    assert calls == [21]
+    # Finished calls are not reused
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_error_reaches_every_waiter(joins):
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flight.do, "key", failing) for _ in range(3)]
+        joins.wait_for(2)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="upstream failed"):
+                future.result()
+
+
+def test_stream_replays_to_late_joiners(joins):
+    flight = SingleFlight("test")
+    first_sent, release = threading.Event(), threading.Event()
+    runs = []
+
+    def tokens():
+        runs.append(1)
+        yield "a"
+        first_sent.set()
+        release.wait(5)
+        yield "b"
+
+    leader = flight.stream("key", tokens)
+    assert next(leader) == "a"
+    first_sent.wait(5)
+    late = flight.stream("key", tokens)
+    release.set()
+
+    assert list(leader) == ["b"]
+    assert list(late) == ["a", "b"]
+    assert runs == [1] and joins.count == 1
+
+
+def test_stream_error_reaches_every_follower(joins):
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def broken():
+        yield "a"
+        release.wait(5)
+        raise ValueError("stream failed")
+
+    followers = [flight.stream("key", broken) for _ in range(2)]
+    release.set()
+
+    for follower in followers:
+        assert next(follower) == "a"
+        with pytest.raises(ValueError, match="stream failed"):
+            next(follower)
+    assert joins.count == 1
+
+
+def test_async_callers_share_one_task(joins):
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", slow, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21] and joins.count == 4
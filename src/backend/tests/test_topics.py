@@ -0,0 +1,149 @@
+import pytest
+
+from config import TOPICS
+from topics import TopicMatcher
+
+
+# The topic tables of SecurityChatbot.check_topic_access before TopicMatcher
+CHATBOT_TOPIC_KEYWORDS = {
+    "phishing": ["phishing", "scam", "fake email", "suspicious link"],
+    "passwords": ["password", "credentials", "authentication", "login"],
+    "encryption": ["encryption", "encrypt", "cipher", "cryptography"],
+    "network": ["network", "wifi", "router", "firewall", "vpn"],
+    "incident_response": ["incident", "breach", "attack", "response", "compromise"],
+    "penetration_testing": ["pentest", "penetration", "ethical hacking", "vulnerability scan"],
+    "malware": ["malware", "virus", "trojan", "ransomware"],
+    "social engineering": ["social engineering", "impersonation", "baiting", "pretexting"],
+    "data protection": ["data protection", "gdpr", "data loss", "privacy policy"],
+    "email security": ["email security", "spoofing", "dmarc", "spam"],
+    "device security": ["device security", "mobile protection", "laptop safety"],
+    "secure browsing": ["https", "browser safety", "secure website", "ssl"],
+    "authentication": ["authentication", "2fa", "mfa", "identity verification"],
+    "security policies": ["security policies", "acceptable use", "access control"],
+    "security audits": ["audit", "security audit", "compliance check"],
+    "risk assessment": ["risk assessment", "risk analysis", "vulnerability scoring"],
+    "compliance": ["compliance", "regulations", "laws", "ISO 27001"],
+    "advanced threats": ["apt", "zero-day", "stealth attack"],
+    "security architecture": ["architecture", "security design", "defense in depth"],
+    "zero trust": ["zero trust", "never trust", "verify always"],
+}
+CHATBOT_TOPIC_RANKS = {
+    "phishing": 1, "passwords": 1, "malware": 1, "social engineering": 1,
+    "data protection": 2, "email security": 2, "device security": 2, "secure browsing": 2,
+    "network": 3, "encryption": 3, "authentication": 3, "security policies": 3,
+    "incident_response": 4, "security audits": 4, "risk assessment": 4, "compliance": 4,
+    "penetration_testing": 5, "advanced threats": 5, "security architecture": 5, "zero trust": 5,
+}
+
+
+def chatbot_gate(query):
+    """Required rank under the original check_topic_access"""
+    query = query.lower()
+    ranks = [CHATBOT_TOPIC_RANKS[topic] for topic, keywords in CHATBOT_TOPIC_KEYWORDS.items()
+             if any(keyword in query for keyword in keywords)]
+    return max(ranks, default=1)
+
+
+def substring_gate(query):
+    """Required rank under a keyword substring match over config.TOPICS"""
+    query = query.lower()
+    ranks = [details["rank"] for details in TOPICS.values()
+             if any(keyword in query for keyword in details["keywords"])]
+    return max(ranks, default=1)
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return TopicMatcher(TOPICS)
+
+
+@pytest.mark.parametrize("query", [
+    "my account was compromised",
+    "how do attackers get in?",
+    "what should I do after a data breach",
+    "we had a security incident last night",
+    "responding to attacks on our servers",
+    "how do I run a penetration testing engagement",
+    "is my home network safe",
+    "should I use a VPN on public wifi",
+    "how does encryption protect my files",
+    "my passwords keep getting stolen",
+    "is this a phishing email",
+    "what is zero trust architecture",
+    "how do APT groups operate",
+    "explain the zero day market",
+    "how do we prepare for a GDPR audit",
+    "what are security policies for",
+    "I got a suspicious link in a text",
+    "tell me about ransomware",
+    "what is the weather like today",
+])
+def test_gate_matches_substring_baseline(matcher, query):
+    assert matcher.match(query)[1] == substring_gate(query)
+
+
+@pytest.mark.parametrize("query", [
+    *(keyword for keywords in CHATBOT_TOPIC_KEYWORDS.values() for keyword in keywords if keyword != "laptop safety"),
+    "how does cyber-attack work",
+    "zero-day exploit",
+    "is my data loss covered",
+    "do I need https on my site",
+    "what should our acceptable use policy say",
+])
+def test_gate_is_never_looser_than_chatbot_baseline(matcher, query):
+    assert matcher.match(query)[1] >= chatbot_gate(query)
+
+
+# Queries whose required rank differs from the original gate: config.TOPICS
+# has more keywords ("risk", "evaluation", "policy") and ranks GDPR as
+# compliance; "laptop" only matched advanced threats through "apt"
+@pytest.mark.parametrize("query, old_rank, rank", [
+    ("What is a risk?", 1, 4),
+    ("evaluation of antivirus", 1, 4),
+    ("privacy policy", 2, 3),
+    ("gdpr", 2, 4),
+    ("laptop safety", 5, 2),
+])
+def test_rank_changes_from_chatbot_baseline(matcher, query, old_rank, rank):
+    assert chatbot_gate(query) == old_rank
+    assert matcher.match(query)[1] == rank
+
+
+@pytest.mark.parametrize("query, topic, rank", [
+    ("how does cyber-attack work", "incident_response", 4),
+    ("zero-day exploit", "advanced_threats", 5),
+    ("best anti-malware tool", "malware", 1),
+    ("set up two factor login", "authentication", 3),
+])
+def test_hyphenated_words_match_their_parts(matcher, query, topic, rank):
+    topics, required_rank = matcher.match(query)
+    assert topic in topics
+    assert required_rank == rank
+
+
+@pytest.mark.parametrize("query, rank", [
+    ("my account was compromised", 4),
+    ("how do attackers get in?", 4),
+    ("encrypted backups", 3),
+    ("hello there", 1),
+])
+def test_required_rank(matcher, query, rank):
+    assert matcher.match(query)[1] == rank
+
+
+def test_short_keywords_match_whole_words_only(matcher):
+    assert "advanced_threats" in matcher.match("what is an apt")[0]
+    assert "advanced_threats" not in matcher.match("an aptitude test")[0]
+    assert "advanced_threats" not in matcher.match("capture the flag")[0]
+
+
+def test_multi_word_keywords(matcher):
+    topics, rank = matcher.match("Tips for mobile security and safe browsing")
+    assert {"device_security", "secure_browsing"} <= set(topics)
+    assert rank == 2
+
+
+def test_count_reports_every_occurrence(matcher):
+    counts = matcher.count("Phishing and more phishing. Use a strong password.")
+    assert counts["phishing"] == 2
+    assert counts["passwords"] == 1
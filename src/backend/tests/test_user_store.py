@@ -0,0 +1,50 @@
+import pytest
+
+from user_store import UserStore
+
+
+@pytest.fixture
+def users(tmp_path):
+    store = UserStore(str(tmp_path / "users.db"))
+    yield store
+    store.close()
+
+
+def test_served_quiz_is_scored_once(users):
+    assert users.claim_quiz_answer("alice", "q1") == "missing"
+
+    users.record_served_quiz("alice", "q1")
+    assert users.was_served_quiz("alice", "q1")
+    assert not users.was_served_quiz("bob", "q1")
+    assert users.claim_quiz_answer("bob", "q1") == "missing"
+
+    assert users.claim_quiz_answer("alice", "q1") == "claimed"
+    assert users.claim_quiz_answer("alice", "q1") == "answered"
+
+    # Serving the same quiz again does not make it answerable again
+    users.record_served_quiz("alice", "q1")
+    assert users.claim_quiz_answer("alice", "q1") == "answered"
+
+
+def test_quiz_jobs_are_visible_to_their_owner_only(users):
+    users.add_quiz_job("job-1", "alice", expired_before=0)
+    assert users.get_quiz_job("job-1", "alice") == ("pending", None)
+    assert users.get_quiz_job("job-1", "bob") is None
+
+    users.finish_quiz_job("job-1", "ready", "Question: ...")
+    assert users.get_quiz_job("job-1", "alice") == ("ready", "Question: ...")
+
+    # Adding a job prunes the ones created before the cutoff
+    users.add_quiz_job("job-2", "alice", expired_before=float("inf"))
+    assert users.get_quiz_job("job-1", "alice") is None
+
+
+def test_quiz_jobs_are_claimed_like_served_quizzes(users):
+    users.add_quiz_job("job-1", "alice", expired_before=0)
+    assert users.claim_quiz_answer("bob", "job-1") == "missing"
+    assert users.claim_quiz_answer("alice", "job-1") == "claimed"
+    assert users.claim_quiz_answer("alice", "job-1") == "answered"
+
+    # Expired jobs can no longer be claimed
+    users.add_quiz_job("job-2", "alice", expired_before=float("inf"))
+    assert users.claim_quiz_answer("alice", "job-1") == "missing"
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import CHUNKS_FILENAME, EMBEDDINGS_FILENAME, FlatVectorStore, matches_where
+
+METADATAS = [
+    {"source": "a.md", "min_rank": 1, "topic_network": True, "topic_malware": False},
+    {"source": "a.md", "min_rank": 3, "topic_network": False, "topic_malware": True},
+    {"source": "b.md", "min_rank": 5, "topic_network": True, "topic_malware": True},
+    {"source": "b.md", "min_rank": 2},
+    {"source": "c.md", "topic_network": 1},
+]
+
+WHERES = [
+    None,
+    {"min_rank": {"$lte": 3}},
+    {"min_rank": {"$gt": 1, "$lt": 5}},
+    {"min_rank": {"$gte": 2}},
+    {"min_rank": {"$ne": 3}},
+    {"min_rank": 2},
+    {"topic_network": True},
+    {"topic_malware": False},
+    {"topic_malware": {"$ne": True}},
+    {"source": "a.md"},
+    {"source": {"$in": ["b.md", "c.md"]}},
+    {"source": {"$nin": ["a.md"]}},
+    {"$or": []},
+    {"$and": []},
+    {"$and": [{"min_rank": {"$lte": 3}}, {"topic_network": True}]},
+    {"$and": [{"min_rank": {"$lte": 5}}, {"$or": [{"topic_network": True}, {"topic_malware": True}]}]},
+    {"$or": [{"source": "c.md"}, {"min_rank": {"$gte": 5}}]},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FlatVectorStore(str(tmp_path))
+    vectors = np.eye(len(METADATAS), 4, dtype=np.float32) + 0.1
+    store.upsert([f"c{i}" for i in range(len(METADATAS))], [f"doc {i}" for i in range(len(METADATAS))],
+                 vectors, METADATAS)
+    return store
+
+
+@pytest.mark.parametrize("where", WHERES)
+def test_mask_matches_rowwise_filter(store, where):
+    expected = [matches_where(metadata, where) for metadata in METADATAS]
+    assert store._current().mask(where).tolist() == expected
+
+
+@pytest.mark.parametrize("where", WHERES)
+def test_get_and_query_apply_filter(store, where):
+    expected = [f"c{i}" for i, metadata in enumerate(METADATAS) if matches_where(metadata, where)]
+    assert store.get(where=where)["ids"] == expected
+    hits = store.query([[1.0, 0.0, 0.0, 0.0]], n_results=len(METADATAS), where=where)["ids"][0]
+    assert sorted(hits) == sorted(expected)
+
+
+def test_upsert_appends_and_other_processes_see_it(store, tmp_path):
+    reader = FlatVectorStore(str(tmp_path))
+    store.upsert(["c5", "c6"], ["doc 5", "doc ü"], np.ones((2, 4), dtype=np.float32),
+                 [{"min_rank": 1}, {"min_rank": 4}])
+
+    assert reader.count() == 7
+    assert reader.get(ids=["c6"])["documents"] == ["doc ü"]
+    assert reader.get(where={"min_rank": {"$gte": 4}})["ids"] == ["c2", "c6"]
+    assert np.load(os.path.join(str(tmp_path), EMBEDDINGS_FILENAME)).shape == (7, 4)
+
+
+def test_interrupted_append_is_ignored_and_overwritten(store, tmp_path):
+    with open(os.path.join(str(tmp_path), CHUNKS_FILENAME), 'r', encoding='utf-8') as f:
+        committed = json.load(f)
+    store.upsert(["c5"], ["lost"], np.ones((1, 4), dtype=np.float32), [{"min_rank": 1}])
+    # Roll the commit record back, as if the process died before writing it
+    with open(os.path.join(str(tmp_path), CHUNKS_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(committed, f)
+
+    store = FlatVectorStore(str(tmp_path))
+    assert store.count() == len(METADATAS)
+    store.upsert(["c6"], ["kept"], np.ones((1, 4), dtype=np.float32), [{"min_rank": 2}])
+    assert store.get(ids=["c5", "c6"])["documents"] == ["kept"]
+    assert np.load(os.path.join(str(tmp_path), EMBEDDINGS_FILENAME)).shape == (len(METADATAS) + 1, 4)
+
+
+def test_update_and_delete(store):
+    store.upsert(["c0"], ["doc 0 again"], np.ones((1, 4), dtype=np.float32), [{"min_rank": 4}])
+    store.update(["c1"], [{"source": "z.md", "min_rank": 1}])
+    store.delete(where={"source": "b.md"})
+
+    assert store.get()["ids"] == ["c0", "c1", "c4"]
+    assert store.get(ids=["c0"])["documents"] == ["doc 0 again"]
+    assert store.get(where={"source": "z.md"})["ids"] == ["c1"]
+    assert store.get(where={"min_rank": {"$lte": 1}})["ids"] == ["c1"]
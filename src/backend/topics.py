@@ -0,0 +1,101 @@
+import re
+
+try:
+    from .config import TOPICS
+except ImportError:
+    from config import TOPICS
+
+# Words are runs of letters/digits; hyphens split words, so "zero-day" and
+# "cyber-attack" match the keywords "zero day" and "attack"
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Inflections accepted on query words ("passwords" also matches "password")
+SUFFIXES = ("s", "es", "ed", "ing")
+
+# Query words also match keyword words they start with ("compromised",
+# "attackers"), as the original substring match did, if the keyword word has
+# at least this many characters; shorter ones ("apt", "pii") only match whole words
+MIN_PREFIX = 4
+
+# Key under which a trie node stores the topics of the keyword ending there
+_TOPICS = None
+
+
+def _word_forms(word):
+    """Return the word, its stems with an inflection suffix removed and its prefixes of MIN_PREFIX or more characters"""
+    forms = {word}
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            forms.add(word[:-len(suffix)])
+    forms.update(word[:end] for end in range(MIN_PREFIX, len(word)))
+    return forms
+
+
+class TopicMatcher:
+    """Single-pass keyword classifier built from a topic table
+
+    Keywords are compiled into a trie over words, so keywords always match on
+    word boundaries. The query is tokenized once and the trie is walked from
+    every word, which reports every keyword present, including overlapping
+    ones. The cost depends on the length of the query and of the longest
+    keyword, not on the number of topics or keywords.
+    """
+
+    def __init__(self, topics=TOPICS):
+        self.topic_ranks = {topic: details["rank"] for topic, details in topics.items()}
+
+        self._trie = {}
+        for topic, details in topics.items():
+            for keyword in details["keywords"]:
+                words = WORD_PATTERN.findall(keyword.lower())
+                if not words:
+                    continue
+                node = self._trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                node.setdefault(_TOPICS, set()).add(topic)
+
+    def _scan(self, text):
+        """Yield the topic set of every keyword occurrence in a text"""
+        words = [_word_forms(word) for word in WORD_PATTERN.findall(text.lower())]
+
+        for start in range(len(words)):
+            nodes = [self._trie]
+            for forms in words[start:]:
+                nodes = [node[form] for node in nodes for form in forms if form in node]
+                if not nodes:
+                    break
+                for node in nodes:
+                    if _TOPICS in node:
+                        yield node[_TOPICS]
+
+    def match(self, query):
+        """Return (matched topics, highest required rank) for a query
+
+        The required rank is 1 when no topic matches.
+        """
+        topics = set()
+        for matched in self._scan(query):
+            topics.update(matched)
+
+        required_rank = max((self.topic_ranks[topic] for topic in topics), default=1)
+        return sorted(topics), required_rank
+
+    def count(self, text):
+        """Return {topic: number of keyword occurrences} for a longer text"""
+        counts = {}
+        for matched in self._scan(text):
+            for topic in matched:
+                counts[topic] = counts.get(topic, 0) + 1
+        return counts
+
+
+_default_matcher = None
+
+
+def get_topic_matcher():
+    """Return the matcher for config.TOPICS, compiling it on first use"""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = TopicMatcher(TOPICS)
+    return _default_matcher
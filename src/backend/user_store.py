@@ -0,0 +1,350 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from .models import User
+except ImportError:
+    from models import User
+
+
+class UserStore:
+    """User repository backed by SQLite in WAL mode
+
+    Every worker process opens the same database file, so users, XP,
+    interaction history, quiz jobs and served quizzes are shared without
+    sticky sessions. Reads go through an in-process cache whose entries are
+    refreshed after ``cache_ttl`` seconds, so changes made by other workers
+    show up quickly. XP updates run
+    in one write transaction and can't lose increments to a concurrent
+    request. Interactions are buffered and written in batches of
+    ``history_batch_size``, or every ``flush_interval`` seconds.
+    """
+
+    def __init__(self, db_path, cache_ttl=2.0, history_batch_size=50, flush_interval=1.0):
+        self.db_path = db_path
+        self.cache_ttl = cache_ttl
+        self.history_batch_size = history_batch_size
+        self.flush_interval = flush_interval
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._cache = {}  # user_id -> (User, loaded_at)
+        self._cache_lock = threading.Lock()
+
+        self._pending = []  # (user_id, query, response, created_at)
+        self._pending_counts = {}  # user_id -> interactions not yet written
+        self._pending_lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._closed = threading.Event()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, xp INTEGER NOT NULL DEFAULT 0, rank INTEGER NOT NULL DEFAULT 1, "
+            "interactions INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+            "summary TEXT NOT NULL DEFAULT '', summarized INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Databases created before conversation summaries were stored
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if "summary" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+            conn.execute("ALTER TABLE users ADD COLUMN summarized INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS interactions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, query TEXT NOT NULL, "
+            "response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS interactions_user ON interactions (user_id, id)")
+        # Background quiz jobs, so any worker can answer a poll for a quiz another one generates
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quiz_jobs ("
+            "quiz_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL, quiz TEXT, "
+            "created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS quiz_jobs_created ON quiz_jobs (created_at)")
+        # Stored quizzes served to each user; each one is scored at most once
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS served_quizzes ("
+            "user_id TEXT NOT NULL, quiz_id TEXT NOT NULL, served_at REAL NOT NULL, "
+            "answered INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, quiz_id))"
+        )
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-store-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _connection(self):
+        """Return this thread's connection (sqlite3 connections can't be shared across threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are started explicitly
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _user_from_row(self, user_id, row, user=None):
+        """Fill a (new or cached) User from a database row
+
+        The recent history is reloaded whenever the interaction count shows
+        that another worker has recorded turns this process hasn't seen.
+        """
+        if user is None:
+            # The database holds the full history, so users never spill to files
+            user = User(user_id, spill_dir=None)
+            known_interactions = None
+        else:
+            known_interactions = user.interactions
+        user.xp, user.rank, user.interactions = row[:3]
+        if row[4] > user.summarized:
+            user.summary, user.summarized = row[3], row[4]
+        with self._pending_lock:
+            user.interactions += self._pending_counts.get(user_id, 0)
+        if user.interactions != known_interactions:
+            user.load_history(self._recent_interactions(user_id, user.history.maxlen))
+        return user
+
+    def _recent_interactions(self, user_id, limit):
+        """Return the last ``limit`` (query, response) pairs of a user, queued ones included"""
+        with self._pending_lock:
+            queued = [(query, response) for uid, query, response, _ in self._pending if uid == user_id]
+        if limit is None or len(queued) >= limit:
+            return queued[-limit:] if limit else queued
+        rows = self._connection().execute(
+            "SELECT query, response FROM interactions WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit - len(queued))
+        ).fetchall()
+        return list(reversed(rows)) + queued
+
+    def _remember(self, user):
+        with self._cache_lock:
+            self._cache[user.user_id] = (user, time.monotonic())
+        return user
+
+    def get(self, user_id):
+        """Return a user, or None if they have never logged in"""
+        if not user_id:
+            return None
+        with self._cache_lock:
+            cached = self._cache.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        row = self._connection().execute(
+            "SELECT xp, rank, interactions, summary, summarized FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(user_id, None)
+            return None
+        # Refresh the cached object in place so its recent history is kept
+        return self._remember(self._user_from_row(user_id, row, cached[0] if cached else None))
+
+    def get_or_create(self, user_id):
+        """Return a user, creating them on first login"""
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        self._connection().execute(
+            "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)", (user_id, time.time())
+        )
+        with self._cache_lock:
+            self._cache.pop(user_id, None)
+        return self.get(user_id)
+
+    def add_xp(self, user_id, points):
+        """Atomically add (or with a negative value, remove) XP and return the updated user"""
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so concurrent updates from any
+        # worker are applied one after another to the latest value
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT xp, rank, interactions, summary, summarized FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO users (user_id, created_at) VALUES (?, ?)", (user_id, time.time()))
+                row = (0, 1, 0, "", 0)
+            with self._cache_lock:
+                cached = self._cache.get(user_id)
+            user = self._user_from_row(user_id, row, cached[0] if cached else None)
+            user.add_xp(points)
+            conn.execute("UPDATE users SET xp = ?, rank = ? WHERE user_id = ?", (user.xp, user.rank, user_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._remember(user)
+
+    def save_summary(self, user_id, summary, summarized):
+        """Store a user's conversation summary unless a newer one is already stored"""
+        self._connection().execute(
+            "UPDATE users SET summary = ?, summarized = ? WHERE user_id = ? AND summarized < ?",
+            (summary, summarized, user_id, summarized)
+        )
+
+    def add_quiz_job(self, quiz_id, user_id, expired_before):
+        """Record a pending quiz job and drop the jobs created before ``expired_before``
+
+        The job also counts as served to its user, so its answer is claimed
+        like a stored quiz's.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM served_quizzes WHERE quiz_id IN (SELECT quiz_id FROM quiz_jobs WHERE created_at < ?)",
+                (expired_before,)
+            )
+            conn.execute("DELETE FROM quiz_jobs WHERE created_at < ?", (expired_before,))
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO quiz_jobs (quiz_id, user_id, status, created_at) VALUES (?, ?, 'pending', ?)",
+                (quiz_id, user_id, now)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO served_quizzes (user_id, quiz_id, served_at) VALUES (?, ?, ?)",
+                (user_id, quiz_id, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish_quiz_job(self, quiz_id, status, quiz=None):
+        """Store the outcome ("ready" or "failed") of a quiz job"""
+        self._connection().execute(
+            "UPDATE quiz_jobs SET status = ?, quiz = ? WHERE quiz_id = ?", (status, quiz, quiz_id)
+        )
+
+    def get_quiz_job(self, quiz_id, user_id):
+        """Return (status, quiz) of a user's quiz job, or None if there is no such job"""
+        return self._connection().execute(
+            "SELECT status, quiz FROM quiz_jobs WHERE quiz_id = ? AND user_id = ?", (quiz_id, user_id)
+        ).fetchone()
+
+    def record_served_quiz(self, user_id, quiz_id):
+        """Remember that a stored quiz was shown to a user; serving it again keeps its answered state"""
+        self._connection().execute(
+            "INSERT OR IGNORE INTO served_quizzes (user_id, quiz_id, served_at) VALUES (?, ?, ?)",
+            (user_id, quiz_id, time.time())
+        )
+
+    def was_served_quiz(self, user_id, quiz_id):
+        return self._connection().execute(
+            "SELECT 1 FROM served_quizzes WHERE user_id = ? AND quiz_id = ?", (user_id, quiz_id)
+        ).fetchone() is not None
+
+    def claim_quiz_answer(self, user_id, quiz_id):
+        """Mark a served quiz as answered
+
+        Returns "claimed" for the first answer, "answered" if the user
+        already answered it and "missing" if it was never served to them.
+        """
+        conn = self._connection()
+        claimed = conn.execute(
+            "UPDATE served_quizzes SET answered = 1 WHERE user_id = ? AND quiz_id = ? AND answered = 0",
+            (user_id, quiz_id)
+        ).rowcount
+        if claimed:
+            return "claimed"
+        return "answered" if self.was_served_quiz(user_id, quiz_id) else "missing"
+
+    def record_interaction(self, user_id, query, response):
+        """Add an interaction to the cached user's recent history and queue it for the next batched write"""
+        with self._cache_lock:
+            cached = self._cache.get(user_id)
+        with self._pending_lock:
+            self._pending.append((user_id, query, response, time.time()))
+            self._pending_counts[user_id] = self._pending_counts.get(user_id, 0) + 1
+            full = len(self._pending) >= self.history_batch_size
+        if cached is not None:
+            cached[0].add_interaction(query, response)
+        if full:
+            self._flush_now.set()
+
+    def history(self, user_id, limit=20):
+        """Return the user's most recent interactions, oldest first"""
+        self.flush()
+        rows = self._connection().execute(
+            "SELECT query, response FROM interactions WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return [{"query": query, "response": response} for query, response in reversed(rows)]
+
+    def flush(self):
+        """Write all queued interactions in one transaction"""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            counts, self._pending_counts = self._pending_counts, {}
+        if not batch:
+            return 0
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO interactions (user_id, query, response, created_at) VALUES (?, ?, ?, ?)", batch
+            )
+            conn.executemany(
+                "UPDATE users SET interactions = interactions + ? WHERE user_id = ?",
+                [(count, user_id) for user_id, count in counts.items()]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            # Put the batch back so it is retried with the next flush
+            with self._pending_lock:
+                self._pending[:0] = batch
+                for user_id, count in counts.items():
+                    self._pending_counts[user_id] = self._pending_counts.get(user_id, 0) + count
+            raise
+        return len(batch)
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing interaction history: {e}")
+
+    def before_fork(self):
+        """Write queued interactions and close this thread's connection before forking workers"""
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def after_fork(self):
+        """Reset connections, locks and the background writer in a forked worker
+
+        Only the forking thread survives a fork, so the writer thread is
+        started again; connections opened by the parent are never reused.
+        """
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._pending = []
+        self._pending_counts = {}
+        self._pending_lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-store-flush", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """Stop the background writer and flush what is still queued"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flush_now.set()
+        self._flusher.join(timeout=5)
+        self.flush()
@@ -1,10 +1,14 @@
 import os
+import re
 import json
+import time
 import logging
 import PyPDF2
 import fitz  # PyMuPDF - alternative PDF library
 from pathlib import Path
-from .config import TOPICS
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .config import TOPICS, PDF_EXTRACTION_WORKERS, PDF_MIN_PAGE_CHARS
+from .topics import get_topic_matcher
 
 # Set up logging
 logging.basicConfig(
@@ -23,13 +27,7 @@ def identify_topics(query):
     Identify security topics in the query based on keywords
     Returns a list of topics found in the query
     """
-    query_lower = query.lower()
-    detected_topics = []
-
-    for topic, details in TOPICS.items():
-        keywords = details["keywords"]
-        if any(keyword in query_lower for keyword in keywords):
-            detected_topics.append(topic)
+    detected_topics, _ = get_topic_matcher().match(query)
 
     # If no specific topic is detected, default to basic security
     if not detected_topics:
@@ -73,39 +71,138 @@ def extract_text_from_pdf_pymupdf(pdf_path):
     Better for complex PDFs with images and formatting
     """
     try:
-        text = ""
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            text += page.get_text() + "\n"
-        doc.close()
-        return text
+        return "".join(page_text + "\n" for page_text in iter_pages_pymupdf(pdf_path))
     except Exception as e:
         logger.error(f"Error extracting text from {pdf_path} using PyMuPDF: {str(e)}")
         return None
 
 
+def iter_pages_pymupdf(pdf_path):
+    """
+    Yield the text of each page using PyMuPDF, one page at a time
+    """
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def iter_pages(pdf_path, min_page_chars=None):
+    """
+    Yield the cleaned text of each page, falling back to PyPDF2 per page
+
+    Pages are extracted with PyMuPDF. Only a page whose text is shorter than
+    ``min_page_chars`` (e.g. a scanned page) is re-extracted with PyPDF2, and
+    the better of the two results is kept, so a mixed scanned/native PDF is
+    never parsed twice end to end. Cleaning happens in the same pass.
+    """
+    min_page_chars = PDF_MIN_PAGE_CHARS if min_page_chars is None else min_page_chars
+    fallback_reader = None
+    fallback_file = None
+
+    try:
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            logger.error(f"Error opening {pdf_path} using PyMuPDF: {str(e)}")
+            doc = None
+
+        if doc is None:
+            # PyMuPDF can't read the file at all, use PyPDF2 for every page
+            with open(pdf_path, 'rb') as file:
+                for page in PyPDF2.PdfReader(file).pages:
+                    yield clean_extracted_text(page.extract_text() or "")
+            return
+
+        with doc:
+            for page_number, page in enumerate(doc):
+                text = clean_extracted_text(page.get_text())
+
+                if len(text) < min_page_chars:
+                    try:
+                        if fallback_reader is None:
+                            fallback_file = open(pdf_path, 'rb')
+                            fallback_reader = PyPDF2.PdfReader(fallback_file)
+                        fallback_text = clean_extracted_text(
+                            fallback_reader.pages[page_number].extract_text() or ""
+                        )
+                        if len(fallback_text) > len(text):
+                            text = fallback_text
+                    except Exception as e:
+                        logger.warning(f"PyPDF2 fallback failed for page {page_number + 1} of {pdf_path}: {str(e)}")
+
+                yield text
+    finally:
+        if fallback_file is not None:
+            fallback_file.close()
+
+
 def extract_text_from_pdf(pdf_path):
     """
     Extract text from PDF using multiple methods as fallback
     """
-    # Try PyMuPDF first (generally better results)
-    text = extract_text_from_pdf_pymupdf(pdf_path)
-    
-    # If PyMuPDF fails, try PyPDF2
-    if not text or len(text.strip()) < 100:
-        logger.info(f"PyMuPDF extraction poor for {pdf_path}, trying PyPDF2...")
-        text = extract_text_from_pdf_pypdf2(pdf_path)
-    
+    try:
+        text = "\n\n".join(page_text for page_text in iter_pages(pdf_path) if page_text)
+    except Exception as e:
+        logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
+        text = None
+
     if not text:
         logger.error(f"Failed to extract text from {pdf_path}")
         return None
     
-    return text.strip()
+    return text
 
 
-def process_pdf_documents(pdf_directory="./data/pdf_documents"):
+def convert_pdf_to_text(pdf_path, output_path):
+    """
+    Stream the text of a PDF into a text file page by page
+
+    Only one page is held in memory at a time. The output is written to a
+    temporary file and moved into place once extraction succeeds.
+    Returns a dict with per-file statistics, or None on failure.
+    """
+    pdf_name = os.path.basename(pdf_path)
+    start = time.perf_counter()
+    tmp_path = output_path + ".tmp"
+    pages = 0
+    chars = 0
+
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"# Security Document: {pdf_name}")
+            for page_text in iter_pages(pdf_path):
+                pages += 1
+                if page_text:
+                    f.write("\n\n" + page_text)
+                    chars += len(page_text)
+    except Exception as e:
+        logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
+        chars = 0
+
+    if chars == 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    os.replace(tmp_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+    return {
+        "file": pdf_name,
+        "pages": pages,
+        "seconds": elapsed,
+        "mb_per_second": size_mb / elapsed if elapsed > 0 else 0.0,
+        "pages_per_second": pages / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def process_pdf_documents(pdf_directory="./data/pdf_documents", workers=None):
     """
     Process all PDF documents in the specified directory and convert them to text files
+
+    PDFs are converted in a pool of ``workers`` processes (PDF_EXTRACTION_WORKERS
+    by default); ``workers=1`` converts them one at a time in this process.
     """
     knowledge_base_dir = "./data/knowledge_base"
     os.makedirs(knowledge_base_dir, exist_ok=True)
@@ -119,34 +216,44 @@ def process_pdf_documents(pdf_directory="./data/pdf_documents"):
     if not pdf_files:
         logger.warning(f"No PDF files found in {pdf_directory}")
         return False
-    
+
+    workers = min(workers or PDF_EXTRACTION_WORKERS, len(pdf_files))
+    jobs = [
+        (str(pdf_file), os.path.join(knowledge_base_dir, pdf_file.stem + ".txt"))
+        for pdf_file in pdf_files
+    ]
+
     processed_count = 0
-    
-    for pdf_file in pdf_files:
-        logger.info(f"Processing PDF: {pdf_file.name}")
-        
-        # Extract text from PDF
-        extracted_text = extract_text_from_pdf(str(pdf_file))
-        
-        if extracted_text:
-            # Create output filename (replace .pdf with .txt)
-            output_filename = pdf_file.stem + ".txt"
-            output_path = os.path.join(knowledge_base_dir, output_filename)
-            
-            # Write extracted text to file
-            try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# Security Document: {pdf_file.name}\n\n")
-                    f.write(extracted_text)
-                
-                logger.info(f"Successfully converted {pdf_file.name} to {output_filename}")
-                processed_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error writing text file for {pdf_file.name}: {str(e)}")
-        else:
-            logger.error(f"Failed to extract text from {pdf_file.name}")
-    
+
+    def report(pdf_path, stats):
+        if stats:
+            logger.info(
+                f"Successfully converted {os.path.basename(pdf_path)}: {stats['pages']} pages in "
+                f"{stats['seconds']:.2f}s ({stats['pages_per_second']:.1f} pages/s, "
+                f"{stats['mb_per_second']:.2f} MB/s)"
+            )
+            return 1
+        logger.error(f"Failed to extract text from {os.path.basename(pdf_path)}")
+        return 0
+
+    if workers <= 1:
+        for pdf_path, output_path in jobs:
+            logger.info(f"Processing PDF: {os.path.basename(pdf_path)}")
+            processed_count += report(pdf_path, convert_pdf_to_text(pdf_path, output_path))
+    else:
+        logger.info(f"Processing {len(jobs)} PDFs with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(convert_pdf_to_text, pdf_path, output_path): pdf_path
+                for pdf_path, output_path in jobs
+            }
+            for future in as_completed(futures):
+                pdf_path = futures[future]
+                try:
+                    processed_count += report(pdf_path, future.result())
+                except Exception as e:
+                    logger.error(f"Error processing {os.path.basename(pdf_path)}: {str(e)}")
+
     logger.info(f"Processed {processed_count} PDF documents out of {len(pdf_files)} found")
     return processed_count > 0
 
@@ -163,7 +270,6 @@ def clean_extracted_text(text):
     cleaned_text = '\n'.join(lines)
     
     # Remove multiple consecutive newlines
-    import re
     cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text)
     
     return cleaned_text
@@ -0,0 +1,512 @@
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+DOCUMENTS_FILENAME = "documents.bin"
+OFFSETS_FILENAME = "offsets.npy"
+# Commit record of the files: the number of rows and the size of the chunk table
+CHUNKS_FILENAME = "chunks.json"
+# Chunk IDs and metadata, one JSON line per row
+TABLE_FILENAME = "chunks.jsonl"
+
+# Rows upcast per step when scoring a float16 matrix
+SCORE_BLOCK_ROWS = 1024
+
+
+def matches_where(metadata, where):
+    """Evaluate a Chroma-style ``where`` filter against one metadata dict"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and not value == operand:
+                    return False
+                if op == "$ne" and not value != operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > operand:
+                        return False
+                    if op == "$gte" and not value >= operand:
+                        return False
+                    if op == "$lt" and not value < operand:
+                        return False
+                    if op == "$lte" and not value <= operand:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+# Conditions evaluated on whole metadata columns when the operand is a number or boolean
+COLUMN_OPS = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def _numeric(value):
+    """A metadata value as a float, or NaN if it is missing or not a number"""
+    return float(value) if isinstance(value, (bool, int, float)) else np.nan
+
+
+def _table_lines(ids, metadatas):
+    """Encode chunk table rows as JSON lines"""
+    return b"".join(json.dumps([chunk_id, metadata]).encode('utf-8') + b"\n"
+                    for chunk_id, metadata in zip(ids, metadatas))
+
+
+def _append_bytes(path, end, data):
+    """Write ``data`` at byte ``end`` of a file, dropping anything after it"""
+    with open(path, 'r+b') as f:
+        f.truncate(end)
+        f.seek(end)
+        f.write(data)
+
+
+def _append_rows(path, n_rows, rows):
+    """Append rows to an ``.npy`` file after its first ``n_rows`` and update the shape in its header
+
+    np.save leaves room in the header for the first dimension to grow; if
+    the new header would still not fit, nothing is written and False is
+    returned.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_length = f.tell()
+        if fortran_order:
+            return False
+
+        header = io.BytesIO()
+        new_shape = (n_rows + len(rows),) + tuple(shape[1:])
+        header_data = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": new_shape}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if len(header.getvalue()) != header_length:
+            return False
+
+        end = header_length + n_rows * dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        f.truncate(end)
+        f.seek(end)
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        # The header goes last, so a reader never sees a shape past the end of the file
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+class _Snapshot:
+    """One consistent view of the files; replaced as a whole on reload"""
+
+    __slots__ = ("embeddings", "offsets", "documents", "ids", "metadatas", "rows", "mtime", "table_bytes",
+                 "columns")
+
+    def __init__(self, embeddings, offsets, documents, ids, metadatas, mtime, table_bytes=None):
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.documents = documents
+        self.ids = ids
+        self.metadatas = metadatas
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self.mtime = mtime
+        # Committed size of the chunk table, or None for an index in the older single-file layout
+        self.table_bytes = table_bytes
+        self.columns = {}  # metadata key -> float array, see column()
+
+    def document(self, row):
+        return bytes(self.documents[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def column(self, key):
+        """``key`` of every row's metadata as a float array (NaN where it is not a number), built once"""
+        column = self.columns.get(key)
+        if column is None:
+            column = np.fromiter((_numeric(metadata.get(key)) for metadata in self.metadatas),
+                                 dtype=np.float64, count=len(self.metadatas))
+            self.columns[key] = column
+        return column
+
+    def mask(self, where):
+        """Boolean array of the rows that match a Chroma-style ``where`` filter
+
+        Comparisons with a number or boolean, such as the ``min_rank`` and
+        ``topic_*`` filters of the retriever, run on the cached columns; any
+        other condition falls back to ``matches_where`` row by row.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in (where or {}).items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                matched = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    matched |= self.mask(clause)
+                mask &= matched
+            elif isinstance(condition, dict):
+                for op, operand in condition.items():
+                    mask &= self._compare(key, op, operand)
+            else:
+                mask &= self._compare(key, "$eq", condition)
+        return mask
+
+    def _compare(self, key, op, operand):
+        if op in COLUMN_OPS and isinstance(operand, (bool, int, float)):
+            # NaN compares unequal to everything, like a missing value in matches_where
+            return COLUMN_OPS[op](self.column(key), float(operand))
+        return np.fromiter((matches_where(metadata, {key: {op: operand}}) for metadata in self.metadatas),
+                           dtype=bool, count=len(self.metadatas))
+
+
+class FlatVectorStore:
+    """Exact-search vector store backed by memory-mapped files
+
+    A drop-in for the subset of the Chroma collection API the retriever uses.
+    Embeddings are stored L2-normalized as one float32 (or float16) matrix in
+    an ``.npy`` file that is memory-mapped read-only, so worker processes share
+    its pages. Chunk texts live in one UTF-8 blob addressed by an offset table,
+    and IDs and metadata in a JSON-lines table. A query is a single matrix
+    product followed by ``argpartition``.
+
+    Upserting new chunks appends to the files, so ingestion costs time in
+    proportion to the new chunks rather than the whole index. Other writes
+    rewrite the files atomically. Either way ``chunks.json``, which records
+    how many rows are committed, is replaced last; readers in other
+    processes notice it by its mtime, remap on their next call and ignore
+    anything beyond the committed rows.
+    """
+
+    def __init__(self, directory, name="security_documents", dtype="float32"):
+        self.directory = directory
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.reload()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def reload(self):
+        """(Re)open the files on disk"""
+        # A writer in another process may be replacing the files while they are
+        # read; retry until the commit record and the arrays agree
+        for _ in range(10):
+            mtime = self._files_mtime()
+            snapshot = self._open(mtime)
+            if snapshot is not None and self._files_mtime() == mtime:
+                break
+        else:
+            raise RuntimeError(f"Vector index in {self.directory} kept changing while being opened")
+        # Readers grab the snapshot once, so swapping it is safe without a lock
+        self._snapshot = snapshot
+
+    def _open(self, mtime):
+        """Map the files into a snapshot, or return None if they are mid-update"""
+        try:
+            with open(self._path(CHUNKS_FILENAME), 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            table_bytes = None
+            if "ids" in chunks:
+                # Older layout with the whole chunk table in chunks.json
+                ids, metadatas = chunks["ids"], chunks["metadatas"]
+            else:
+                table_bytes = chunks["table_bytes"]
+                with open(self._path(TABLE_FILENAME), 'rb') as f:
+                    # Lines are JSON arrays without raw newlines, so the table parses as one array
+                    rows = json.loads(b"[" + f.read(table_bytes).rstrip(b"\n").replace(b"\n", b",") + b"]")
+                if len(rows) != chunks["count"]:
+                    return None
+                ids = [chunk_id for chunk_id, _ in rows]
+                metadatas = [metadata for _, metadata in rows]
+            return self._map(ids, metadatas, mtime, table_bytes)
+        except FileNotFoundError:
+            if mtime:
+                return None
+            return _Snapshot(None, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint8), [], [], mtime)
+        except ValueError:
+            # Truncated JSON or array header
+            return None
+
+    def _map(self, ids, metadatas, mtime, table_bytes):
+        """Map the arrays for a known chunk table into a snapshot, or return None if they are too short"""
+        embeddings = np.load(self._path(EMBEDDINGS_FILENAME), mmap_mode='r')
+        offsets = np.load(self._path(OFFSETS_FILENAME), mmap_mode='r')
+        if os.path.getsize(self._path(DOCUMENTS_FILENAME)):
+            documents = np.memmap(self._path(DOCUMENTS_FILENAME), dtype=np.uint8, mode='r')
+        else:
+            documents = np.zeros(0, dtype=np.uint8)
+
+        # Rows past the committed count belong to an append in progress (or one
+        # that was interrupted) and are not part of this snapshot
+        n_rows = len(ids)
+        if len(offsets) < n_rows + 1 or (ids and len(embeddings) < n_rows):
+            return None
+        if ids:
+            embeddings = embeddings[:n_rows]
+        return _Snapshot(embeddings, offsets[:n_rows + 1], documents, ids, metadatas, mtime, table_bytes)
+
+    def _current(self):
+        """Return the current snapshot, remapping first if the files were rewritten"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.reload()
+        return self._snapshot
+
+    def _files_mtime(self):
+        try:
+            return os.stat(self._path(CHUNKS_FILENAME)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def is_stale(self):
+        """True if another process rewrote the files since they were opened"""
+        return self._files_mtime() != self._snapshot.mtime
+
+    def count(self):
+        return len(self._current().ids)
+
+    # Writes
+
+    def _materialize(self):
+        """Return the current contents as plain Python lists / a float32 array; caller holds the lock"""
+        if self.is_stale():
+            self.reload()
+        snapshot = self._snapshot
+        documents = [snapshot.document(row) for row in range(len(snapshot.ids))]
+        if snapshot.embeddings is None or not snapshot.embeddings.size:
+            embeddings = None
+        else:
+            embeddings = np.array(snapshot.embeddings, dtype=np.float32)
+        return list(snapshot.ids), documents, embeddings, [dict(m) for m in snapshot.metadatas]
+
+    def _write(self, ids, documents, embeddings, metadatas):
+        """Atomically replace the files with new contents and remap them"""
+        encoded = [doc.encode('utf-8') for doc in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(doc) for doc in encoded])
+        if embeddings is None:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+
+        def replace(filename, write):
+            tmp_path = self._path(filename + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, self._path(filename))
+
+        table = _table_lines(ids, metadatas)
+
+        replace(EMBEDDINGS_FILENAME, lambda f: np.save(f, embeddings.astype(self.dtype)))
+        replace(OFFSETS_FILENAME, lambda f: np.save(f, offsets))
+        replace(DOCUMENTS_FILENAME, lambda f: f.write(b"".join(encoded)))
+        replace(TABLE_FILENAME, lambda f: f.write(table))
+        self._commit(len(ids), len(table))
+
+    def _commit(self, count, table_bytes):
+        """Atomically replace chunks.json; its mtime marks a complete update for other processes"""
+        tmp_path = self._path(CHUNKS_FILENAME + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"count": count, "table_bytes": table_bytes}, f)
+        os.replace(tmp_path, self._path(CHUNKS_FILENAME))
+
+    def _append(self, ids, documents, vectors, metadatas):
+        """Append new rows to the files in place and remap; caller holds the lock and has a current snapshot
+
+        Anything an interrupted append left past the committed rows is cut off
+        first. Returns False, without writing, if the files can't be appended
+        to and need a full rewrite instead.
+        """
+        snapshot = self._snapshot
+        n_rows = len(snapshot.ids)
+        if not n_rows or snapshot.table_bytes is None or vectors.shape[1:] != snapshot.embeddings.shape[1:]:
+            return False
+
+        encoded = [doc.encode('utf-8') for doc in documents]
+        documents_end = int(snapshot.offsets[n_rows])
+        offsets = documents_end + np.cumsum([len(doc) for doc in encoded], dtype=np.int64)
+
+        if not (_append_rows(self._path(EMBEDDINGS_FILENAME), n_rows, vectors)
+                and _append_rows(self._path(OFFSETS_FILENAME), n_rows + 1, offsets)):
+            return False
+        _append_bytes(self._path(DOCUMENTS_FILENAME), documents_end, b"".join(encoded))
+        table = _table_lines(ids, metadatas)
+        _append_bytes(self._path(TABLE_FILENAME), snapshot.table_bytes, table)
+        self._commit(n_rows + len(ids), snapshot.table_bytes + len(table))
+        # The writer knows the new rows, so it only remaps the arrays instead of re-reading the table
+        self._snapshot = self._map(snapshot.ids + ids, snapshot.metadatas + metadatas,
+                                   self._files_mtime(), snapshot.table_bytes + len(table))
+        return True
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+            # New chunks, the usual case during ingestion, are appended
+            if len(set(ids)) == len(ids) and not any(chunk_id in self._snapshot.rows for chunk_id in ids) \
+                    and self._append(list(ids), documents, vectors, list(metadatas)):
+                return
+
+            all_ids, all_docs, all_vectors, all_metas = self._materialize()
+            rows = {chunk_id: row for row, chunk_id in enumerate(all_ids)}
+            new_vectors = []
+            for chunk_id, doc, vector, metadata in zip(ids, documents, vectors, metadatas):
+                if chunk_id in rows:
+                    row = rows[chunk_id]
+                    all_docs[row] = doc
+                    all_metas[row] = metadata
+                    all_vectors[row] = vector
+                else:
+                    rows[chunk_id] = len(all_ids)
+                    all_ids.append(chunk_id)
+                    all_docs.append(doc)
+                    all_metas.append(metadata)
+                    new_vectors.append(vector)
+            if new_vectors:
+                new_vectors = np.vstack(new_vectors)
+                all_vectors = new_vectors if all_vectors is None or not len(all_vectors) \
+                    else np.vstack([all_vectors, new_vectors])
+            self._write(all_ids, all_docs, all_vectors, all_metas)
+            self.reload()
+
+    add = upsert
+
+    def update(self, ids, metadatas):
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+            snapshot = self._snapshot
+            if snapshot.table_bytes is None:
+                all_ids, all_docs, all_vectors, all_metas = self._materialize()
+                rows = {chunk_id: row for row, chunk_id in enumerate(all_ids)}
+                for chunk_id, metadata in zip(ids, metadatas):
+                    if chunk_id in rows:
+                        all_metas[rows[chunk_id]] = metadata
+                self._write(all_ids, all_docs, all_vectors, all_metas)
+                self.reload()
+                return
+
+            # Only the chunk table changes; the arrays are left alone
+            all_metas = list(snapshot.metadatas)
+            for chunk_id, metadata in zip(ids, metadatas):
+                if chunk_id in snapshot.rows:
+                    all_metas[snapshot.rows[chunk_id]] = metadata
+            table = _table_lines(snapshot.ids, all_metas)
+            tmp_path = self._path(TABLE_FILENAME + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(table)
+            os.replace(tmp_path, self._path(TABLE_FILENAME))
+            self._commit(len(snapshot.ids), len(table))
+            self.reload()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+            snapshot = self._snapshot
+            doomed = {chunk_id for chunk_id in ids or () if chunk_id in snapshot.rows}
+            if where:
+                doomed.update(snapshot.ids[row] for row in np.flatnonzero(snapshot.mask(where)))
+            if not doomed:
+                return
+            all_ids, all_docs, all_vectors, all_metas = self._materialize()
+            keep = [row for row, chunk_id in enumerate(all_ids) if chunk_id not in doomed]
+            self._write(
+                [all_ids[row] for row in keep],
+                [all_docs[row] for row in keep],
+                all_vectors[keep] if all_vectors is not None and keep else None,
+                [all_metas[row] for row in keep]
+            )
+            self.reload()
+
+    # Reads
+
+    @staticmethod
+    def _scores(embeddings, query):
+        """Cosine similarity of every row with a unit query vector"""
+        if embeddings.dtype == np.float32:
+            return embeddings @ query
+        # NumPy has no BLAS kernel for float16; upcast a block of rows at a time
+        scores = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), SCORE_BLOCK_ROWS):
+            block = embeddings[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def get(self, ids=None, where=None, include=None, limit=None):
+        snapshot = self._current()
+        if ids is None:
+            rows = range(len(snapshot.ids))
+        else:
+            rows = [snapshot.rows[chunk_id] for chunk_id in ids if chunk_id in snapshot.rows]
+        if where:
+            mask = snapshot.mask(where)
+            rows = [row for row in rows if mask[row]]
+        if limit is not None:
+            rows = rows[:limit]
+        result = {
+            "ids": [snapshot.ids[row] for row in rows],
+            "documents": [snapshot.document(row) for row in rows],
+            "metadatas": [snapshot.metadatas[row] for row in rows],
+        }
+        if include and "embeddings" in include:
+            result["embeddings"] = [snapshot.embeddings[row].astype(np.float32).tolist() for row in rows]
+        return result
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        snapshot = self._current()
+        empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        if snapshot.embeddings is None or not snapshot.ids:
+            return empty
+
+        query = np.asarray(query_embeddings[0], dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._scores(snapshot.embeddings, query)
+
+        n_results = min(n_results, len(snapshot.ids))
+        if where:
+            mask = snapshot.mask(where)
+            scores = np.where(mask, scores, -np.inf)
+            n_results = min(n_results, int(mask.sum()))
+        if n_results <= 0:
+            return empty
+
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+        top = top[np.argsort(-scores[top])]
+        return {
+            "ids": [[snapshot.ids[row] for row in top]],
+            "documents": [[snapshot.document(row) for row in top]],
+            "metadatas": [[snapshot.metadatas[row] for row in top]],
+            "distances": [[float(1 - scores[row]) for row in top]],
+        }
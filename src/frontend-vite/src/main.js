@@ -113,7 +113,7 @@ document.addEventListener('DOMContentLoaded', function() {
       const loadingMessage = addMessageToChat('bot', 'Thinking...');
       
       try {
-          const response = await fetch(`${API_URL}/chat`, {
+          const response = await fetch(`${API_URL}/chat/stream`, {
               method: 'POST',
               headers: {
                   'Content-Type': 'application/json'
@@ -126,19 +126,8 @@ document.addEventListener('DOMContentLoaded', function() {
               throw new Error('Failed to get response');
           }
           
-          const data = await response.json();
-          
-          // Remove loading message
-          loadingMessage.remove();
-          
-          // Add bot response to chat
-          const botMessage = addMessageToChat('bot', data.answer);
-
-          // After bot response
-        if (data.followup_question) {
-        const quizElement = addMessageToChat('bot', data.followup_question);
-        setupQuizInteraction(quizElement, data.followup_question);
-        }
+          // Render the answer as server-sent events arrive
+          const data = await readChatStream(response, loadingMessage);
           
           if (!data.restricted) {
     // Save old XP and rank
@@ -170,6 +159,78 @@ document.addEventListener('DOMContentLoaded', function() {
       }
   }
   
+  // Read the /chat/stream event stream, updating the bot message as tokens arrive
+  async function readChatStream(response, botMessage) {
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const messageContent = botMessage.querySelector('.message-content');
+      const data = { restricted: false };
+      let buffer = '';
+      let answer = '';
+
+      function handleEvent(event, payload) {
+          if (event === 'token') {
+              answer += payload.text;
+              messageContent.innerHTML = parseMarkdown(answer);
+              chatMessages.scrollTop = chatMessages.scrollHeight;
+          } else if (event === 'restricted') {
+              data.restricted = true;
+              messageContent.innerHTML = parseMarkdown(payload.answer);
+          } else if (event === 'quiz' && payload.quiz) {
+              const quizElement = addMessageToChat('bot', payload.quiz.question);
+              setupQuizInteraction(quizElement, payload.quiz);
+          } else if (event === 'quiz' && payload.status === 'pending') {
+              pollQuiz(payload.quiz_id);
+          } else if (event === 'error') {
+              // The stream failed after it started; keep any partial answer and show why
+              const message = answer ? `${answer}\n\n${payload.error}` : payload.error;
+              messageContent.innerHTML = parseMarkdown(message);
+          } else if (event === 'done') {
+              Object.assign(data, payload);
+          }
+      }
+
+      while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+
+          buffer += decoder.decode(value, { stream: true });
+          const rawEvents = buffer.split('\n\n');
+          buffer = rawEvents.pop();
+
+          for (const rawEvent of rawEvents) {
+              let event = 'message';
+              let payload = '';
+              for (const line of rawEvent.split('\n')) {
+                  if (line.startsWith('event: ')) event = line.slice(7);
+                  else if (line.startsWith('data: ')) payload += line.slice(6);
+              }
+              handleEvent(event, payload ? JSON.parse(payload) : {});
+          }
+      }
+
+      data.answer = answer;
+      return data;
+  }
+  
+  // A generated quiz that was not ready when the stream ended is fetched by quiz_id
+  async function pollQuiz(quizId) {
+      try {
+          while (true) {
+              const response = await fetch(`${API_URL}/quiz/${quizId}?wait=30`, { credentials: 'include' });
+              if (response.status === 202) continue;
+              if (!response.ok) return;
+
+              const data = await response.json();
+              const quizElement = addMessageToChat('bot', data.quiz.question);
+              setupQuizInteraction(quizElement, data.quiz);
+              return;
+          }
+      } catch (error) {
+          console.error('Error fetching quiz:', error);
+      }
+  }
+  
   // Add message to chat
   function addMessageToChat(sender, content) {
       const template = sender === 'user' ? userMessageTemplate : botMessageTemplate;
@@ -248,37 +309,19 @@ document.addEventListener('DOMContentLoaded', function() {
       chatMessages.scrollTop = chatMessages.scrollHeight;
   }
 
- function setupQuizInteraction(quizElement, quizText) {
-  const lines = quizText.split('\n');
-
-  // Extract the answer line and remove it
-  const answerLineIndex = lines.findIndex(line => line.toLowerCase().startsWith("answer:"));
-  const correctAnswer = answerLineIndex !== -1
-    ? lines[answerLineIndex].replace(/answer:/i, "").trim().toLowerCase()
-    : null;
-
-  if (!correctAnswer) return;
-
-  // Remove the answer and options lines from visible content
-  const cleanedLines = lines
-    .filter(line => 
-      !line.toLowerCase().startsWith("answer:") &&
-      !line.toLowerCase().startsWith("options:") &&
-      !/^[a-d]\)/i.test(line.trim())
-    );
-
+// Quizzes come structured and without the answer; it is checked by quiz_id
+function setupQuizInteraction(quizElement, quiz) {
   const messageContent = quizElement.querySelector('.message-content');
-  messageContent.innerHTML = parseMarkdown(cleanedLines.join('\n'));
-
-  // Render the answer buttons
-  const optionLines = lines.filter(line => /^[a-d]\)/i.test(line.trim()));
+  renderQuizOptions(messageContent, quiz.options, quiz.quiz_id);
+}
 
+function renderQuizOptions(messageContent, optionLines, quizId) {
   optionLines.forEach(line => {
     const btn = document.createElement('button');
     btn.className = 'quiz-option';
     btn.textContent = line.trim();
     btn.addEventListener('click', () => {
-      handleQuizAnswer(line.trim().toLowerCase(), correctAnswer, btn);
+      handleQuizAnswer(line.trim().toLowerCase(), btn, quizId);
     });
     messageContent.appendChild(btn);
   });
@@ -296,7 +339,7 @@ messageContent.appendChild(skipBtn);
 }
 
 
-async function handleQuizAnswer(selected, correct, button) {
+async function handleQuizAnswer(selected, button, quizId) {
   try {
     const response = await fetch(`${API_URL}/quiz`, {
       method: 'POST',
@@ -304,10 +347,18 @@ async function handleQuizAnswer(selected, correct, button) {
         'Content-Type': 'application/json'
       },
       credentials: 'include',
-      body: JSON.stringify({ answer: selected, correct_answer: correct })
+      body: JSON.stringify({ quiz_id: quizId, answer: selected })
     });
 
     const data = await response.json();
+    if (!response.ok) {
+      // e.g. a quiz that was already answered
+      console.error("Quiz answer rejected:", data.error);
+      button.parentElement.querySelectorAll('button').forEach(btn => btn.disabled = true);
+      return;
+    }
+    // The answer is revealed only once the quiz is answered
+    const correct = data.correct_answer.trim().toLowerCase();
 
     const allButtons = button.parentElement.querySelectorAll('button');
 